@@ -0,0 +1,23 @@
+from fastapi import Depends
+from starlette.requests import HTTPConnection
+from ..services.chat_service import ChatService
+from ..services.container import ServiceContainer
+from ..services.rag_service import RAGService
+from ..services.vectorstore import VectorStore
+
+
+def get_container(connection: HTTPConnection) -> ServiceContainer:
+    """The container created by the application lifespan (works for HTTP and WebSocket)"""
+    return connection.app.state.container
+
+
+def get_chat_service(container: ServiceContainer = Depends(get_container)) -> ChatService:
+    return container.chat_service
+
+
+def get_rag_service(container: ServiceContainer = Depends(get_container)) -> RAGService:
+    return container.rag_service
+
+
+def get_vector_store(container: ServiceContainer = Depends(get_container)) -> VectorStore:
+    return container.vector_store
@@ -1,6 +1,7 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
-from app.services.chat_service import AdvancedChatService
+from ..deps import get_chat_service
+from ...services.chat_service import ChatService
 
 router = APIRouter()
 
@@ -12,9 +13,8 @@ class ChatResponse(BaseModel):
     response: str
 
 @router.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, chat_service: ChatService = Depends(get_chat_service)):
     try:
-        chat_service = AdvancedChatService()
         response = await chat_service.process_message(request.message, request.language)
         return ChatResponse(response=response)
     except Exception as e:
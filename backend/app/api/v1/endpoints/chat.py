@@ -1,27 +1,121 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+import asyncio
+import json
+import logging
+import secrets
+from typing import Any, Dict, Optional
+from fastapi import APIRouter, Depends, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+from ...deps import get_chat_service
 from ....services.chat_service import ChatService
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/chat", tags=["chat"])
 
 class ChatRequest(BaseModel):
     message: str
     language: str = "he"
     is_qualified: bool = False
+    session_id: Optional[str] = None
 
 class ChatResponse(BaseModel):
     response: str
+    session_id: Optional[str] = None
+
+def _new_session_id() -> str:
+    return secrets.token_urlsafe(16)
 
-chat_service = ChatService()
+def _format_sse(event: Dict[str, Any]) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
 
 @router.post("/", response_model=ChatResponse)
-async def process_chat(request: ChatRequest):
+async def process_chat(request: ChatRequest, chat_service: ChatService = Depends(get_chat_service)):
     try:
+        session_id = request.session_id or _new_session_id()
         response = await chat_service.process_message(
             request.message,
             request.language,
-            request.is_qualified
+            request.is_qualified,
+            session_id
         )
-        return ChatResponse(response=response)
+        return ChatResponse(response=response, session_id=session_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/stream")
+async def stream_chat(request: ChatRequest, http_request: Request, chat_service: ChatService = Depends(get_chat_service)):
+    """Stream the response as Server-Sent Events (token, done and error events)"""
+    session_id = request.session_id or _new_session_id()
+
+    async def event_source():
+        events = chat_service.process_message_stream(
+            request.message,
+            request.language,
+            request.is_qualified,
+            session_id
+        )
+        try:
+            async for event in events:
+                if await http_request.is_disconnected():
+                    break
+                yield _format_sse(event)
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Session-Id": session_id}
+    )
+
+async def _send_stream(websocket: WebSocket, chat_service: ChatService, request: ChatRequest, session_id: str):
+    events = chat_service.process_message_stream(
+        request.message,
+        request.language,
+        request.is_qualified,
+        session_id
+    )
+    try:
+        async for event in events:
+            await websocket.send_json(event)
+    except (WebSocketDisconnect, RuntimeError) as e:
+        # The client went away mid-stream; nothing is left to send to
+        logger.info(f"Chat websocket closed during stream: {str(e)}")
+    finally:
+        await events.aclose()
+
+@router.websocket("/ws")
+async def chat_websocket(websocket: WebSocket, chat_service: ChatService = Depends(get_chat_service)):
+    """Stream responses over a WebSocket.
+
+    Each JSON message is a chat request; a new request or ``{"type": "cancel"}``
+    cancels the stream in progress, as does closing the socket. Requests without
+    a session_id share one session for the lifetime of the connection.
+    """
+    await websocket.accept()
+    connection_session_id = _new_session_id()
+    stream_task = None
+    try:
+        while True:
+            payload = await websocket.receive_json()
+            if not isinstance(payload, dict):
+                await websocket.send_json({"type": "error", "message": "Expected a JSON object"})
+                continue
+            if stream_task is not None and not stream_task.done():
+                stream_task.cancel()
+            if payload.get("type") == "cancel":
+                continue
+            try:
+                request = ChatRequest(**payload)
+            except ValidationError as e:
+                await websocket.send_json({"type": "error", "message": str(e)})
+                continue
+            stream_task = asyncio.create_task(
+                _send_stream(websocket, chat_service, request, request.session_id or connection_session_id)
+            )
+    except WebSocketDisconnect:
+        logger.info("Chat websocket disconnected")
+    finally:
+        if stream_task is not None and not stream_task.done():
+            stream_task.cancel()
@@ -1,26 +1,51 @@
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from app.core.database import get_db
-from app.services.chat_service import ChatService
-from app.services.rag_service import RAGService
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from ...deps import get_container
+from ....db.session import get_db, pool_stats
+from ....core.startup import readiness
+from ....services.container import ServiceContainer
+from ....services.embedding_cache import embedding_cache
+from ....services.payoff_simulator import payoff_simulator
+from ....services.portfolio import portfolio_engine
+from ....services.product_catalog import product_catalog
 
 router = APIRouter()
 
+@router.get("/health/live")
+async def liveness():
+    """Process is up; never touches heavy resources"""
+    return {"status": "alive"}
+
+@router.get("/health/ready")
+async def readiness_check():
+    """Ready once the startup warm-up has loaded the heavy resources"""
+    return JSONResponse(
+        status_code=200 if readiness.ready else 503,
+        content=readiness.as_dict()
+    )
+
 @router.get("/health")
-async def health_check(db: Session = Depends(get_db)):
+async def health_check(db: AsyncSession = Depends(get_db), container: ServiceContainer = Depends(get_container)):
     try:
         # Check database connection
-        db.execute("SELECT 1")
+        await db.execute(text("SELECT 1"))
         
-        # Check services initialization
-        chat_service = ChatService()
-        rag_service = RAGService()
+        # Check the shared services (built once per worker, never per probe)
+        chat_service = container.chat_service
+        rag_service = container.rag_service
         
         return {
-            "status": "healthy",
+            "status": "healthy" if chat_service.initialized and rag_service.initialized else "degraded",
             "database": "connected",
-            "chat_service": "initialized",
-            "rag_service": "initialized"
+            "database_pool": pool_stats(),
+            "chat_service": "initialized" if chat_service.initialized else "unavailable",
+            "rag_service": "initialized" if rag_service.initialized else "unavailable",
+            "embedding_cache": embedding_cache.stats(),
+            "product_catalog": product_catalog.stats(),
+            "portfolio": portfolio_engine.stats(),
+            "payoff_simulator": payoff_simulator.stats()
         }
     except Exception as e:
         return {
@@ -0,0 +1,60 @@
+from typing import Any, Dict, List, Literal, Optional, Union
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, Field
+from ....services.product_catalog import product_catalog
+from ....services.product_search import get_product_columns
+
+router = APIRouter(prefix="/products", tags=["products"])
+
+class ProductSearchRequest(BaseModel):
+    risk_profile: Optional[str] = None  # only products suitable for this client profile
+    risk_levels: Optional[List[str]] = None
+    currencies: Optional[List[str]] = None
+    term_min: Optional[int] = None  # months
+    term_max: Optional[int] = None
+    min_investment_max: Optional[float] = None
+    expected_return_min: Optional[float] = None
+    # Flattened product_rules fields, e.g. {"capital_protection": true} or {"barrier.level": 70}
+    rules: Dict[str, Union[bool, float, str]] = Field(default_factory=dict)
+    rules_min: Dict[str, float] = Field(default_factory=dict)
+    rules_max: Dict[str, float] = Field(default_factory=dict)
+    sort_by: Literal["expected_return", "term_length", "min_investment"] = "expected_return"
+    descending: bool = True
+    limit: int = Field(20, ge=1, le=100)
+    cursor: Optional[str] = None
+
+class ProductResult(BaseModel):
+    id: int
+    name: Optional[str] = None
+    risk_level: Optional[str] = None
+    currency: Optional[str] = None
+    term_length: Optional[int] = None
+    min_investment: Optional[float] = None
+    expected_return: Optional[float] = None
+    product_rules: Optional[Dict[str, Any]] = None
+
+class ProductSearchResponse(BaseModel):
+    products: List[ProductResult]
+    next_cursor: Optional[str] = None
+    catalog_version: int
+
+@router.post("/search", response_model=ProductSearchResponse)
+async def search_products(request: ProductSearchRequest):
+    """Filter and rank the active products; follow next_cursor for more pages"""
+    snapshot = await product_catalog.get()
+    columns = get_product_columns(snapshot)
+    try:
+        page = columns.search(**request.model_dump())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return ProductSearchResponse(
+        products=[
+            ProductResult(
+                id=p.id, name=p.name, risk_level=p.risk_level, currency=p.currency, term_length=p.term_length,
+                min_investment=p.min_investment, expected_return=p.expected_return, product_rules=p.product_rules
+            )
+            for p in page.products
+        ],
+        next_cursor=page.next_cursor,
+        catalog_version=page.version
+    )
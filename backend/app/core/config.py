@@ -2,7 +2,7 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 from pathlib import Path
 import os
 from urllib.parse import quote_plus
-from typing import Union
+from typing import Optional, Union
 from functools import lru_cache
 
 class Settings(BaseSettings):
@@ -11,6 +11,55 @@ class Settings(BaseSettings):
     OPENAI_MODEL: str = "gpt-4-turbo-preview"
     OPENAI_TEMPERATURE: float = 0.7
 
+    # LLM client settings (one pooled HTTP client per backend)
+    LLM_BACKEND: str = os.getenv("LLM_BACKEND", "openai")  # openai or ollama
+    OLLAMA_HOST: str = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+    OLLAMA_MODEL: str = os.getenv("OLLAMA_MODEL", "llama3")
+    LLM_HTTP2: bool = True
+    LLM_MAX_CONNECTIONS: int = 100
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    LLM_KEEPALIVE_EXPIRY: float = 30.0  # seconds
+    LLM_CONNECT_TIMEOUT: float = 5.0  # seconds
+    LLM_READ_TIMEOUT: float = 60.0  # seconds, default per-call timeout
+    LLM_MAX_RETRIES: int = 2
+
+    # Load heavy resources (encoder, tokenizer, clients) in the background at startup
+    WARM_UP_ON_STARTUP: bool = True
+
+    # Per-session conversation memory
+    SESSION_MAX_MESSAGES: int = 20  # ring buffer size per session
+    SESSION_TTL_SECONDS: int = 1800  # idle sessions are evicted after this
+    SESSION_MAX_COUNT: int = 10000
+    SESSION_MEMORY_MAX_BYTES: int = 64 * 1024 * 1024  # global cap for all sessions
+
+    # Knowledge base and embeddings
+    KNOWLEDGE_BASE_PATH: Path = Path(os.getenv("KNOWLEDGE_BASE_PATH", "data/knowledge_base"))
+    MODEL_PATH: str = os.getenv("MODEL_PATH", "paraphrase-multilingual-MiniLM-L12-v2")
+    VECTOR_BACKEND: str = "chroma"  # "chroma" or "numpy" (memory-mapped index in KNOWLEDGE_BASE_PATH)
+
+    # Long-term conversation memory and client profiles
+    MEMORY_STORE_PATH: Path = Path(os.getenv("MEMORY_STORE_PATH", "data/memory"))
+
+    # In-memory product catalog; writes in this process invalidate it immediately
+    PRODUCT_CATALOG_TTL_SECONDS: int = 300  # picks up changes made by other workers
+    PORTFOLIO_TTL_SECONDS: int = 300  # full reload of the portfolio engine's investment columns
+
+    # Monte Carlo scenario payoffs shown in product explanations
+    SIMULATION_PATHS: int = 10000
+    SIMULATION_SEED: int = 20240101  # fixed, so the same product always gets the same figures
+    SIMULATION_CACHE_MAX_ENTRIES: int = 2000
+
+    # Semantic response cache
+    SEMANTIC_CACHE_ENABLED: bool = True
+    SEMANTIC_CACHE_THRESHOLD: float = 0.92  # minimum cosine similarity for a hit
+    SEMANTIC_CACHE_TTL_SECONDS: int = 24 * 3600
+    SEMANTIC_CACHE_MAX_ENTRIES: int = 1000  # per language / investor partition
+
+    # Query embedding cache; persisted across restarts when a path is set
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 5000
+    EMBEDDING_CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+    EMBEDDING_CACHE_PATH: Optional[Path] = None  # e.g. data/embedding_cache.npz
+
     model_config = SettingsConfigDict(
         env_file=".env",
         env_file_encoding='utf-8',
@@ -35,6 +84,12 @@ class Settings(BaseSettings):
     POSTGRES_DB: str = os.getenv("POSTGRES_DB", "movne")
     POSTGRES_SERVER: str = os.getenv("POSTGRES_SERVER", "localhost")
     DATABASE_URL: Union[str, None] = None
+    DB_POOL_SIZE: int = 10  # connections kept open per worker
+    DB_MAX_OVERFLOW: int = 20  # extra connections allowed under burst load
+    DB_POOL_TIMEOUT: int = 30  # seconds to wait for a free connection
+    DB_POOL_RECYCLE: int = 1800  # reconnect before the server drops idle connections
+    DB_POOL_PRE_PING: bool = True
+    DB_ECHO: bool = False
     
     # Security
     SECRET_KEY: str = os.getenv("SECRET_KEY", "development_key")
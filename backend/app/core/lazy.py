@@ -0,0 +1,62 @@
+from typing import Callable, Dict, Generic, List, Optional, Tuple, TypeVar
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Callables run by the startup warm-up, in registration order
+_warm_up_registry: Dict[str, Callable[[], object]] = {}
+_registry_lock = threading.Lock()
+
+
+def register_warm_up(name: str, fn: Callable[[], object]):
+    """Have the application warm-up call fn before reporting ready"""
+    with _registry_lock:
+        _warm_up_registry[name] = fn
+
+
+def warm_up_tasks() -> List[Tuple[str, Callable[[], object]]]:
+    with _registry_lock:
+        return list(_warm_up_registry.items())
+
+
+class LazyResource(Generic[T]):
+    """A heavy object built on first use, exactly once, from any thread.
+
+    Resources register themselves for the startup warm-up unless warm_up=False,
+    so requests served after readiness never pay the load cost.
+    """
+
+    def __init__(self, name: str, loader: Callable[[], T], warm_up: bool = True):
+        self.name = name
+        self._loader = loader
+        self._value: Optional[T] = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.load_seconds: Optional[float] = None
+        if warm_up:
+            register_warm_up(name, self.get)
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def get(self) -> T:
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    started = time.perf_counter()
+                    self._value = self._loader()
+                    self.load_seconds = round(time.perf_counter() - started, 3)
+                    self._loaded = True
+                    logger.info(f"Loaded {self.name} in {self.load_seconds}s")
+        return self._value
+
+    def reset(self):
+        """Forget the loaded value; the next get() loads it again"""
+        with self._lock:
+            self._value = None
+            self._loaded = False
@@ -1,6 +1,6 @@
 from pydantic_settings import BaseSettings
 from pathlib import Path
-from typing import List
+from typing import Dict, List
 
 class RAGSettings(BaseSettings):
     # Document processing
@@ -13,11 +13,40 @@ class RAGSettings(BaseSettings):
         "term_sheet"
     ]
     
+    # Ingestion
+    SUPPORTED_FILE_EXTENSIONS: List[str] = [".txt", ".md", ".json"]
+    READ_BLOCK_CHARS: int = 64 * 1024  # Files are read in blocks of this size
+    CHUNK_TOKENS: int = 256  # Target chunk size
+    CHUNK_OVERLAP_TOKENS: int = 32  # Tokens repeated from the end of the previous chunk
+    EMBED_BATCH_SIZE: int = 64  # Texts per encoder forward pass
+    WRITE_BATCH_SIZE: int = 512  # Chunks encoded and written to the vector store at a time
+    EMBED_PROCESSES: int = 0  # Encoder worker processes, 0 encodes in-process
+    DB_BATCH_SIZE: int = 200  # Document rows inserted per transaction in bulk ingestion
+    INGEST_PARSE_WORKERS: int = 4  # Processes parsing files in bulk ingestion, 0 parses on a thread
+    INGEST_QUEUE_SIZE: int = 64  # Items waiting between two ingestion stages
+    INGEST_PART_CHUNKS: int = 256  # Chunks a parse worker returns at a time; larger files come in parts
+    
     # Retrieval settings
-    MAX_RELEVANT_CHUNKS: int = 5
+    MAX_RELEVANT_CHUNKS: int = 4
+    VECTOR_INDEX_DTYPE: str = "float32"  # numpy vector backend storage; float16 halves memory but scores slower
+    HYBRID_SEARCH_ENABLED: bool = True  # Fuse BM25 and dense results by reciprocal rank
+    HYBRID_CANDIDATES: int = 20  # Results taken from each retriever before fusion
+    RRF_K: int = 60
+    BM25_K1: float = 1.2
+    BM25_B: float = 0.75
+    
+    # Context gathering: seconds each lookup may take before its empty fallback is used
+    CONTEXT_TIMEOUTS: Dict[str, float] = {
+        "client": 1.0,
+        "products": 2.0,
+        "compliance": 2.0,
+        "conversation": 1.0,
+        "portfolio": 1.0
+    }
     
     # Context management
     MAX_CONTEXT_WINDOW: int = 4096  # Maximum tokens for context window
+    RESPONSE_TOKEN_RESERVE: int = 1024  # Tokens of the window kept free for the answer
     CONVERSATION_MEMORY_K: int = 5  # Number of recent messages to keep in memory
     
     # Regulatory compliance
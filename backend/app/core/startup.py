@@ -0,0 +1,82 @@
+from typing import Dict, List, Optional
+import asyncio
+import importlib
+import logging
+import time
+from .lazy import warm_up_tasks
+
+logger = logging.getLogger(__name__)
+
+# Third-party imports that dominate cold start, timed during warm-up
+HEAVY_IMPORTS: List[str] = ["openai", "numpy", "tiktoken", "chromadb", "sentence_transformers"]
+
+# Modules whose lazy resources should be warmed, relative to the app package
+WARM_UP_MODULES: List[str] = [".services.vectorstore", ".services.llm_client"]
+
+_APP_PACKAGE = __name__.rsplit(".", 2)[0]
+
+
+class Readiness:
+    """Startup state reported by the readiness probe"""
+
+    def __init__(self):
+        self.ready = False
+        self.started_at = time.perf_counter()
+        self.warm_up_seconds: Optional[float] = None
+        self.import_seconds: Dict[str, float] = {}
+        self.resource_seconds: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+
+    def as_dict(self) -> Dict:
+        return {
+            "ready": self.ready,
+            "warm_up_seconds": self.warm_up_seconds,
+            "import_seconds": self.import_seconds,
+            "resource_seconds": self.resource_seconds,
+            "errors": self.errors,
+        }
+
+
+readiness = Readiness()
+
+
+def profile_imports(modules: List[str]) -> Dict[str, float]:
+    """Import modules one by one and record how long each took.
+
+    A module that is already imported reports ~0s, meaning it was paid for
+    before the server started accepting requests.
+    """
+    timings = {}
+    for module in modules:
+        started = time.perf_counter()
+        try:
+            importlib.import_module(module, package=_APP_PACKAGE)
+        except ImportError as e:
+            logger.warning(f"Could not import {module}: {str(e)}")
+            continue
+        timings[module] = round(time.perf_counter() - started, 3)
+    return timings
+
+
+async def warm_up():
+    """Load every registered heavy resource off the event loop, then mark ready.
+
+    Failures are recorded rather than raised: the resource will be retried
+    lazily by the first request that needs it.
+    """
+    started = time.perf_counter()
+    readiness.import_seconds = await asyncio.to_thread(profile_imports, HEAVY_IMPORTS + WARM_UP_MODULES)
+    logger.info(f"Import profile: {readiness.import_seconds}")
+
+    for name, load in warm_up_tasks():
+        resource_started = time.perf_counter()
+        try:
+            await asyncio.to_thread(load)
+            readiness.resource_seconds[name] = round(time.perf_counter() - resource_started, 3)
+        except Exception as e:
+            readiness.errors[name] = str(e)
+            logger.error(f"Warm-up of {name} failed: {str(e)}")
+
+    readiness.warm_up_seconds = round(time.perf_counter() - started, 3)
+    readiness.ready = True
+    logger.info(f"Warm-up finished in {readiness.warm_up_seconds}s, resources: {readiness.resource_seconds}")
@@ -1,6 +1,6 @@
-from sqlalchemy.orm import Session
-from ..db.session import engine
+from ..db.session import get_engine
 from ..models.base import Base
 
-def init_db() -> None:
-    Base.metadata.create_all(bind=engine)
+async def init_db() -> None:
+    async with get_engine().begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
@@ -1,36 +1,102 @@
-from typing import Generator
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, Session
-from sqlalchemy.exc import SQLAlchemyError
+from typing import AsyncGenerator, Dict, Optional
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 import logging
 from ..core.config import settings
+from ..core.lazy import LazyResource
 
 logger = logging.getLogger(__name__)
 
-# Use the DATABASE_URL from settings which already handles Railway's environment
-SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
+# Sync driver names in DATABASE_URL mapped to their async counterparts
+_ASYNC_DRIVERS = {
+    "postgres": "postgresql+asyncpg",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
 
-try:
-    engine = create_engine(SQLALCHEMY_DATABASE_URL)
-    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-    logger.info("Database connection established successfully")
-except SQLAlchemyError as e:
-    logger.error(f"Database connection error: {str(e)}")
-    raise
 
-def get_db() -> Generator[Session, None, None]:
-    db = SessionLocal()
-    try:
+def async_database_url(url: str) -> str:
+    """DATABASE_URL with an async driver (Railway hands out postgres:// URLs)"""
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    parsed = make_url(url)
+    driver = _ASYNC_DRIVERS.get(parsed.drivername, parsed.drivername)
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+
+def build_engine(url: Optional[str] = None) -> AsyncEngine:
+    """One async engine per process; pool limits come from settings"""
+    url = async_database_url(url or settings.DATABASE_URL)
+    options = {"echo": settings.DB_ECHO, "pool_pre_ping": settings.DB_POOL_PRE_PING}
+    if not url.startswith("sqlite"):
+        # SQLite uses a single-connection pool; the sizing options do not apply
+        options.update(
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+        )
+    engine = create_async_engine(url, **options)
+    logger.info(f"Database engine created for {make_url(url).render_as_string(hide_password=True)}")
+    return engine
+
+
+# Created on first use, so importing the app never needs the database driver
+engine = LazyResource("db_engine", build_engine, warm_up=False)
+_sessionmaker = LazyResource(
+    "db_sessionmaker",
+    lambda: async_sessionmaker(engine.get(), expire_on_commit=False, autoflush=False),
+    warm_up=False,
+)
+
+
+def get_engine() -> AsyncEngine:
+    return engine.get()
+
+
+def SessionLocal() -> AsyncSession:
+    """A new session bound to the shared engine"""
+    return _sessionmaker.get()()
+
+
+async def get_db() -> AsyncGenerator[AsyncSession, None]:
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+
+def pool_stats(db_engine: Optional[AsyncEngine] = None) -> Dict[str, float]:
+    """Connection pool utilization, for the health endpoint and metrics"""
+    if db_engine is None:
+        if not engine.loaded:
+            return {}
+        db_engine = engine.get()
+    pool = db_engine.pool
+    stats = {"pool": type(pool).__name__}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        method = getattr(pool, name, None)
+        if method is not None:
+            stats[name] = method()
+    if "size" in stats:
+        capacity = stats["size"] + max(getattr(pool, "_max_overflow", 0), 0)
+        stats["utilization"] = round(stats["checkedout"] / capacity, 3) if capacity else 0.0
+    return stats
+
+
+async def dispose_engine():
+    """Close pooled connections on shutdown"""
+    if engine.loaded:
+        await engine.get().dispose()
+        _sessionmaker.reset()
+        engine.reset()
+
 
 # Test database connection
-def test_connection():
+async def test_connection() -> bool:
     try:
-        db = SessionLocal()
-        db.execute("SELECT 1")
-        db.close()
+        async with SessionLocal() as db:
+            await db.execute(text("SELECT 1"))
         logger.info("Database connection test successful")
         return True
     except Exception as e:
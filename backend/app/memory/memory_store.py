@@ -1,32 +1,161 @@
-from typing import Dict, List, Optional
-import chromadb
-from chromadb.config import Settings
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 import json
 import logging
+import threading
+import time
 from pathlib import Path
+from ..services.vectorstore import get_chroma_collection, get_encoder
+from .write_behind import WriteBehindQueue
 
 logger = logging.getLogger(__name__)
 
+RECENT_HISTORY_SIZE = 20  # conversations cached per client
+MAX_CACHED_CLIENTS = 1000
+# Sequence range (seconds of history) read by the first query of a page; each
+# further query reads the next older range, twice as long
+HISTORY_WINDOW_SECONDS = 7 * 24 * 3600
+
+# Conversations are written behind the request, in batches
+WRITE_BATCH_SIZE = 64
+FLUSH_INTERVAL_SECONDS = 1.0
+MAX_PENDING_WRITES = 10000
+
+
+class _RecentHistory:
+    """Newest-first conversations of one client; complete if nothing older exists"""
+
+    __slots__ = ("items", "complete")
+
+    def __init__(self, items: List[Dict], complete: bool):
+        self.items = items
+        self.complete = complete
+
 
 class MemoryStore:
-    def __init__(self, persist_directory: Path):
-        self.client = chromadb.Client(
-            Settings(
-                persist_directory=str(persist_directory),
-                chroma_db_impl="duckdb+parquet",
-            )
-        )
+    """Conversation history and client profiles.
+
+    History is read by metadata only (no embedding or similarity search) and
+    ordered by a monotonic sequence number stored with every conversation.
+
+    With write_behind, add_conversation only queues the record; a background
+    thread journals and stores queued conversations in batches, and reads merge
+    in the ones not yet stored. When the queue is full the record is written
+    directly. Call close() on shutdown to flush the queue.
+    """
 
+    def __init__(
+        self,
+        persist_directory: Path,
+        recent_history_size: int = RECENT_HISTORY_SIZE,
+        max_cached_clients: int = MAX_CACHED_CLIENTS,
+        write_behind: bool = True,
+        write_batch_size: int = WRITE_BATCH_SIZE,
+        flush_interval: float = FLUSH_INTERVAL_SECONDS,
+        max_pending_writes: int = MAX_PENDING_WRITES,
+        history_window_seconds: float = HISTORY_WINDOW_SECONDS,
+        encoder=None,
+    ):
         # יצירת קולקציות לסוגי מידע שונים
-        self.conversation_collection = self.client.get_or_create_collection(
-            name="conversations", metadata={"description": "User conversation history"}
+        # Shared client, no embedding function: vectors come from the shared encoder
+        self.conversation_collection = get_chroma_collection(
+            "conversations", persist_directory, metadata={"description": "User conversation history"}
         )
 
-        self.profile_collection = self.client.get_or_create_collection(
-            name="profiles", metadata={"description": "User profiles and preferences"}
+        self.profile_collection = get_chroma_collection(
+            "profiles", persist_directory, metadata={"description": "User profiles and preferences"}
         )
 
+        self._encoder = encoder
+        self._embedded = 0
+        self._embed_seconds = 0.0
+
+        self.recent_history_size = recent_history_size
+        self.max_cached_clients = max_cached_clients
+        self.history_window_ns = int(history_window_seconds * 1e9)
+        self._recent: "OrderedDict[str, _RecentHistory]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_seq = 0
+
+        self._writer: Optional[WriteBehindQueue] = None
+        if write_behind:
+            self._writer = WriteBehindQueue(
+                self._write_conversations,
+                Path(persist_directory) / "pending_conversations.jsonl",
+                batch_size=write_batch_size,
+                flush_interval=flush_interval,
+                max_pending=max_pending_writes,
+                name="conversation-writer",
+            )
+            self._writer.start()
+
+    @property
+    def encoder(self):
+        return self._encoder if self._encoder is not None else get_encoder()
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        started = time.perf_counter()
+        embeddings = self.encoder.encode(texts, batch_size=len(texts)).tolist()
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._embedded += len(texts)
+            self._embed_seconds += elapsed
+        logger.debug(f"Embedded {len(texts)} conversations in {elapsed * 1000:.1f} ms")
+        return embeddings
+
+    @staticmethod
+    def _record_text(record: Dict) -> str:
+        # Journals written before records carried their text hold only the document
+        if "text" in record:
+            return record["text"]
+        return json.loads(record["document"]).get("message", "")
+
+    def _write_conversations(self, records: List[Dict]):
+        # Upsert, so records replayed from the journal are not duplicated
+        self.conversation_collection.upsert(
+            embeddings=self._embed([self._record_text(record) for record in records]),
+            documents=[record["document"] for record in records],
+            metadatas=[record["metadata"] for record in records],
+            ids=[record["id"] for record in records],
+        )
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until queued conversations are stored"""
+        return self._writer.flush(timeout) if self._writer is not None else True
+
+    def close(self, timeout: float = 10.0):
+        """Store queued conversations and stop the background writer"""
+        if self._writer is not None:
+            self._writer.close(timeout)
+
+    def write_stats(self) -> Dict[str, float]:
+        """Write-behind queue counters and the time spent embedding conversations"""
+        stats = self._writer.stats() if self._writer is not None else {}
+        with self._lock:
+            stats["embedded"] = self._embedded
+            stats["embed_seconds"] = round(self._embed_seconds, 3)
+        return stats
+
+    def _next_seq(self) -> int:
+        """Nanosecond clock, forced strictly increasing within the process"""
+        with self._lock:
+            self._last_seq = max(time.time_ns(), self._last_seq + 1)
+            return self._last_seq
+
+    @staticmethod
+    def _where(
+        client_id: str, language: Optional[str] = None, before: Optional[int] = None, since: Optional[int] = None
+    ) -> Dict:
+        conditions = [{"client_id": client_id}]
+        if language:
+            conditions.append({"language": language})
+        if before is not None:
+            conditions.append({"seq": {"$lt": before}})
+        if since is not None:
+            conditions.append({"seq": {"$gte": since}})
+        return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
     def add_conversation(
         self,
         client_id: str,
@@ -46,11 +175,16 @@ class MemoryStore:
             if metadata:
                 conversation_data.update(metadata)
 
-            self.conversation_collection.add(
-                documents=[json.dumps(conversation_data)],
-                metadatas=[{"client_id": client_id, "language": language}],
-                ids=[f"conv_{client_id}_{datetime.utcnow().timestamp()}"],
-            )
+            seq = self._next_seq()
+            record = {
+                "id": f"conv_{client_id}_{seq:020d}",
+                "text": message,
+                "document": json.dumps(conversation_data),
+                "metadata": {"client_id": client_id, "language": language, "seq": seq},
+            }
+            if self._writer is None or not self._writer.put(record):
+                self._write_conversations([record])
+            self._remember(client_id, conversation_data)
             logger.info(f"Added conversation for client {client_id}")
         except Exception as e:
             logger.error(f"Error adding conversation: {str(e)}")
@@ -59,30 +193,109 @@ class MemoryStore:
     def get_client_history(
         self, client_id: str, limit: int = 10, language: Optional[str] = None
     ) -> List[Dict]:
-        """שליפת היסטוריית שיחות של לקוח"""
+        """שליפת היסטוריית שיחות של לקוח, מהחדשה לישנה"""
+        cached = self._cached_history(client_id, limit, language)
+        if cached is not None:
+            return cached
         try:
-            query = {"client_id": client_id}
-            if language:
-                query["language"] = language
+            if language is not None:
+                return self.get_client_history_page(client_id, limit=limit, language=language)[0]
+            # Fetch enough to fill the cache, so the next turns are served from memory
+            fetch = max(limit, self.recent_history_size)
+            conversations, next_cursor = self.get_client_history_page(client_id, limit=fetch)
+            self._cache_history(client_id, conversations, complete=next_cursor is None)
+            return conversations[:limit]
+        except Exception as e:
+            logger.error(f"Error fetching client history: {str(e)}")
+            return []
 
-            results = self.conversation_collection.query(
-                query_texts=[""], where=query, limit=limit
+    def get_client_history_page(
+        self,
+        client_id: str,
+        limit: int = 10,
+        language: Optional[str] = None,
+        cursor: Optional[str] = None,
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """A page of conversations, newest first, and the cursor for the next (older) page.
+
+        Rows are selected by metadata only; the cursor is the sequence number of
+        the oldest conversation returned, or None when there are no more. The
+        store cannot sort, so rows are read in sequence windows going back from
+        the cursor, each twice as long as the last, until the page is filled or
+        a one-row probe finds nothing older.
+        """
+        before = int(cursor) if cursor else None
+        needed = limit + 1  # one extra row tells whether another page exists
+        rows: Dict[str, Tuple[Dict, str]] = {}
+        high = before
+        window = self.history_window_ns
+        low = (before if before is not None else time.time_ns()) - window
+        while True:
+            results = self.conversation_collection.get(
+                where=self._where(client_id, language, before=high, since=low),
+                include=["documents", "metadatas"],
             )
+            rows.update(zip(results["ids"], zip(results["metadatas"], results["documents"])))
+            if len(rows) >= needed:
+                break
+            older = self.conversation_collection.get(where=self._where(client_id, language, before=low), limit=1, include=[])
+            if not older["ids"]:
+                break
+            window *= 2
+            high, low = low, low - window
+        if self._writer is not None:
+            # Conversations still queued for writing
+            for record in self._writer.pending():
+                metadata = record["metadata"]
+                if (
+                    metadata["client_id"] == client_id
+                    and (language is None or metadata["language"] == language)
+                    and (before is None or metadata["seq"] < before)
+                ):
+                    rows[record["id"]] = (metadata, record["document"])
+        rows = sorted(rows.values(), key=lambda row: row[0].get("seq", 0), reverse=True)
+        page = rows[:limit]
+        conversations = [json.loads(document) for _, document in page]
+        next_cursor = str(page[-1][0].get("seq", 0)) if len(rows) > limit else None
+        return conversations, next_cursor
 
-            conversations = []
-            for doc in results["documents"][0]:
-                conversations.append(json.loads(doc))
+    def _cached_history(self, client_id: str, limit: int, language: Optional[str]) -> Optional[List[Dict]]:
+        with self._lock:
+            recent = self._recent.get(client_id)
+            if recent is None:
+                return None
+            self._recent.move_to_end(client_id)
+            items = recent.items if language is None else [c for c in recent.items if c.get("language") == language]
+            if len(items) >= limit or recent.complete:
+                return items[:limit]
+            return None
 
-            return sorted(conversations, key=lambda x: x["timestamp"], reverse=True)
-        except Exception as e:
-            logger.error(f"Error fetching client history: {str(e)}")
-            return []
+    def _cache_history(self, client_id: str, conversations: List[Dict], complete: bool):
+        with self._lock:
+            self._recent[client_id] = _RecentHistory(conversations[:self.recent_history_size], complete)
+            self._recent.move_to_end(client_id)
+            while len(self._recent) > self.max_cached_clients:
+                self._recent.popitem(last=False)
+
+    def _remember(self, client_id: str, conversation: Dict):
+        # Write-through: only clients whose history is already cached are updated
+        with self._lock:
+            recent = self._recent.get(client_id)
+            if recent is None:
+                return
+            recent.items.insert(0, conversation)
+            if len(recent.items) > self.recent_history_size:
+                del recent.items[self.recent_history_size:]
+                recent.complete = False
 
     def update_client_profile(self, client_id: str, profile_data: Dict):
         """עדכון פרופיל לקוח"""
         try:
+            document = json.dumps(profile_data)
+            # Looked up by id; the vector is the profile embedded by the shared encoder
             self.profile_collection.upsert(
-                documents=[json.dumps(profile_data)],
+                embeddings=self.encoder.encode([document], batch_size=1).tolist(),
+                documents=[document],
                 metadatas=[{"client_id": client_id}],
                 ids=[f"profile_{client_id}"],
             )
@@ -94,12 +307,12 @@ class MemoryStore:
     def get_client_profile(self, client_id: str) -> Optional[Dict]:
         """שליפת פרופיל לקוח"""
         try:
-            results = self.profile_collection.query(
-                query_texts=[""], where={"client_id": client_id}, limit=1
+            results = self.profile_collection.get(
+                ids=[f"profile_{client_id}"], include=["documents"]
             )
 
-            if results["documents"][0]:
-                return json.loads(results["documents"][0][0])
+            if results["documents"]:
+                return json.loads(results["documents"][0])
             return None
         except Exception as e:
             logger.error(f"Error fetching client profile: {str(e)}")
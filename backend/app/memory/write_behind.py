@@ -0,0 +1,205 @@
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+Record = Dict  # {"id": ..., "document": ..., "metadata": ...}
+
+
+class WriteBehindQueue:
+    """Collects records and writes them in batches on a background thread.
+
+    put never blocks: it only queues the record. The writer thread appends each
+    batch to a journal before writing it, and truncates the journal once every
+    pending record has been written, so a batch whose write fails or is cut
+    short by a crash is replayed by the next start. write_batch must be
+    idempotent (an upsert by id), since replayed records may already be stored.
+
+    At most max_pending records wait to be written; put returns False when the
+    limit is reached, and the caller writes the record itself. The journal
+    survives a process crash; fsync=True also makes it survive a machine crash,
+    at the cost of a disk sync per batch.
+    """
+
+    def __init__(
+        self,
+        write_batch: Callable[[List[Record]], None],
+        journal_path: Path,
+        batch_size: int = 64,
+        flush_interval: float = 1.0,
+        max_pending: int = 10000,
+        fsync: bool = False,
+        name: str = "write-behind",
+    ):
+        self._write_batch = write_batch
+        self.journal_path = Path(journal_path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.fsync = fsync
+        self.name = name
+        # Bounded by max_pending through _pending, which holds every queued record
+        self._queue: "queue.Queue[Record]" = queue.Queue()
+        self._pending: Dict[str, Record] = {}
+        self._lock = threading.Lock()
+        self._drained = threading.Condition(self._lock)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._written = 0
+        self._batches = 0
+        self._failures = 0
+        self._rejected = 0
+
+    def start(self):
+        """Replay the journal of a previous run, then start the writer thread"""
+        self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+        replayed = self._replay()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        if replayed:
+            logger.info(f"{self.name}: replaying {replayed} records from {self.journal_path}")
+
+    def put(self, record: Record) -> bool:
+        """Queue a record for writing without waiting for storage; False when the queue is full"""
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                # Backpressure: the caller writes the record itself
+                self._rejected += 1
+                logger.warning(f"{self.name}: {self.max_pending} records pending, record {record['id']} not queued")
+                return False
+            self._pending[record["id"]] = record
+            self._queue.put_nowait(record)
+        return True
+
+    def pending(self) -> List[Record]:
+        """Accepted records not yet written, so reads can see their own writes"""
+        with self._lock:
+            return list(self._pending.values())
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until everything queued so far has been written"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._drained:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._drained.wait(remaining)
+        return True
+
+    def close(self, timeout: float = 10.0):
+        """Write what is queued and stop the writer thread"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning(f"{self.name}: writer did not finish in {timeout}s; pending records stay in the journal")
+        self._thread = None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "queued": self._queue.qsize(),
+                "pending": len(self._pending),
+                "written": self._written,
+                "batches": self._batches,
+                "failures": self._failures,
+                "rejected": self._rejected,
+            }
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if not batch:
+                continue
+            try:
+                self._journal(batch)
+            except OSError as e:
+                logger.error(f"{self.name}: could not journal batch of {len(batch)}: {str(e)}")
+            self._write(batch)
+
+    def _next_batch(self) -> List[Record]:
+        """Wait for the first record, then gather more until the batch is full or the interval ends"""
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if self._stop.is_set():
+                remaining = 0
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: List[Record]):
+        written = False
+        delay = 0.5
+        while True:
+            try:
+                self._write_batch(batch)
+                written = True
+                break
+            except Exception as e:
+                with self._lock:
+                    self._failures += 1
+                if self._stop.is_set():
+                    # Shutting down: the batch stays in the journal for the next start
+                    logger.error(f"{self.name}: leaving batch of {len(batch)} in the journal: {str(e)}")
+                    break
+                logger.error(f"{self.name}: batch write failed, retrying in {delay}s: {str(e)}")
+                self._stop.wait(delay)
+                delay = min(delay * 2, 30.0)
+
+        with self._drained:
+            if written:
+                self._written += len(batch)
+                self._batches += 1
+                for record in batch:
+                    self._pending.pop(record["id"], None)
+            for _ in batch:
+                self._queue.task_done()
+            if not self._pending:
+                # Everything journaled is stored; the journal can start over
+                self._truncate_journal()
+            self._drained.notify_all()
+
+    def _journal(self, records: List[Record]):
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _truncate_journal(self):
+        with open(self.journal_path, "w", encoding="utf-8"):
+            pass
+
+    def _replay(self) -> int:
+        if not self.journal_path.exists():
+            return 0
+        records: Dict[str, Record] = {}
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn last line from a crash mid-write
+                    continue
+                records[record["id"]] = record
+        # Every replayed record is queued, even past max_pending: it is only on disk
+        for record in records.values():
+            self._pending[record["id"]] = record
+            self._queue.put_nowait(record)
+        return len(records)
@@ -1,23 +1,29 @@
 import logging
-from typing import List, Dict
-from openai import OpenAI
-from ..core.config import settings
+from typing import List, Dict, AsyncIterator, Optional
+from ..services.llm_client import get_llm_client
+from ..services.memory import ConversationMemory, conversation_memory
+from ..services.singleflight import llm_singleflight, request_key
+from ..services.prompt_builder import PromptAssembler, get_token_counter
+from ..core.lazy import LazyResource
 
 logger = logging.getLogger(__name__)
 
 class MovneChat:
-    def __init__(self):
+    def __init__(self, memory: Optional[ConversationMemory] = None):
         try:
-            # Initialize OpenAI client with the validated API key from settings
-            self.client = OpenAI(api_key=settings.validate_openai_key)
-            self.model_name = settings.OPENAI_MODEL
-            self.temperature = settings.OPENAI_TEMPERATURE
+            # Shared async client for the configured backend (pooled, non-blocking)
+            self.client = get_llm_client()
+            self.model_name = self.client.model
+            self.temperature = self.client.temperature
             
-            # Initialize conversation history
-            self.conversation_history: List[Dict[str, str]] = []
-            self.max_history_length = 5  # Keep last 5 exchanges
+            # Conversation history is kept per session, never shared between users
+            self.memory = memory or conversation_memory
             
-            logger.info("Chat model initialized successfully with OpenAI")
+            # Keeps prompts inside the context window (RAG_MAX_CONTEXT_WINDOW)
+            self.token_counter = get_token_counter(self.model_name)
+            self.prompt_assembler = PromptAssembler(self.token_counter)
+            
+            logger.info(f"Chat model initialized successfully with {self.model_name}")
             
         except Exception as e:
             logger.error(f"Initialization error: {str(e)}")
@@ -26,38 +32,80 @@ class MovneChat:
     def is_initialized(self) -> bool:
         return hasattr(self, 'client') and self.client is not None
     
-    def generate_response(self, message: str, language: str = "he") -> str:
+    def _build_messages(self, message: str, language: str, session_id: Optional[str]) -> List[Dict[str, str]]:
+        """Build the messages for the API call from the session history and the user message"""
+        if not self.is_initialized():
+            raise Exception("Chat model not properly initialized")
+        
+        history = self.memory.get_history(session_id) if session_id else []
+        
+        # Prepare system message based on language
+        system_prompt = (
+            "You are a financial advisor specializing in structured products. Structured products are complex financial instruments that combine various investment types to create customized payoff profiles. When responding in Hebrew, maintain a professional tone and use proper financial terminology. Focus on explaining concepts clearly and accurately." if language == "he" else "You are a financial advisor specializing in structured products. Focus on professional financial advice and accurate market terminology."
+        )
+        
+        # Prepare messages for the API call within the token budget
+        prompt = self.prompt_assembler.assemble(system_prompt, message, history)
+        logger.info(
+            f"Prompt assembled: {prompt.tokens} tokens, {len(prompt.history)} history messages "
+            f"({prompt.dropped_history} dropped)"
+        )
+        return prompt.messages
+    
+    def remember_turn(self, session_id: Optional[str], message: str, response: str):
+        if session_id:
+            # Token counts are stored with the turn so history is never re-tokenized
+            for role, content in (("user", message), ("assistant", response)):
+                self.memory.add_message(session_id, {
+                    "role": role,
+                    "content": content,
+                    "tokens": self.token_counter.count(content)
+                })
+    
+    async def generate_response(self, message: str, language: str = "he", session_id: Optional[str] = None) -> str:
         try:
-            if not self.is_initialized():
-                raise Exception("Chat model not properly initialized")
-            
-            # Add user message to history
-            self.conversation_history.append({"role": "user", "content": message})
-            
-            # Prepare system message based on language
-            system_message = {
-                "role": "system",
-                "content": "You are a financial advisor specializing in structured products. Structured products are complex financial instruments that combine various investment types to create customized payoff profiles. When responding in Hebrew, maintain a professional tone and use proper financial terminology. Focus on explaining concepts clearly and accurately." if language == "he" else "You are a financial advisor specializing in structured products. Focus on professional financial advice and accurate market terminology."
-            }
-            
-            # Prepare messages for the API call
-            messages = [system_message] + self.conversation_history[-self.max_history_length:]
-            
-            # Generate response using OpenAI
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=messages,
-                temperature=self.temperature
+            messages = self._build_messages(message, language, session_id)
+            
+            # Generate response without blocking the event loop; identical concurrent
+            # requests share a single upstream call
+            assistant_message = await llm_singleflight.do(
+                request_key(self.model_name, self.temperature, messages),
+                lambda: self.client.complete(messages, temperature=self.temperature)
             )
             
-            # Extract and store assistant's response
-            assistant_message = response.choices[0].message.content
-            self.conversation_history.append({"role": "assistant", "content": assistant_message})
+            # Store the turn in the session's history
+            self.remember_turn(session_id, message, assistant_message)
             
             return assistant_message
             
         except Exception as e:
             logger.error(f"Error generating response: {str(e)}")
             raise
+    
+    async def generate_response_stream(self, message: str, language: str = "he", session_id: Optional[str] = None) -> AsyncIterator[str]:
+        """Yield response tokens as they arrive.
+        
+        The turn is stored in the session history only when the stream completes;
+        closing the generator early closes the upstream HTTP stream once no
+        other identical request is listening to it.
+        """
+        messages = self._build_messages(message, language, session_id)
+        parts: List[str] = []
+        stream = llm_singleflight.stream(
+            request_key(self.model_name, self.temperature, messages),
+            lambda: self.client.stream(messages, temperature=self.temperature)
+        )
+        try:
+            async for token in stream:
+                parts.append(token)
+                yield token
+        finally:
+            await stream.aclose()
+        
+        self.remember_turn(session_id, message, "".join(parts))
+
+# Built on first use rather than at import time
+chat_model = LazyResource("chat_model", MovneChat, warm_up=False)
 
-chat_model = MovneChat()
+def get_chat_model() -> MovneChat:
+    return chat_model.get()
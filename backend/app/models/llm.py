@@ -1,5 +1,5 @@
-from transformers import pipeline, AutoTokenizer
 import logging
+from ..core.lazy import LazyResource
 
 logger = logging.getLogger(__name__)
 
@@ -7,13 +7,24 @@ class SimpleChat:
     def __init__(self):
         # Using a smaller, open-source model that doesn't require login
         self.model_name = "Helsinki-NLP/opus-mt-en-he"
+        # Not warmed at startup: nothing translates yet
+        self._translator = LazyResource("translator", self._load_translator, warm_up=False)
+
+    def _load_translator(self):
         try:
-            self.translator = pipeline("translation", model=self.model_name)
+            from transformers import pipeline
+            translator = pipeline("translation", model=self.model_name)
             logger.info("Model loaded successfully")
+            return translator
         except Exception as e:
             logger.error(f"Error loading model: {str(e)}")
             # Fallback to simple responses if model fails
-            self.translator = None
+            return None
+
+    @property
+    def translator(self):
+        """Translation pipeline, loaded on first access"""
+        return self._translator.get()
 
     def generate_response(self, message: str, language: str = "he") -> str:
         try:
@@ -26,5 +37,5 @@ class SimpleChat:
             logger.error(f"Error generating response: {str(e)}")
             return "שירות הצ'אט זמני לא זמין. אנא נסה שוב מאוחר יותר."
 
-# Initialize the model once as a global instance
+# Initialize the model once as a global instance (the translator loads lazily)
 chat_model = SimpleChat()
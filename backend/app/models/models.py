@@ -69,7 +69,8 @@ class Message(Base):
     content = Column(Text)
     role = Column(String)  # user or assistant
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
-    metadata = Column(JSON)  # Store additional message metadata
+    # "metadata" is reserved on declarative classes; the column keeps its name
+    metadata_ = Column("metadata", JSON)  # Store additional message metadata
     
     conversation = relationship("Conversation", back_populates="messages")
 
@@ -81,6 +82,6 @@ class Document(Base):
     content = Column(Text)
     document_type = Column(String)  # product_guide, regulation, marketing_material
     language = Column(String)
-    metadata = Column(JSON)  # Store document metadata and embeddings
+    metadata_ = Column("metadata", JSON)  # Store document metadata and embeddings
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
\ No newline at end of file
@@ -1,37 +1,46 @@
-import httpx
+from typing import AsyncIterator, Optional
+import asyncio
 from .vectorstore import VectorStore
-from ..core.config import settings
+from .llm_client import get_llm_client
+from .prompt_builder import PromptAssembler, get_token_counter
+from ..core.rag_config import rag_settings
+
+INSTRUCTIONS = """Use the following context to answer the question. Answer in the same language as the question.
+If the context doesn't help, just say you don't know."""
 
 class ChatService:
-    def __init__(self):
-        self.vector_store = VectorStore()
-        self.ollama_url = f"{settings.OLLAMA_HOST}/api/generate"
+    def __init__(self, vector_store: Optional[VectorStore] = None):
+        self.vector_store = vector_store or VectorStore()
+        # Shared pooled client, connections are reused across requests
+        self.llm_client = get_llm_client("ollama")
+        self.prompt_assembler = PromptAssembler(get_token_counter(self.llm_client.model))
         
     async def _generate_response(self, prompt: str) -> str:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                self.ollama_url,
-                json={
-                    "model": settings.OLLAMA_MODEL,
-                    "prompt": prompt,
-                    "stream": False
-                }
-            )
-            return response.json()["response"]
+        return await self.llm_client.complete([{"role": "user", "content": prompt}])
 
-    async def get_chat_response(self, message: str) -> str:
-        # Retrieve relevant context
-        context = self.vector_store.search(message)
+    async def _generate_response_stream(self, prompt: str) -> AsyncIterator[str]:
+        async for token in self.llm_client.stream([{"role": "user", "content": prompt}]):
+            yield token
+
+    async def _build_prompt(self, message: str) -> str:
+        # Retrieve relevant context and keep what fits the token budget, best first;
+        # the search encodes the query and scores chunks, so it runs off the event loop
+        context = await asyncio.to_thread(self.vector_store.search, message, n_results=rag_settings.MAX_RELEVANT_CHUNKS)
+        packed = self.prompt_assembler.assemble(INSTRUCTIONS, message, context_chunks=context)
         
         # Create bilingual prompt
-        prompt = f"""Use the following context to answer the question. Answer in the same language as the question.
-If the context doesn't help, just say you don't know.
+        return f"""{INSTRUCTIONS}
 
 Context:
-{' '.join(context)}
+{' '.join(packed.context_chunks)}
 
 Question: {message}
 
 Answer:"""
 
-        return await self._generate_response(prompt)
+    async def get_chat_response(self, message: str) -> str:
+        return await self._generate_response(await self._build_prompt(message))
+
+    async def get_chat_response_stream(self, message: str) -> AsyncIterator[str]:
+        async for token in self._generate_response_stream(await self._build_prompt(message)):
+            yield token
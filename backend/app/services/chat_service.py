@@ -1,25 +1,29 @@
-from typing import Optional
+from typing import Optional, Dict, Any, AsyncIterator
 from ..models.chat_model import MovneChat
 from ..core.config import Settings
+from .semantic_cache import CacheKey, SemanticCache, semantic_cache
+import asyncio
 import logging
 import json
+import time
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
 class ChatService:
-    def __init__(self):
+    def __init__(self, cache: Optional[SemanticCache] = None, chat_model: Optional[MovneChat] = None):
         self.settings = Settings()
+        self.cache = cache or semantic_cache
         self.initialized = False
         try:
-            self.chat_model = MovneChat()
+            self.chat_model = chat_model or MovneChat()
             logger.info("Chat service initialized successfully")
             self.initialized = True
         except Exception as e:
             logger.error(f"Error initializing chat service: {str(e)}")
             self.initialized = False
 
-    def _log_chat_interaction(self, message: str, response: str, language: str, error: Optional[str] = None):
+    def _log_chat_interaction(self, message: str, response: str, language: str, error: Optional[str] = None, metrics: Optional[Dict[str, Any]] = None):
         """Log chat interactions for monitoring and analytics"""
         log_entry = {
             "timestamp": datetime.utcnow().isoformat(),
@@ -29,24 +33,151 @@ class ChatService:
             "error": error,
             "environment": self.settings.ENVIRONMENT
         }
+        if metrics:
+            log_entry.update(metrics)
         logger.info(f"Chat interaction: {json.dumps(log_entry)}")
 
-    async def process_message(self, message: str, language: str = "he", is_qualified: bool = False) -> str:
+    def _unavailable_message(self, language: str) -> str:
+        return "שירות הצ'אט זמני לא זמין. אנא נסה שוב מאוחר יותר." if language == "he" else "Service temporarily unavailable. Please try again later."
+
+    def _error_message(self, language: str) -> str:
+        return "שגיאה בייצור תשובה. אנא נסה שוב." if language == "he" else "Error generating response. Please try again."
+
+    async def _cache_lookup(self, message: str, language: str, is_qualified: bool, session_id: Optional[str]):
+        """Return (cache key, cached response) for context-free turns.
+
+        Only the first message of a session is cached: later answers depend on
+        the conversation so far. Cache failures never fail the request.
+        """
+        if not self.settings.SEMANTIC_CACHE_ENABLED:
+            return None, None
+        if session_id and self.chat_model.memory.get_history(session_id, 1):
+            return None, None
+        try:
+            key = self.cache.key(message, language, is_qualified)
+            return key, await asyncio.to_thread(self.cache.get, key)
+        except Exception as e:
+            logger.warning(f"Semantic cache lookup failed: {str(e)}")
+            return None, None
+
+    async def _cache_store(self, key: Optional[CacheKey], response: str):
+        if key is None or not response:
+            return
+        try:
+            await asyncio.to_thread(self.cache.set, key, response)
+        except Exception as e:
+            logger.warning(f"Semantic cache store failed: {str(e)}")
+
+    async def process_message(self, message: str, language: str = "he", is_qualified: bool = False, session_id: Optional[str] = None) -> str:
         if not self.initialized:
-            error_msg = "שירות הצ'אט זמני לא זמין. אנא נסה שוב מאוחר יותר." if language == "he" else "Service temporarily unavailable. Please try again later."
+            error_msg = self._unavailable_message(language)
             logger.error(f"Attempted to process message but service is not initialized")
             self._log_chat_interaction(message, error_msg, language, "Service not initialized")
             return error_msg
 
         try:
             logger.info(f"Processing message in {language} language, qualified investor: {is_qualified}")
-            response = self.chat_model.generate_response(message, language)
+            cache_key, cached = await self._cache_lookup(message, language, is_qualified, session_id)
+            if cached is not None:
+                self.chat_model.remember_turn(session_id, message, cached)
+                self._log_chat_interaction(message, cached, language, metrics={"cache": "hit"})
+                return cached
+
+            response = await self.chat_model.generate_response(message, language, session_id)
             response = response.strip()
-            self._log_chat_interaction(message, response, language)
+            await self._cache_store(cache_key, response)
+            self._log_chat_interaction(message, response, language, metrics={"cache": "miss" if cache_key else "skip"})
             return response
 
         except Exception as e:
-            error_msg = "שגיאה בייצור תשובה. אנא נסה שוב." if language == "he" else "Error generating response. Please try again."
+            error_msg = self._error_message(language)
             logger.error(f"Error processing message: {str(e)}")
             self._log_chat_interaction(message, error_msg, language, str(e))
             return error_msg
+
+    async def process_message_stream(self, message: str, language: str = "he", is_qualified: bool = False, session_id: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Stream a response as events.
+
+        Yields ``{"type": "token", "content": ...}`` for every token, followed by a
+        single ``done`` event carrying the full response and timings, or an
+        ``error`` event. If the consumer goes away (the generator is closed or
+        cancelled) the upstream stream is closed and the partial response is logged.
+        """
+        if not self.initialized:
+            error_msg = self._unavailable_message(language)
+            logger.error(f"Attempted to stream message but service is not initialized")
+            self._log_chat_interaction(message, error_msg, language, "Service not initialized")
+            yield {"type": "error", "message": error_msg}
+            return
+
+        logger.info(f"Streaming message in {language} language, qualified investor: {is_qualified}")
+        started = time.perf_counter()
+        ttft_ms: Optional[float] = None
+        parts = []
+        error: Optional[str] = None
+        tokens = None
+        cache_status = "skip"
+
+        try:
+            cache_key, cached = await self._cache_lookup(message, language, is_qualified, session_id)
+            if cached is not None:
+                cache_status = "hit"
+                ttft_ms = round((time.perf_counter() - started) * 1000, 1)
+                parts.append(cached)
+                self.chat_model.remember_turn(session_id, message, cached)
+                yield {"type": "token", "content": cached}
+                yield {
+                    "type": "done",
+                    "response": cached,
+                    "session_id": session_id,
+                    "cached": True,
+                    "ttft_ms": ttft_ms,
+                    "total_ms": ttft_ms
+                }
+                return
+            if cache_key is not None:
+                cache_status = "miss"
+
+            tokens = self.chat_model.generate_response_stream(message, language, session_id)
+            async for token in tokens:
+                if ttft_ms is None:
+                    ttft_ms = round((time.perf_counter() - started) * 1000, 1)
+                parts.append(token)
+                yield {"type": "token", "content": token}
+
+            response = "".join(parts).strip()
+            await self._cache_store(cache_key, response)
+            yield {
+                "type": "done",
+                "response": response,
+                "session_id": session_id,
+                "cached": False,
+                "ttft_ms": ttft_ms,
+                "total_ms": round((time.perf_counter() - started) * 1000, 1)
+            }
+
+        except (asyncio.CancelledError, GeneratorExit):
+            error = "Client disconnected"
+            logger.info(f"Chat stream cancelled after {len(parts)} tokens")
+            raise
+
+        except Exception as e:
+            error = str(e)
+            logger.error(f"Error streaming message: {error}")
+            yield {"type": "error", "message": self._error_message(language)}
+
+        finally:
+            if tokens is not None:
+                await tokens.aclose()
+            self._log_chat_interaction(
+                message,
+                "".join(parts).strip(),
+                language,
+                error,
+                {
+                    "streamed": True,
+                    "cache": cache_status,
+                    "ttft_ms": ttft_ms,
+                    "total_ms": round((time.perf_counter() - started) * 1000, 1)
+                }
+            )
@@ -0,0 +1,72 @@
+import asyncio
+import logging
+from ..core.config import settings
+from ..core.lazy import LazyResource
+from ..memory.memory_store import MemoryStore
+from ..models.chat_model import get_chat_model
+from .chat_service import ChatService
+from .embedding_cache import embedding_cache
+from .llm_client import close_llm_clients
+from .rag_service import RAGService
+from . import vectorstore
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceContainer:
+    """One instance of each long-lived service per worker.
+
+    Services are built once (by the startup warm-up or on first use) and shared
+    by every request through the FastAPI providers in api/deps.py.
+    """
+
+    def __init__(self):
+        self._chat_service = LazyResource("chat_service", lambda: ChatService(chat_model=get_chat_model()))
+        self._rag_service = LazyResource("rag_service", lambda: RAGService(vector_store=self.vector_store))
+        self._vector_store = LazyResource("vector_store", vectorstore.VectorStore, warm_up=False)
+        self._rag_chat_service = LazyResource("rag_chat_service", self._build_rag_chat_service, warm_up=False)
+        self._memory_store = LazyResource("memory_store", lambda: MemoryStore(settings.MEMORY_STORE_PATH), warm_up=False)
+
+    def _build_rag_chat_service(self):
+        from .chat import ChatService as RAGChatService
+        return RAGChatService(vector_store=self.vector_store)
+
+    @property
+    def chat_service(self) -> ChatService:
+        return self._chat_service.get()
+
+    @property
+    def rag_service(self) -> RAGService:
+        """Retrieval over this container's vector store"""
+        return self._rag_service.get()
+
+    @property
+    def vector_store(self) -> "vectorstore.VectorStore":
+        return self._vector_store.get()
+
+    @property
+    def rag_chat_service(self):
+        """The Ollama-backed chat service, sharing this container's vector store"""
+        return self._rag_chat_service.get()
+
+    @property
+    def memory_store(self) -> MemoryStore:
+        """Long-term conversation history and client profiles"""
+        return self._memory_store.get()
+
+    @property
+    def encoder(self):
+        return vectorstore.get_encoder()
+
+    @property
+    def chroma_client(self):
+        return vectorstore.chroma_client.get()
+
+    async def shutdown(self):
+        """Release pooled connections and persist caches worth keeping"""
+        await close_llm_clients()
+        if self._memory_store.loaded:
+            # Queued conversations are written before the worker exits
+            await asyncio.to_thread(self._memory_store.get().close)
+        embedding_cache.save()
+        logger.info("Service container shut down")
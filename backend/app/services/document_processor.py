@@ -1,108 +1,279 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, NamedTuple, Optional
+from functools import partial
+from itertools import repeat
 from pathlib import Path
-from sqlalchemy.orm import Session
+from sqlalchemy import insert, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 from ..models.models import Document
 from ..core.rag_config import rag_settings
-from .rag_service import RAGService
-import os
-import json
+from ..utils.document_loader import ChunkCursor, iter_source_files, read_chunk_part
+from .ingest_pipeline import IngestPipeline, ParsedFile
+from .vectorstore import VectorStore
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Characters sampled from the start of a document (its first part) to detect its language
+_LANGUAGE_SAMPLE_CHARS = 1000
+
+
+def infer_document_type(file_path: Path, metadata: Dict[str, Any]) -> str:
+    """Infer document type from file path or metadata"""
+    # First check metadata
+    if 'document_type' in metadata:
+        return metadata['document_type']
+
+    # Then check file path
+    path_str = str(file_path).lower()
+    if 'regulation' in path_str or 'compliance' in path_str:
+        return 'regulation'
+    elif 'product' in path_str and 'guide' in path_str:
+        return 'product_guide'
+    elif 'marketing' in path_str:
+        return 'marketing_material'
+    elif 'risk' in path_str:
+        return 'risk_disclosure'
+    elif 'term' in path_str and 'sheet' in path_str:
+        return 'term_sheet'
+
+    raise ValueError(f"Could not infer document type for {file_path}")
+
+
+def detect_language(content: str) -> str:
+    """Detect document language"""
+    # This is a simple implementation. In production, use a proper language detection library
+    sample = content[:_LANGUAGE_SAMPLE_CHARS]
+
+    # Check for Hebrew characters
+    if any('\u0590' <= c <= '\u05FF' for c in sample):
+        return 'he'
+    return 'en'  # Default to English
+
+
+class DocumentCursor(NamedTuple):
+    """Where the next part of a document starts, with the language of its first part"""
+    chunks: ChunkCursor
+    language: str
+
+
+def parse_document(
+    source: str,
+    file_path: Path,
+    metadata: Dict[str, Any],
+    cursor: Optional[DocumentCursor] = None,
+    document_type: Optional[str] = None,
+    language: Optional[str] = None
+) -> ParsedFile:
+    """Chunk one part of a file; the first part also carries its Document row.
+
+    The file is read once: each part carries the text it covered, which the
+    sink stores as Document.content, and the language is detected from the
+    first part. Runs in the ingestion pipeline's worker processes, so it is a
+    plain module-level function.
+    """
+    started = time.perf_counter()
+    # Determine document type and language
+    document_type = document_type or infer_document_type(file_path, metadata)
+    if document_type not in rag_settings.SUPPORTED_DOC_TYPES:
+        raise ValueError(f"Unsupported document type: {document_type}")
+
+    texts: List[str] = []
+    chunks, next_cursor = read_chunk_part(file_path, cursor.chunks if cursor else None, texts=texts)
+    text = "".join(texts)
+    language = language or metadata.get('language') or (cursor.language if cursor else detect_language(text))
+    if language not in rag_settings.SUPPORTED_LANGUAGES:
+        raise ValueError(f"Unsupported language: {language}")
+
+    row = None
+    if cursor is None:
+        row = {
+            "title": file_path.stem,
+            "document_type": document_type,
+            "language": language,
+            "metadata_": metadata
+        }
+    # Vector store metadata must be flat scalars
+    chunk_metadata = {key: value for key, value in metadata.items() if isinstance(value, (str, int, float, bool))}
+    chunk_metadata.update(source=source, document_type=document_type, language=language)
+
+    resume = DocumentCursor(next_cursor, language) if next_cursor is not None else None
+    parsed = ParsedFile(source, file_path, chunk_metadata, chunks, row=row, resume=resume, text=text)
+    parsed.seconds = time.perf_counter() - started
+    return parsed
+
+
+class IngestReport:
+    """Outcome of a bulk ingestion; per-file failures are collected, not raised"""
+
+    def __init__(self):
+        self.files = 0
+        self.documents = 0
+        self.chunks = 0
+        self.chunks_skipped = 0
+        self.errors: List[Dict[str, str]] = []
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+
+    def add_error(self, source: str, stage: str, error: Exception):
+        logger.error(f"Error processing {source} ({stage}): {str(error)}")
+        self.errors.append({"source": source, "stage": stage, "error": str(error)})
+
+    @property
+    def documents_per_second(self) -> float:
+        return round(self.documents / self.seconds, 1) if self.seconds else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "files": self.files,
+            "documents": self.documents,
+            "chunks": self.chunks,
+            "chunks_skipped": self.chunks_skipped,
+            "errors": self.errors,
+            "stages": self.stages,
+            "seconds": round(self.seconds, 3),
+            "documents_per_second": self.documents_per_second
+        }
+
 
 class DocumentProcessor:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession, vector_store: Optional[VectorStore] = None):
         self.db = db
-        self.rag_service = RAGService(db)
-    
-    def process_document_file(self, file_path: Path, document_type: str, language: str, metadata: Dict[str, Any] = None) -> Document:
+        self.vector_store = vector_store or VectorStore()
+
+    async def process_document_file(self, file_path: Path, document_type: str, language: str, metadata: Dict[str, Any] = None) -> Document:
         """Process a document file and store it in the database and vector store"""
-        if document_type not in rag_settings.SUPPORTED_DOC_TYPES:
-            raise ValueError(f"Unsupported document type: {document_type}")
-        
-        if language not in rag_settings.SUPPORTED_LANGUAGES:
-            raise ValueError(f"Unsupported language: {language}")
-        
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
+        metadata = dict(metadata or {}, source=file_path.name)
+        parsed = await asyncio.to_thread(parse_document, file_path.name, file_path, metadata, None, document_type, language)
+
         # Create document record
-        document = Document(
-            title=file_path.stem,
-            content=content,
-            document_type=document_type,
-            language=language,
-            metadata=metadata or {}
-        )
-        
+        document = Document(**parsed.row, content=parsed.text)
         self.db.add(document)
-        self.db.commit()
-        self.db.refresh(document)
-        
-        # Process document for vector store
-        self.rag_service.process_document(document)
-        
+        await self.db.commit()
+        await self.db.refresh(document)
+
+        # Process document for vector store, one part at a time
+        texts = [parsed.text]
+        while True:
+            parsed.chunk_metadata["document_id"] = document.id
+            await asyncio.to_thread(self.vector_store.add_documents, parsed.chunks, repeat(parsed.chunk_metadata))
+            if parsed.resume is None:
+                break
+            parsed = await asyncio.to_thread(parse_document, file_path.name, file_path, metadata, parsed.resume, document_type, language)
+            texts.append(parsed.text)
+        if len(texts) > 1:
+            document.content = "".join(texts)
+            await self.db.commit()
         return document
-    
-    def batch_process_directory(self, directory_path: Path, document_type: str = None) -> List[Document]:
-        """Process all documents in a directory"""
-        processed_documents = []
-        
-        for file_path in directory_path.glob('**/*'):
-            if file_path.is_file() and file_path.suffix in ['.txt', '.md', '.json']:
-                metadata = {}
-                
-                # If it's a JSON file, try to extract metadata
-                if file_path.suffix == '.json':
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        content_file = data.get('content_file')
-                        if content_file:
-                            file_path = directory_path / content_file
-                            metadata = data.get('metadata', {})
-                
-                # Determine document type and language
-                doc_type = document_type or self._infer_document_type(file_path, metadata)
-                language = metadata.get('language', self._detect_language(file_path))
-                
+
+    async def batch_process_directory(
+        self,
+        directory_path: Path,
+        document_type: str = None,
+        batch_size: Optional[int] = None,
+        parse_workers: Optional[int] = None
+    ) -> IngestReport:
+        """Bulk-ingest every supported document under a directory.
+
+        Files flow through an IngestPipeline: typed, language-detected and
+        chunked in worker processes, large files a part at a time, embedded on
+        a dedicated thread, then stored
+        by a sink that inserts up to batch_size Document rows per transaction and
+        writes their vectors together. A file that fails is recorded in the
+        report and the rest carry on; a batch whose insert fails is retried row
+        by row to isolate the bad file. report.stages shows per-stage throughput
+        and queue depths.
+        """
+        report = IngestReport()
+        # Documents whose later parts are still to come, and the text of their parts so far
+        document_ids: Dict[str, int] = {}
+        contents: Dict[str, List[str]] = {}
+
+        async def sink(files: List[ParsedFile]):
+            inserted = await self._insert_rows([file for file in files if file.row is not None], report)
+            report.documents += len(inserted)
+            for file in inserted:
+                document_ids[file.source] = file.chunk_metadata["document_id"]
+            stored = []
+            completed = []
+            for file in files:
+                # Parts of a document whose row failed to insert are dropped
+                document_id = document_ids.get(file.source)
+                if document_id is None:
+                    continue
+                file.chunk_metadata["document_id"] = document_id
+                stored.append(file)
+                if file.row is None:
+                    contents[file.source].append(file.text)
+                elif file.resume is not None:
+                    contents[file.source] = [file.text]
+                if file.resume is None:
+                    del document_ids[file.source]
+                    if file.row is None:
+                        completed.append({"id": document_id, "content": "".join(contents.pop(file.source))})
+            if completed:
+                # Documents in several parts were inserted with their first part's text
+                await self.db.execute(update(Document), completed)
+                await self.db.commit()
+            chunks, skipped = await pipeline.write_vectors(stored)
+            report.chunks += chunks
+            report.chunks_skipped += skipped
+
+        def jobs():
+            for job in iter_source_files(str(directory_path)):
+                report.files += 1
+                yield job
+
+        pipeline = IngestPipeline(
+            partial(parse_document, document_type=document_type),
+            sink,
+            self.vector_store,
+            on_error=report.add_error,
+            parse_workers=parse_workers,
+            batch_files=batch_size
+        )
+        report.stages = await pipeline.run(jobs())
+        for source in pipeline.failed:
+            document_ids.pop(source, None)
+            contents.pop(source, None)
+
+        report.seconds = time.perf_counter() - report.started
+        logger.info(f"Ingested {report.documents} documents from {report.files} files in {report.seconds:.1f}s ({report.documents_per_second} docs/sec, {len(report.errors)} errors)")
+        return report
+
+    async def _insert_rows(self, files: List[ParsedFile], report: IngestReport) -> List[ParsedFile]:
+        """Insert the files' rows in one transaction; returns the files stored"""
+        if not files:
+            return []
+        rows = [dict(file.row, content=file.text) for file in files]
+        try:
+            ids = await self._insert(rows)
+            await self.db.commit()
+        except SQLAlchemyError as e:
+            await self.db.rollback()
+            logger.warning(f"Batch insert of {len(files)} documents failed, retrying one by one: {str(e)}")
+            ids = []
+            for file, row in zip(files, rows):
                 try:
-                    document = self.process_document_file(
-                        file_path=file_path,
-                        document_type=doc_type,
-                        language=language,
-                        metadata=metadata
-                    )
-                    processed_documents.append(document)
-                except Exception as e:
-                    print(f"Error processing {file_path}: {str(e)}")
-        
-        return processed_documents
-    
-    def _infer_document_type(self, file_path: Path, metadata: Dict[str, Any]) -> str:
-        """Infer document type from file path or metadata"""
-        # First check metadata
-        if 'document_type' in metadata:
-            return metadata['document_type']
-        
-        # Then check file path
-        path_str = str(file_path).lower()
-        if 'regulation' in path_str or 'compliance' in path_str:
-            return 'regulation'
-        elif 'product' in path_str and 'guide' in path_str:
-            return 'product_guide'
-        elif 'marketing' in path_str:
-            return 'marketing_material'
-        elif 'risk' in path_str:
-            return 'risk_disclosure'
-        elif 'term' in path_str and 'sheet' in path_str:
-            return 'term_sheet'
-        
-        raise ValueError(f"Could not infer document type for {file_path}")
-    
-    def _detect_language(self, file_path: Path) -> str:
-        """Detect document language"""
-        # This is a simple implementation. In production, use a proper language detection library
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read(1000)  # Read first 1000 characters
-        
-        # Check for Hebrew characters
-        if any('\u0590' <= c <= '\u05FF' for c in content):
-            return 'he'
-        return 'en'  # Default to English
\ No newline at end of file
+                    ids.extend(await self._insert([row]))
+                    await self.db.commit()
+                except SQLAlchemyError as row_error:
+                    await self.db.rollback()
+                    ids.append(None)
+                    report.add_error(file.source, "database", row_error)
+
+        stored = []
+        for file, document_id in zip(files, ids):
+            if document_id is not None:
+                file.chunk_metadata["document_id"] = document_id
+                stored.append(file)
+        return stored
+
+    async def _insert(self, rows: List[Dict[str, Any]]) -> List[int]:
+        # One multi-row INSERT ... RETURNING for the whole batch
+        statement = insert(Document).returning(Document.id, sort_by_parameter_order=True)
+        result = await self.db.execute(statement, rows)
+        return list(result.scalars())
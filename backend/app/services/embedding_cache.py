@@ -0,0 +1,163 @@
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+import logging
+import os
+import threading
+import time
+import numpy as np
+from ..core.config import settings
+from ..core.lazy import register_warm_up
+from .semantic_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+# (model id, normalized text, unit-normalized)
+Key = Tuple[str, str, bool]
+
+
+class _Entry:
+    __slots__ = ("vector", "created_at")
+
+    def __init__(self, vector: np.ndarray, created_at: float):
+        self.vector = vector
+        self.created_at = created_at
+
+
+class EmbeddingCache:
+    """Bounded LRU cache of query embeddings.
+
+    Keys are the normalized query text plus the model id, so repeated retrieval
+    skips model inference and a model change never serves stale vectors. The
+    text is encoded as given, since case-folding would change what a cased
+    model sees; variants differing only in case or spacing share the vector of
+    whichever was encoded first.
+    """
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        path: Optional[Path] = None,
+        model: Optional[str] = None,
+    ):
+        self.max_entries = max_entries or settings.EMBEDDING_CACHE_MAX_ENTRIES
+        self.ttl_seconds = ttl_seconds or settings.EMBEDDING_CACHE_TTL_SECONDS
+        self.path = Path(path) if path is not None else settings.EMBEDDING_CACHE_PATH
+        self.model = model or str(settings.MODEL_PATH)
+        self._entries: "OrderedDict[Key, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._encode_seconds = 0.0
+
+    def encode(self, text: str, encoder, normalize: bool = False) -> np.ndarray:
+        """Return the embedding of text, running encoder only on a miss"""
+        normalized = normalize_query(text)
+        key = (self.model, normalized, normalize)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry.created_at <= self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry.vector
+            self._misses += 1
+
+        # Encoding happens outside the lock; concurrent misses may both encode
+        started = time.perf_counter()
+        vector = np.asarray(encoder.encode(text, normalize_embeddings=normalize), dtype=np.float32)
+        vector.setflags(write=False)
+        elapsed = time.perf_counter() - started
+
+        with self._lock:
+            self._encode_seconds += elapsed
+            self._entries[key] = _Entry(vector, now)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return vector
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "encode_seconds": round(self._encode_seconds, 3),
+            }
+
+    def save(self, path: Optional[Path] = None) -> int:
+        """Write this model's live entries to an .npz file; returns how many were saved"""
+        path = Path(path) if path is not None else self.path
+        if path is None:
+            return 0
+        now = time.time()
+        with self._lock:
+            items = [
+                (key, entry) for key, entry in self._entries.items()
+                if key[0] == self.model and now - entry.created_at <= self.ttl_seconds
+            ]
+        if not items:
+            return 0
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            np.savez(
+                f,
+                model=np.array(self.model),
+                texts=np.array([key[1] for key, _ in items]),
+                normalized=np.array([key[2] for key, _ in items], dtype=bool),
+                created_at=np.array([entry.created_at for _, entry in items], dtype=np.float64),
+                vectors=np.stack([entry.vector for _, entry in items]),
+            )
+        os.replace(tmp, path)
+        logger.info(f"Saved {len(items)} cached embeddings to {path}")
+        return len(items)
+
+    def load(self, path: Optional[Path] = None) -> int:
+        """Restore entries saved by save(); files written for another model are ignored"""
+        path = Path(path) if path is not None else self.path
+        if path is None or not path.exists():
+            return 0
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if str(data["model"]) != self.model:
+                    logger.info(f"Ignoring embedding cache {path}: built for model {data['model']}")
+                    return 0
+                texts = data["texts"].tolist()
+                normalized = data["normalized"].tolist()
+                created_at = data["created_at"].tolist()
+                vectors = data["vectors"].astype(np.float32)
+        except (OSError, KeyError, ValueError) as e:
+            logger.warning(f"Could not load embedding cache {path}: {e}")
+            return 0
+
+        now = time.time()
+        loaded = 0
+        with self._lock:
+            for text, norm, created, vector in zip(texts, normalized, created_at, vectors):
+                if now - created > self.ttl_seconds:
+                    continue
+                vector.setflags(write=False)
+                key = (self.model, text, bool(norm))
+                # Entries computed since startup are fresher than the file
+                if key not in self._entries:
+                    self._entries[key] = _Entry(vector, created)
+                    self._entries.move_to_end(key, last=False)
+                    loaded += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        logger.info(f"Loaded {loaded} cached embeddings from {path}")
+        return loaded
+
+
+embedding_cache = EmbeddingCache()
+register_warm_up("embedding_cache", embedding_cache.load)
@@ -0,0 +1,281 @@
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+import asyncio
+import logging
+import multiprocessing
+import time
+import numpy as np
+from ..core.rag_config import rag_settings
+from .vectorstore import VectorStore, chunk_id
+
+logger = logging.getLogger(__name__)
+
+Record = Tuple[str, dict, str]  # (text, metadata, id), as in VectorStore
+
+
+class ParsedFile:
+    """One part of a source file on its way through the pipeline.
+
+    Built by a parse function (possibly in another process); the embed stage
+    fills new and embeddings, and the sink writes them. resume is None on the
+    last part of a file, otherwise what parse needs to produce the next one.
+    """
+
+    def __init__(
+        self,
+        source: str,
+        path: Path,
+        metadata: Dict[str, Any],
+        chunks: List[str],
+        row: Optional[Dict[str, Any]] = None,
+        resume: Any = None,
+        text: Optional[str] = None,
+    ):
+        self.source = source
+        self.path = path
+        self.metadata = metadata
+        self.chunks = chunks
+        self.row = row  # per-file data for the sink, e.g. the Document row; usually on the first part
+        self.resume = resume
+        self.text = text  # the part's decoded text, for sinks that store it
+        self.ids = [chunk_id(chunk, source) for chunk in chunks]
+        self.seconds = 0.0
+        # Shared by every chunk of the file, so the sink can still add to it (e.g. document_id)
+        self.chunk_metadata: Dict[str, Any] = dict(metadata)
+        self.new: List[Record] = []
+        self.embeddings: Optional[np.ndarray] = None
+
+    @property
+    def records(self) -> List[Record]:
+        return [(chunk, self.chunk_metadata, id_) for chunk, id_ in zip(self.chunks, self.ids)]
+
+
+class StageMetrics:
+    """Throughput of one stage and the depth of the queue feeding it.
+
+    items_per_second is the stage's capacity while busy (all workers), so the
+    stage with the lowest value is the bottleneck.
+    """
+
+    def __init__(self, name: str, workers: int = 1):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+
+    def observe(self, queue: asyncio.Queue):
+        self.queue_depth = queue.qsize()
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "workers": self.workers,
+            "items": self.items,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "items_per_second": round(self.items * self.workers / self.busy_seconds, 1) if self.busy_seconds else 0.0,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth
+        }
+
+
+class IngestPipeline:
+    """Parse, embed and store files in concurrent stages joined by bounded queues.
+
+    - parse runs in a process pool (or a thread when parse_workers is 0) and
+      turns (source, path, metadata, resume) into a ParsedFile holding one part
+      of the file, starting with resume None; it must be picklable. A part with
+      resume set is followed by the next one, parsed while it is embedded.
+    - embedding runs on one dedicated thread, over batches of up to batch_files
+      parts or batch_chunks chunks, and skips chunks already stored.
+    - sink is awaited with each embedded batch, one batch at a time; it stores
+      rows and calls write_vectors. The parts of a file reach it in order.
+
+    A full queue stops the stage before it, so at most queue_size parts wait
+    between any two stages however large the import or its files are. Failures
+    are reported per file through on_error and do not stop the run; the parts
+    of a file after a failed one are dropped.
+    """
+
+    def __init__(
+        self,
+        parse: Callable[..., ParsedFile],
+        sink: Callable[[List[ParsedFile]], Awaitable[None]],
+        vector_store: VectorStore,
+        on_error: Optional[Callable[[str, str, Exception], None]] = None,
+        parse_workers: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        batch_files: Optional[int] = None,
+        batch_chunks: Optional[int] = None,
+    ):
+        self.parse = parse
+        self.sink = sink
+        self.vector_store = vector_store
+        self.on_error = on_error or (lambda source, stage, error: logger.error(f"Error processing {source} ({stage}): {str(error)}"))
+        self.parse_workers = rag_settings.INGEST_PARSE_WORKERS if parse_workers is None else parse_workers
+        self.queue_size = queue_size or rag_settings.INGEST_QUEUE_SIZE
+        self.batch_files = batch_files or rag_settings.DB_BATCH_SIZE
+        self.batch_chunks = batch_chunks or rag_settings.WRITE_BATCH_SIZE
+        self.stages = {
+            "parse": StageMetrics("parse", max(self.parse_workers, 1)),
+            "embed": StageMetrics("embed"),
+            "sink": StageMetrics("sink"),
+        }
+        self.changed = False
+        self.failed: Set[str] = set()
+
+    def metrics(self) -> Dict[str, Dict[str, float]]:
+        return {name: stage.as_dict() for name, stage in self.stages.items()}
+
+    async def run(self, jobs: Iterable[Tuple[str, Path, Dict[str, Any]]]) -> Dict[str, Dict[str, float]]:
+        parse_pool: Executor = (
+            # spawn, not fork: the parent process runs threads (writers, pools)
+            ProcessPoolExecutor(self.parse_workers, mp_context=multiprocessing.get_context("spawn"))
+            if self.parse_workers > 0 else ThreadPoolExecutor(1, thread_name_prefix="ingest-parse")
+        )
+        embed_pool = ThreadPoolExecutor(1, thread_name_prefix="ingest-embed")
+        parsed: asyncio.Queue = asyncio.Queue(self.queue_size)
+        embed_q: asyncio.Queue = asyncio.Queue(self.queue_size)
+        sink_q: asyncio.Queue = asyncio.Queue(self.queue_size)
+        tasks = [
+            asyncio.create_task(self._feed(jobs, parse_pool, parsed)),
+            asyncio.create_task(self._collect(parsed, embed_q, parse_pool)),
+            asyncio.create_task(self._embed(embed_q, sink_q, embed_pool)),
+            asyncio.create_task(self._store(sink_q)),
+        ]
+        try:
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in pending:
+                task.cancel()
+            for task in done:
+                task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            parse_pool.shutdown(wait=False, cancel_futures=True)
+            embed_pool.shutdown(wait=True)
+            await asyncio.to_thread(self.vector_store.commit, self.changed)
+        metrics = self.metrics()
+        logger.info(f"Ingestion pipeline finished: {metrics}")
+        return metrics
+
+    def _fail(self, source: str, stage: str, error: Exception):
+        if source not in self.failed:
+            self.failed.add(source)
+            self.on_error(source, stage, error)
+
+    async def _feed(self, jobs, pool: Executor, parsed: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        for source, path, metadata in jobs:
+            future = loop.run_in_executor(pool, self.parse, source, path, metadata, None)
+            # Blocks once queue_size files are parsing or parsed but not yet embedded
+            await parsed.put((source, path, metadata, future))
+            self.stages["parse"].observe(parsed)
+        await parsed.put(None)
+
+    async def _collect(self, parsed: asyncio.Queue, embed_q: asyncio.Queue, pool: Executor):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await parsed.get()
+            if item is None:
+                break
+            source, path, metadata, future = item
+            while future is not None:
+                try:
+                    file = await future
+                except Exception as e:
+                    self._fail(source, "parse", e)
+                    break
+                # The next part is parsed while this one is embedded
+                future = loop.run_in_executor(pool, self.parse, source, path, metadata, file.resume) if file.resume is not None else None
+                self.stages["parse"].items += 1
+                self.stages["parse"].busy_seconds += file.seconds
+                await embed_q.put(file)
+                self.stages["embed"].observe(embed_q)
+        await embed_q.put(None)
+
+    async def _embed(self, embed_q: asyncio.Queue, sink_q: asyncio.Queue, pool: Executor):
+        loop = asyncio.get_running_loop()
+        finished = False
+        while not finished:
+            batch: List[ParsedFile] = []
+            chunks = 0
+            # Take what is ready, up to the batch limits, waiting only for the first file
+            while len(batch) < self.batch_files and chunks < self.batch_chunks:
+                if batch and embed_q.empty():
+                    break
+                file = await embed_q.get()
+                if file is None:
+                    finished = True
+                    break
+                batch.append(file)
+                chunks += len(file.chunks)
+            if not batch:
+                continue
+            started = time.perf_counter()
+            try:
+                encoded = await loop.run_in_executor(pool, self._encode_batch, batch)
+            except Exception as e:
+                for file in batch:
+                    self._fail(file.source, "embed", e)
+                continue
+            self.stages["embed"].items += encoded
+            self.stages["embed"].busy_seconds += time.perf_counter() - started
+            await sink_q.put(batch)
+            self.stages["sink"].observe(sink_q)
+        await sink_q.put(None)
+
+    def _encode_batch(self, batch: List[ParsedFile]) -> int:
+        """Encode the chunks of batch that are not stored yet; returns how many"""
+        records = [record for file in batch for record in file.records]
+        remaining = {id_ for _, _, id_ in self.vector_store.new_records(records)}
+        texts: List[str] = []
+        for file in batch:
+            file.new = []
+            for record in file.records:
+                if record[2] in remaining:
+                    remaining.discard(record[2])
+                    file.new.append(record)
+            texts.extend(text for text, _, _ in file.new)
+        if not texts:
+            return 0
+        embeddings = np.asarray(self.vector_store.encode(texts))
+        offset = 0
+        for file in batch:
+            file.embeddings = embeddings[offset:offset + len(file.new)]
+            offset += len(file.new)
+        return len(texts)
+
+    async def _store(self, sink_q: asyncio.Queue):
+        while True:
+            batch = await sink_q.get()
+            if batch is None:
+                break
+            batch = [file for file in batch if file.source not in self.failed]
+            if not batch:
+                continue
+            started = time.perf_counter()
+            try:
+                await self.sink(batch)
+            except Exception as e:
+                for file in batch:
+                    self._fail(file.source, "store", e)
+                continue
+            self.stages["sink"].items += len(batch)
+            self.stages["sink"].busy_seconds += time.perf_counter() - started
+
+    async def write_vectors(self, files: List[ParsedFile]) -> Tuple[int, int]:
+        """Write the embedded chunks of files (for use by sinks); returns (stored, skipped)"""
+        records = [record for file in files for record in file.new]
+        embeddings = [file.embeddings for file in files if file.new]
+
+        def write():
+            self.vector_store.index_lexically([record for file in files for record in file.records])
+            if records:
+                self.vector_store.write(records, np.concatenate(embeddings))
+
+        await asyncio.to_thread(write)
+        self.changed = self.changed or bool(records)
+        return len(records), sum(len(file.chunks) for file in files) - len(records)
@@ -0,0 +1,274 @@
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import logging
+import math
+import os
+import re
+import threading
+import numpy as np
+from ..core.config import settings
+from ..core.rag_config import rag_settings
+
+logger = logging.getLogger(__name__)
+
+# Words, numbers and codes such as ISINs, "SP-2024/01" or acronyms like מט"ח
+_TOKEN = re.compile(r"[^\W_]+(?:['\"׳״./-][^\W_]+)*")
+_CODE_SEPARATORS = re.compile(r"[./-]")
+# Cantillation and vowel points; maqaf (U+05BE) is turned into a space first
+_NIQQUD = re.compile(r"[\u0591-\u05BD\u05BF-\u05C7]")
+
+# One-letter Hebrew prefixes (and, the, in, to, from, that)
+HEBREW_PREFIXES = "והבלמש"
+MAX_PREFIXES = 2
+MIN_STEM_LENGTH = 3
+
+_MAX_TF = np.iinfo(np.uint16).max
+
+
+def _is_hebrew(ch: str) -> bool:
+    return "א" <= ch <= "ת"
+
+
+def tokenize(text: str) -> Iterator[str]:
+    """Index terms of text.
+
+    Codes also yield their parts, and Hebrew words also yield the forms with up
+    to two prefix letters removed, so "ובהשקעה" matches "השקעה".
+    """
+    text = _NIQQUD.sub("", text.replace("\u05BE", " ")).casefold()
+    for match in _TOKEN.finditer(text):
+        token = match.group()
+        yield token
+        if _CODE_SEPARATORS.search(token):
+            for part in _CODE_SEPARATORS.split(token):
+                if part:
+                    yield part
+        elif _is_hebrew(token[0]):
+            stem = token
+            for _ in range(MAX_PREFIXES):
+                if stem[0] not in HEBREW_PREFIXES or len(stem) - 1 < MIN_STEM_LENGTH:
+                    break
+                stem = stem[1:]
+                yield stem
+
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence[str]], k: Optional[int] = None) -> List[str]:
+    """Merge ranked id lists; each list contributes 1 / (k + rank) per id"""
+    k = k if k is not None else rag_settings.RRF_K
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, id_ in enumerate(ranking, start=1):
+            scores[id_] = scores.get(id_, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class LexicalIndex:
+    """Incremental BM25 inverted index.
+
+    Each term's postings are two compact arrays (document numbers as uint32,
+    term frequencies as uint16), appended to as documents are added. Deleted
+    documents are masked out and dropped when the index is compacted.
+    """
+
+    def __init__(self, path: Optional[Path] = None, k1: Optional[float] = None, b: Optional[float] = None):
+        self.path = Path(path) if path is not None else None
+        self.k1 = k1 if k1 is not None else rag_settings.BM25_K1
+        self.b = b if b is not None else rag_settings.BM25_B
+        self._lock = threading.RLock()
+        self._clear()
+        self._loaded_mtime: Optional[int] = None
+        self._dirty = False
+        self.reload()
+
+    def _clear(self):
+        self._terms: Dict[str, int] = {}
+        self._postings_docs: List[array] = []
+        self._postings_tfs: List[array] = []
+        self._ids: List[str] = []
+        self._doc_of: Dict[str, int] = {}
+        self._lengths = array("I")
+        self._alive = array("B")
+        self._live_length = 0
+
+    def __len__(self) -> int:
+        return len(self._doc_of)
+
+    def __contains__(self, id_: str) -> bool:
+        return id_ in self._doc_of
+
+    def add(self, ids: Iterable[str], texts: Iterable[str]) -> int:
+        """Index texts under ids; ids already indexed are skipped"""
+        added = 0
+        with self._lock:
+            for id_, text in zip(ids, texts):
+                if id_ in self._doc_of:
+                    continue
+                doc = len(self._ids)
+                counts: Dict[str, int] = {}
+                length = 0
+                for term in tokenize(text):
+                    counts[term] = counts.get(term, 0) + 1
+                    length += 1
+                for term, count in counts.items():
+                    term_id = self._terms.get(term)
+                    if term_id is None:
+                        term_id = self._terms[term] = len(self._postings_docs)
+                        self._postings_docs.append(array("I"))
+                        self._postings_tfs.append(array("H"))
+                    self._postings_docs[term_id].append(doc)
+                    self._postings_tfs[term_id].append(min(count, _MAX_TF))
+                self._ids.append(id_)
+                self._doc_of[id_] = doc
+                self._lengths.append(length)
+                self._alive.append(1)
+                self._live_length += length
+                added += 1
+            self._dirty = self._dirty or bool(added)
+        return added
+
+    def delete(self, ids: Iterable[str]) -> int:
+        deleted = 0
+        with self._lock:
+            for id_ in ids:
+                doc = self._doc_of.pop(id_, None)
+                if doc is None:
+                    continue
+                self._alive[doc] = 0
+                self._live_length -= self._lengths[doc]
+                deleted += 1
+            if deleted:
+                self._dirty = True
+                if len(self._ids) - len(self._doc_of) > 0.25 * len(self._ids):
+                    self._compact()
+        return deleted
+
+    def search(self, query: str, n_results: int = 10) -> List[Tuple[str, float]]:
+        """(id, BM25 score) of the best matching documents, best first"""
+        terms = set(tokenize(query))
+        with self._lock:
+            self._maybe_reload()
+            live = len(self._doc_of)
+            if not live or not terms:
+                return []
+            lengths = np.frombuffer(self._lengths, dtype=np.uint32).astype(np.float32)
+            scores = np.zeros(len(self._ids), dtype=np.float32)
+            norm = self.k1 * (1 - self.b + self.b * lengths / (self._live_length / live))
+            for term in terms:
+                term_id = self._terms.get(term)
+                if term_id is None:
+                    continue
+                # Copies, so the arrays stay appendable (no exported buffers)
+                docs = np.frombuffer(self._postings_docs[term_id], dtype=np.uint32).astype(np.int64)
+                tfs = np.frombuffer(self._postings_tfs[term_id], dtype=np.uint16).astype(np.float32)
+                df = len(docs)
+                idf = math.log(1 + (live - df + 0.5) / (df + 0.5))
+                scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm[docs])
+            scores[np.frombuffer(self._alive, dtype=np.uint8) == 0] = 0
+            matched = np.flatnonzero(scores)
+            if not len(matched):
+                return []
+            k = min(n_results, len(matched))
+            top = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+            top = top[np.argsort(-scores[top])]
+            return [(self._ids[doc], float(scores[doc])) for doc in top]
+
+    def _compact(self):
+        """Renumber live documents and drop postings of deleted ones"""
+        alive = np.frombuffer(self._alive, dtype=np.uint8).astype(bool)
+        renumber = np.cumsum(alive, dtype=np.int64) - 1
+        terms, docs_lists, tfs_lists = {}, [], []
+        for term, term_id in self._terms.items():
+            docs = np.frombuffer(self._postings_docs[term_id], dtype=np.uint32).astype(np.int64)
+            keep = alive[docs]
+            if not keep.any():
+                continue
+            tfs = np.frombuffer(self._postings_tfs[term_id], dtype=np.uint16)[keep]
+            terms[term] = len(docs_lists)
+            docs_lists.append(array("I", renumber[docs[keep]].astype(np.uint32).tobytes()))
+            tfs_lists.append(array("H", tfs.tobytes()))
+        ids = [id_ for id_, keep in zip(self._ids, alive) if keep]
+        lengths = np.frombuffer(self._lengths, dtype=np.uint32)[alive]
+
+        self._terms, self._postings_docs, self._postings_tfs = terms, docs_lists, tfs_lists
+        self._ids = ids
+        self._doc_of = {id_: doc for doc, id_ in enumerate(ids)}
+        self._lengths = array("I", lengths.tobytes())
+        self._alive = array("B", bytes([1]) * len(ids))
+        self._live_length = int(lengths.sum())
+
+    # Persistence
+
+    def save(self) -> bool:
+        """Write the index to path if it changed; readers in other workers pick it up"""
+        with self._lock:
+            if self.path is None or not self._dirty:
+                return False
+            self._compact()
+            terms = sorted(self._terms, key=self._terms.get)
+            offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum([len(docs) for docs in self._postings_docs])
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp, "wb") as f:
+                np.savez(
+                    f,
+                    terms=np.array(terms, dtype=str),
+                    offsets=offsets,
+                    docs=np.frombuffer(b"".join(d.tobytes() for d in self._postings_docs), dtype=np.uint32),
+                    tfs=np.frombuffer(b"".join(t.tobytes() for t in self._postings_tfs), dtype=np.uint16),
+                    ids=np.array(self._ids, dtype=str),
+                    lengths=np.frombuffer(self._lengths, dtype=np.uint32),
+                )
+            os.replace(tmp, self.path)
+            self._loaded_mtime = self.path.stat().st_mtime_ns
+            self._dirty = False
+            logger.info(f"Saved lexical index ({len(self)} documents, {len(terms)} terms) to {self.path}")
+            return True
+
+    def reload(self):
+        """Load the saved index, replacing what is in memory"""
+        with self._lock:
+            if self.path is None or not self.path.exists():
+                return
+            with np.load(self.path, allow_pickle=False) as data:
+                terms = data["terms"].tolist()
+                offsets = data["offsets"]
+                docs, tfs = data["docs"], data["tfs"]
+                self._clear()
+                for term_id, term in enumerate(terms):
+                    start, end = offsets[term_id], offsets[term_id + 1]
+                    self._terms[term] = term_id
+                    self._postings_docs.append(array("I", docs[start:end].tobytes()))
+                    self._postings_tfs.append(array("H", tfs[start:end].tobytes()))
+                self._ids = data["ids"].tolist()
+                self._lengths = array("I", data["lengths"].astype(np.uint32).tobytes())
+            self._doc_of = {id_: doc for doc, id_ in enumerate(self._ids)}
+            self._alive = array("B", bytes([1]) * len(self._ids))
+            self._live_length = sum(self._lengths)
+            self._loaded_mtime = self.path.stat().st_mtime_ns
+            self._dirty = False
+
+    def _maybe_reload(self):
+        # Another process (e.g. an ingestion run) saved a newer index
+        if self.path is None or self._dirty:
+            return
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._loaded_mtime:
+            self.reload()
+
+
+_indexes: Dict[str, LexicalIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_lexical_index(name: str) -> LexicalIndex:
+    """The process-wide lexical index for a collection, stored next to the vectors"""
+    with _indexes_lock:
+        index = _indexes.get(name)
+        if index is None:
+            index = _indexes[name] = LexicalIndex(Path(settings.KNOWLEDGE_BASE_PATH) / "lexical" / f"{name}.npz")
+        return index
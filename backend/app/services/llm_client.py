@@ -0,0 +1,185 @@
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Dict, List, Optional
+import importlib.util
+import json
+import logging
+import threading
+import httpx
+from ..core.config import settings
+from ..core.lazy import register_warm_up
+
+logger = logging.getLogger(__name__)
+
+Messages = List[Dict[str, str]]
+
+
+def _build_http_client(base_url: str = "") -> httpx.AsyncClient:
+    """Create a long-lived pooled HTTP client using the configured limits"""
+    http2 = settings.LLM_HTTP2
+    if http2 and importlib.util.find_spec("h2") is None:
+        logger.warning("HTTP/2 requested but the 'h2' package is not installed, falling back to HTTP/1.1")
+        http2 = False
+
+    return httpx.AsyncClient(
+        base_url=base_url,
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=settings.LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY
+        ),
+        timeout=_timeout(None)
+    )
+
+
+def _timeout(seconds: Optional[float]) -> httpx.Timeout:
+    return httpx.Timeout(seconds or settings.LLM_READ_TIMEOUT, connect=settings.LLM_CONNECT_TIMEOUT)
+
+
+class LLMClient(ABC):
+    """Async chat-completion client holding one connection pool for its backend"""
+
+    model: str
+    temperature: float
+
+    @abstractmethod
+    async def complete(self, messages: Messages, temperature: Optional[float] = None, timeout: Optional[float] = None) -> str:
+        """Return the full completion for the messages"""
+
+    @abstractmethod
+    def stream(self, messages: Messages, temperature: Optional[float] = None, timeout: Optional[float] = None) -> AsyncIterator[str]:
+        """Yield completion tokens as they arrive"""
+
+    @abstractmethod
+    async def aclose(self) -> None:
+        """Close the underlying connection pool"""
+
+
+class OpenAIClient(LLMClient):
+    def __init__(self):
+        self.model = settings.OPENAI_MODEL
+        self.temperature = settings.OPENAI_TEMPERATURE
+        # Imported here: the SDK is one of the slowest imports at startup
+        from openai import AsyncOpenAI
+        self._http_client = _build_http_client()
+        self._client = AsyncOpenAI(
+            api_key=settings.validate_openai_key,
+            http_client=self._http_client,
+            max_retries=settings.LLM_MAX_RETRIES
+        )
+
+    async def complete(self, messages: Messages, temperature: Optional[float] = None, timeout: Optional[float] = None) -> str:
+        response = await self._client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=self.temperature if temperature is None else temperature,
+            timeout=_timeout(timeout)
+        )
+        return response.choices[0].message.content
+
+    async def stream(self, messages: Messages, temperature: Optional[float] = None, timeout: Optional[float] = None) -> AsyncIterator[str]:
+        stream = await self._client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=self.temperature if temperature is None else temperature,
+            timeout=_timeout(timeout),
+            stream=True
+        )
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                token = chunk.choices[0].delta.content
+                if token:
+                    yield token
+        finally:
+            await stream.close()
+
+    async def aclose(self) -> None:
+        await self._client.close()
+
+
+class OllamaClient(LLMClient):
+    def __init__(self):
+        self.model = settings.OLLAMA_MODEL
+        self.temperature = settings.OPENAI_TEMPERATURE
+        self._http_client = _build_http_client(settings.OLLAMA_HOST)
+
+    def _payload(self, messages: Messages, temperature: Optional[float], stream: bool) -> Dict:
+        return {
+            "model": self.model,
+            "messages": messages,
+            "stream": stream,
+            "options": {"temperature": self.temperature if temperature is None else temperature}
+        }
+
+    async def complete(self, messages: Messages, temperature: Optional[float] = None, timeout: Optional[float] = None) -> str:
+        response = await self._http_client.post(
+            "/api/chat",
+            json=self._payload(messages, temperature, stream=False),
+            timeout=_timeout(timeout)
+        )
+        response.raise_for_status()
+        return response.json()["message"]["content"]
+
+    async def stream(self, messages: Messages, temperature: Optional[float] = None, timeout: Optional[float] = None) -> AsyncIterator[str]:
+        # Ollama streams newline-delimited JSON objects
+        async with self._http_client.stream(
+            "POST",
+            "/api/chat",
+            json=self._payload(messages, temperature, stream=True),
+            timeout=_timeout(timeout)
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                token = chunk.get("message", {}).get("content")
+                if token:
+                    yield token
+                if chunk.get("done"):
+                    break
+
+    async def aclose(self) -> None:
+        await self._http_client.aclose()
+
+
+_BACKENDS = {
+    "openai": OpenAIClient,
+    "ollama": OllamaClient,
+}
+_clients: Dict[str, LLMClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_llm_client(backend: Optional[str] = None) -> LLMClient:
+    """Return the shared client for a backend, creating it on first use"""
+    backend = backend or settings.LLM_BACKEND
+    if backend not in _BACKENDS:
+        raise ValueError(f"Unsupported LLM backend: {backend}")
+
+    client = _clients.get(backend)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(backend)
+            if client is None:
+                client = _BACKENDS[backend]()
+                _clients[backend] = client
+                logger.info(f"Initialized {backend} LLM client (model={client.model})")
+    return client
+
+
+register_warm_up("llm_client", get_llm_client)
+
+
+async def close_llm_clients() -> None:
+    """Close every shared client, e.g. on application shutdown"""
+    with _clients_lock:
+        clients = list(_clients.items())
+        _clients.clear()
+    for backend, client in clients:
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.error(f"Error closing {backend} LLM client: {str(e)}")
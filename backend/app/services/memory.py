@@ -1,13 +1,138 @@
-from typing import Dict, List
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional
+import logging
+import threading
+import time
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _message_size(message: dict) -> int:
+    """Approximate bytes held by a message (UTF-8 payload of keys and values)"""
+    return sum(len(str(key).encode("utf-8")) + len(str(value).encode("utf-8")) for key, value in message.items())
+
+
+class _Session:
+    __slots__ = ("messages", "size", "tokens", "last_access")
+
+    def __init__(self, max_messages: int):
+        self.messages: Deque[dict] = deque(maxlen=max_messages)
+        self.size = 0
+        self.tokens = 0  # running total of precomputed message token counts
+        self.last_access = time.monotonic()
+
 
 class ConversationMemory:
-    def __init__(self):
-        self.conversations: Dict[str, List[dict]] = {}
+    """Session-scoped conversation history.
+
+    Every session keeps a fixed-size ring buffer of messages. Sessions are kept in
+    LRU order and evicted when idle for longer than the TTL, or when the number of
+    sessions or the total bytes held go over their caps.
+    """
+
+    def __init__(
+        self,
+        max_messages: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        max_sessions: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        self.max_messages = max_messages or settings.SESSION_MAX_MESSAGES
+        self.ttl_seconds = ttl_seconds or settings.SESSION_TTL_SECONDS
+        self.max_sessions = max_sessions or settings.SESSION_MAX_COUNT
+        self.max_bytes = max_bytes or settings.SESSION_MEMORY_MAX_BYTES
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._bytes = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
 
     def add_message(self, session_id: str, message: dict):
-        if session_id not in self.conversations:
-            self.conversations[session_id] = []
-        self.conversations[session_id].append(message)
+        size = _message_size(message)
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = _Session(self.max_messages)
+                self._sessions[session_id] = session
+            else:
+                self._sessions.move_to_end(session_id)
+
+            # The ring buffer drops the oldest message once full
+            if len(session.messages) == session.messages.maxlen:
+                oldest = session.messages[0]
+                dropped = _message_size(oldest)
+                session.size -= dropped
+                session.tokens -= oldest.get("tokens", 0)
+                self._bytes -= dropped
+            session.messages.append(message)
+            session.size += size
+            session.tokens += message.get("tokens", 0)
+            self._bytes += size
+            session.last_access = time.monotonic()
+
+            self._evict(keep=session_id)
+
+    def get_history(self, session_id: str, limit: Optional[int] = None) -> List[dict]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return []
+            if self._is_expired(session, time.monotonic()):
+                self._remove(session_id)
+                return []
+            self._sessions.move_to_end(session_id)
+            session.last_access = time.monotonic()
+            messages = list(session.messages)
+        return messages[-limit:] if limit else messages
+
+    def clear(self, session_id: str):
+        with self._lock:
+            if session_id in self._sessions:
+                self._remove(session_id)
+
+    def evict_expired(self) -> int:
+        """Drop idle sessions, returns how many were evicted"""
+        with self._lock:
+            return self._evict_expired(time.monotonic())
+
+    def metrics(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "messages": sum(len(s.messages) for s in self._sessions.values()),
+                "tokens": sum(s.tokens for s in self._sessions.values()),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self._evictions,
+            }
+
+    def _is_expired(self, session: _Session, now: float) -> bool:
+        return now - session.last_access > self.ttl_seconds
+
+    def _remove(self, session_id: str):
+        session = self._sessions.pop(session_id)
+        self._bytes -= session.size
+        self._evictions += 1
+
+    def _evict_expired(self, now: float) -> int:
+        # Sessions are in LRU order, so expired ones are at the front
+        evicted = 0
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if not self._is_expired(session, now):
+                break
+            self._remove(session_id)
+            evicted += 1
+        return evicted
+
+    def _evict(self, keep: str):
+        self._evict_expired(time.monotonic())
+        while self._sessions and (len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes):
+            session_id = next(iter(self._sessions))
+            if session_id == keep:
+                break
+            self._remove(session_id)
+            logger.debug(f"Evicted session {session_id} to stay under memory limits")
+
 
-    def get_history(self, session_id: str) -> List[dict]:
-        return self.conversations.get(session_id, [])
+conversation_memory = ConversationMemory()
@@ -0,0 +1,250 @@
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import hashlib
+import json
+import logging
+import threading
+import time
+import numpy as np
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+MONTHS_PER_YEAR = 12
+PERCENTILES = (5, 50, 95)
+# Path sets kept for reuse; each is scenarios x paths x months float32
+MAX_CACHED_PATH_SETS = 4
+
+
+class MarketScenario:
+    """Annual drift and volatility of the underlying under geometric Brownian motion"""
+
+    __slots__ = ("name", "drift", "volatility")
+
+    def __init__(self, name: str, drift: float, volatility: float):
+        self.name = name
+        self.drift = drift
+        self.volatility = volatility
+
+    def key(self) -> Tuple[str, float, float]:
+        return (self.name, round(self.drift, 6), round(self.volatility, 6))
+
+
+DEFAULT_SCENARIOS: List[MarketScenario] = [
+    MarketScenario("bear", -0.10, 0.30),
+    MarketScenario("base", 0.04, 0.20),
+    MarketScenario("bull", 0.12, 0.18),
+]
+
+
+def _fraction(value: Any, default: Optional[float] = None) -> Optional[float]:
+    """Levels given as 70 or 0.7 (percent or fraction) as a fraction"""
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return 1.0 if value else default
+    value = float(value)
+    return value / 100.0 if value > 2.0 else value
+
+
+def _rate(value: Any, default: Optional[float] = None) -> Optional[float]:
+    """Rates are always percent (a coupon of 2 is 2%), since small rates and fractions overlap"""
+    if value is None:
+        return default
+    return float(value) / 100.0
+
+
+class PayoffTerms:
+    """The payoff features read from product_rules.
+
+    Recognized rules: capital_protection, participation, cap, barrier {level,
+    type: european or american}, and autocall {trigger, coupon (annual),
+    frequency_months}. Levels (protection, participation, barrier, trigger)
+    are read as percentages or fractions; the cap and coupon rates are always
+    percentages.
+    """
+
+    def __init__(self, rules: Optional[Dict[str, Any]], term_months: int):
+        rules = rules or {}
+        if not term_months or term_months <= 0:
+            raise ValueError("Product has no term length to simulate")
+        self.term_months = int(term_months)
+        self.protection = _fraction(rules.get("capital_protection"), 0.0)
+        self.participation = _fraction(rules.get("participation"), 1.0)
+        self.cap = _rate(rules.get("cap"))
+
+        barrier = rules.get("barrier")
+        barrier = barrier if isinstance(barrier, dict) else {"level": barrier}
+        self.barrier = _fraction(barrier.get("level"))
+        self.barrier_continuous = str(barrier.get("type", "european")).casefold() == "american"
+
+        autocall = rules.get("autocall")
+        self.autocall_trigger = None
+        if isinstance(autocall, dict):
+            self.autocall_trigger = _fraction(autocall.get("trigger"), 1.0)
+            self.autocall_coupon = _rate(autocall.get("coupon"), 0.0)
+            frequency = int(autocall.get("frequency_months", 12))
+            if frequency < 1:
+                raise ValueError(f"Autocall frequency must be at least one month, got {frequency}")
+            self.autocall_months = np.arange(frequency, self.term_months, frequency)
+
+    @staticmethod
+    def fingerprint(rules: Optional[Dict[str, Any]], term_months: Optional[int]) -> str:
+        payload = json.dumps([rules or {}, term_months], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def payoff(self, performance: np.ndarray) -> Dict[str, np.ndarray]:
+        """Redemption per path as a fraction of notional.
+
+        performance is (scenarios, paths, months): the underlying relative to
+        its initial level at each monthly observation.
+        """
+        paths = performance[..., :self.term_months]
+        final = paths[..., -1]
+
+        upside = 1.0 + self.participation * np.maximum(final - 1.0, 0.0)
+        if self.cap is not None:
+            upside = np.minimum(upside, 1.0 + self.cap)
+        downside = np.maximum(final, self.protection)
+        breached = np.zeros(final.shape, dtype=bool)
+        if self.barrier is not None:
+            breached = (paths.min(axis=-1) if self.barrier_continuous else final) < self.barrier
+            # Above the barrier the capital is returned in full
+            downside = np.where(breached, downside, 1.0)
+        payoff = np.where(final >= 1.0, upside, downside)
+        life = np.full(final.shape, float(self.term_months))
+
+        called = np.zeros(final.shape, dtype=bool)
+        if self.autocall_trigger is not None and len(self.autocall_months):
+            observed = paths[..., self.autocall_months - 1] >= self.autocall_trigger
+            called = observed.any(axis=-1)
+            call_month = self.autocall_months[observed.argmax(axis=-1)].astype(np.float64)
+            payoff = np.where(called, 1.0 + self.autocall_coupon * call_month / MONTHS_PER_YEAR, payoff)
+            life = np.where(called, call_month, life)
+            breached &= ~called
+
+        return {"payoff": payoff, "life": life, "breached": breached, "called": called}
+
+
+def _summary(outcome: Dict[str, np.ndarray], scenarios: Sequence[MarketScenario], terms: PayoffTerms) -> Dict[str, Dict[str, Any]]:
+    payoff, life = outcome["payoff"], outcome["life"]
+    annualized = payoff ** (MONTHS_PER_YEAR / life) - 1.0
+    percentiles = np.percentile(payoff - 1.0, PERCENTILES, axis=-1)
+    results = {}
+    for i, scenario in enumerate(scenarios):
+        results[scenario.name] = {
+            "expected_return": round(float(payoff[i].mean() - 1.0), 4),
+            "expected_annual_return": round(float(annualized[i].mean()), 4),
+            "return_percentiles": {f"p{p}": round(float(percentiles[j, i]), 4) for j, p in enumerate(PERCENTILES)},
+            "loss_probability": round(float((payoff[i] < 1.0).mean()), 4),
+            "barrier_breach_probability": round(float(outcome["breached"][i].mean()), 4) if terms.barrier is not None else None,
+            "autocall_probability": round(float(outcome["called"][i].mean()), 4) if terms.autocall_trigger is not None else None,
+            "expected_life_months": round(float(life[i].mean()), 1),
+        }
+    return results
+
+
+def describe_scenarios(results: Dict[str, Dict[str, Any]]) -> str:
+    """One or two sentences on the simulated outcomes, for product explanations"""
+    base = results.get("base") or next(iter(results.values()))
+    others = ", ".join(
+        f"{name}: {stats['return_percentiles']['p50']:.1%}" for name, stats in results.items() if stats is not base
+    )
+    text = f"In simulated markets the median return is {base['return_percentiles']['p50']:.1%} in the base case"
+    text += f" ({others})" if others else ""
+    worst = max(results.items(), key=lambda item: item[1]["loss_probability"])
+    text += f", with a {base['loss_probability']:.0%} chance of a loss ({worst[1]['loss_probability']:.0%} in the {worst[0]} case)."
+    if base["barrier_breach_probability"] is not None:
+        text += f" The barrier is breached in {base['barrier_breach_probability']:.0%} of base-case scenarios."
+    if base["autocall_probability"] is not None:
+        text += f" It is redeemed early (autocalled) in {base['autocall_probability']:.0%} of them, after {base['expected_life_months']:.0f} months on average."
+    return text
+
+
+class PayoffSimulator:
+    """Monte Carlo scenario payoffs for structured products.
+
+    One set of monthly paths per (scenarios, path count, seed) is generated for
+    the longest term requested and shared by every product, so a batch of
+    products costs one path generation plus a vectorized payoff per product.
+    The same seed gives the same results. Results are cached by product rules
+    hash, term, scenarios, path count and seed.
+    """
+
+    def __init__(self, n_paths: Optional[int] = None, seed: Optional[int] = None, max_entries: Optional[int] = None):
+        self.n_paths = n_paths or settings.SIMULATION_PATHS
+        self.seed = seed if seed is not None else settings.SIMULATION_SEED
+        self.max_entries = max_entries or settings.SIMULATION_CACHE_MAX_ENTRIES
+        self._results: "OrderedDict[Tuple, Dict[str, Dict[str, Any]]]" = OrderedDict()
+        self._paths: "OrderedDict[Tuple, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def paths(self, scenarios: Sequence[MarketScenario], months: int) -> np.ndarray:
+        """Underlying performance, (scenarios, paths, months), from common random numbers"""
+        key = (tuple(s.key() for s in scenarios), self.n_paths, self.seed)
+        with self._lock:
+            cached = self._paths.get(key)
+            if cached is not None and cached.shape[-1] >= months:
+                self._paths.move_to_end(key)
+                return cached
+        dt = 1.0 / MONTHS_PER_YEAR
+        # Drawn month by month, so the first months are the same however long the horizon
+        shocks = np.random.default_rng(self.seed).standard_normal((months, self.n_paths), dtype=np.float32).T
+        drift = np.array([(s.drift - 0.5 * s.volatility ** 2) * dt for s in scenarios], dtype=np.float32)
+        volatility = np.array([s.volatility * np.sqrt(dt) for s in scenarios], dtype=np.float32)
+        log_paths = np.cumsum(drift[:, None, None] + volatility[:, None, None] * shocks[None], axis=-1)
+        performance = np.exp(log_paths)
+        with self._lock:
+            self._paths[key] = performance
+            if len(self._paths) > MAX_CACHED_PATH_SETS:
+                self._paths.popitem(last=False)
+        return performance
+
+    def simulate(self, product, scenarios: Optional[Sequence[MarketScenario]] = None) -> Optional[Dict[str, Dict[str, Any]]]:
+        return self.simulate_many([product], scenarios)[0]
+
+    def simulate_many(self, products: Iterable, scenarios: Optional[Sequence[MarketScenario]] = None) -> List[Optional[Dict[str, Dict[str, Any]]]]:
+        """Scenario statistics per product (by scenario name); None for products that cannot be simulated"""
+        scenarios = list(scenarios or DEFAULT_SCENARIOS)
+        scenario_key = tuple(s.key() for s in scenarios)
+        products = list(products)
+        results: List[Optional[Dict[str, Dict[str, Any]]]] = [None] * len(products)
+        pending: List[Tuple[int, Tuple, PayoffTerms]] = []
+        with self._lock:
+            for i, product in enumerate(products):
+                key = (PayoffTerms.fingerprint(product.product_rules, product.term_length), scenario_key, self.n_paths, self.seed)
+                cached = self._results.get(key)
+                if cached is not None:
+                    self._results.move_to_end(key)
+                    self._hits += 1
+                    results[i] = cached
+                    continue
+                try:
+                    terms = PayoffTerms(product.product_rules, product.term_length)
+                except (ValueError, TypeError) as e:
+                    logger.warning(f"Cannot simulate product {getattr(product, 'id', None)}: {str(e)}")
+                    continue
+                self._misses += 1
+                pending.append((i, key, terms))
+        if not pending:
+            return results
+
+        started = time.perf_counter()
+        performance = self.paths(scenarios, max(terms.term_months for _, _, terms in pending))
+        computed = [(i, key, _summary(terms.payoff(performance), scenarios, terms)) for i, key, terms in pending]
+        with self._lock:
+            for i, key, summary in computed:
+                results[i] = self._results[key] = summary
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+        logger.info(f"Simulated {len(pending)} products x {len(scenarios)} scenarios x {self.n_paths} paths in {time.perf_counter() - started:.3f}s")
+        return results
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._results), "hits": self._hits, "misses": self._misses, "path_sets": len(self._paths)}
+
+
+payoff_simulator = PayoffSimulator()
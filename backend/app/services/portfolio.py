@@ -0,0 +1,356 @@
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+import asyncio
+import copy
+import logging
+import threading
+import time
+import numpy as np
+from sqlalchemy import event, func, inspect, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, object_session
+from ..core.config import settings
+from ..db.session import SessionLocal
+from ..models.models import ClientInvestment, StructuredProduct
+
+logger = logging.getLogger(__name__)
+
+# Investments in these states are no longer exposure
+CLOSED_STATUSES = ("matured", "cancelled")
+
+# Maturity ladder: days-until-maturity edges and the bucket names around them
+LADDER_EDGES = np.array([0, 91, 182, 365, 730, 1825])
+LADDER_BUCKETS = ["matured", "0-3m", "3-6m", "6-12m", "1-2y", "2-5y", "5y+", "no date"]
+
+UNKNOWN = "unknown"
+MAX_CACHED_RESULTS = 5000
+
+Row = Tuple[int, int, int, float, Optional[datetime], Optional[str], Optional[str], Optional[str]]
+
+
+class _Codes:
+    """Grow-only table of category codes, shared by every version of the columns"""
+
+    def __init__(self):
+        self.values: List[str] = [UNKNOWN]
+        self._codes: Dict[str, int] = {UNKNOWN: 0}
+
+    def encode(self, values: Iterable[Optional[str]]) -> np.ndarray:
+        codes = []
+        for value in values:
+            value = value or UNKNOWN
+            code = self._codes.get(value)
+            if code is None:
+                code = self._codes[value] = len(self.values)
+                self.values.append(value)
+            codes.append(code)
+        return np.array(codes, dtype=np.int32)
+
+
+def _to_day(value: Optional[datetime]) -> np.datetime64:
+    if value is None:
+        return np.datetime64("NaT", "D")
+    return np.datetime64(value.date() if isinstance(value, datetime) else value, "D")
+
+
+class PortfolioColumns:
+    """Open investments as arrays, sorted by client so one client's rows are a slice"""
+
+    FIELDS = ("id", "client_id", "product_id", "amount", "maturity", "currency", "risk_level")
+
+    def __init__(self, arrays: Dict[str, np.ndarray], product_names: Dict[int, str], version: int):
+        order = np.lexsort((arrays["id"], arrays["client_id"]))
+        for field in self.FIELDS:
+            setattr(self, field, arrays[field][order])
+        self.product_names = product_names
+        self.version = version
+
+    @staticmethod
+    def arrays(rows: List[Row], currencies: _Codes, risk_levels: _Codes) -> Dict[str, np.ndarray]:
+        return {
+            "id": np.array([row[0] for row in rows], dtype=np.int64),
+            "client_id": np.array([row[1] if row[1] is not None else -1 for row in rows], dtype=np.int64),
+            "product_id": np.array([row[2] if row[2] is not None else -1 for row in rows], dtype=np.int64),
+            "amount": np.array([row[3] or 0.0 for row in rows], dtype=np.float64),
+            "maturity": np.array([_to_day(row[4]) for row in rows], dtype="datetime64[D]"),
+            "currency": currencies.encode((row[5] or "").upper() or None for row in rows),
+            "risk_level": risk_levels.encode(row[6] for row in rows),
+        }
+
+    def __len__(self) -> int:
+        return len(self.id)
+
+    def with_changes(self, removed_ids: Set[int], added: Dict[str, np.ndarray], product_names: Dict[int, str], version: int) -> "PortfolioColumns":
+        """A new version without removed_ids and with the added rows"""
+        keep = ~np.isin(self.id, np.fromiter(removed_ids, dtype=np.int64, count=len(removed_ids)))
+        arrays = {field: np.concatenate([getattr(self, field)[keep], added[field]]) for field in self.FIELDS}
+        return PortfolioColumns(arrays, {**self.product_names, **product_names}, version)
+
+    def client_rows(self, client_id: int) -> slice:
+        return slice(
+            int(np.searchsorted(self.client_id, client_id, side="left")),
+            int(np.searchsorted(self.client_id, client_id, side="right"))
+        )
+
+    def exposure(self, rows, as_of: date, currencies: _Codes, risk_levels: _Codes) -> Dict[str, Any]:
+        """Exposure and maturity ladder of the selected rows.
+
+        Amounts are never summed across currencies: every breakdown is per
+        currency.
+        """
+        amount = self.amount[rows]
+        currency = self.currency[rows]
+        n_currencies = len(currencies.values)
+
+        def per_currency(codes: np.ndarray, n_codes: int) -> np.ndarray:
+            # One bincount over (code, currency) pairs gives the whole table
+            return np.bincount(codes * n_currencies + currency, weights=amount, minlength=n_codes * n_currencies).reshape(n_codes, n_currencies)
+
+        def as_dict(values: np.ndarray) -> Dict[str, float]:
+            return {currencies.values[code]: round(float(values[code]), 2) for code in np.flatnonzero(values)}
+
+        by_currency = np.bincount(currency, weights=amount, minlength=n_currencies)
+        by_risk = per_currency(self.risk_level[rows], len(risk_levels.values))
+
+        products, product_codes = np.unique(self.product_id[rows], return_inverse=True)
+        product_amounts = np.bincount(product_codes, weights=amount, minlength=len(products))
+        product_counts = np.bincount(product_codes, minlength=len(products))
+        # A product has a single currency, so any of its rows gives it
+        product_currency = np.zeros(len(products), dtype=np.int32)
+        product_currency[product_codes] = currency
+
+        maturity = self.maturity[rows]
+        dated = ~np.isnat(maturity)
+        days = (maturity - np.datetime64(as_of, "D")).astype(np.int64)
+        buckets = np.where(dated, np.digitize(days, LADDER_EDGES), len(LADDER_BUCKETS) - 1)
+        ladder_amounts = per_currency(buckets, len(LADDER_BUCKETS))
+        ladder_counts = np.bincount(buckets, minlength=len(LADDER_BUCKETS))
+
+        return {
+            "positions": int(len(amount)),
+            "by_currency": as_dict(by_currency),
+            "by_risk_level": {
+                risk_levels.values[code]: as_dict(by_risk[code])
+                for code in np.flatnonzero(by_risk.any(axis=1))
+            },
+            "by_product": [
+                {
+                    "product_id": int(products[i]),
+                    "name": self.product_names.get(int(products[i])),
+                    "currency": currencies.values[product_currency[i]],
+                    "amount": round(float(product_amounts[i]), 2),
+                    "positions": int(product_counts[i])
+                }
+                for i in np.argsort(-product_amounts, kind="stable")
+            ],
+            "maturity_ladder": [
+                {"bucket": LADDER_BUCKETS[i], "positions": int(ladder_counts[i]), "amounts": as_dict(ladder_amounts[i])}
+                for i in range(len(LADDER_BUCKETS)) if ladder_counts[i]
+            ],
+        }
+
+
+class PortfolioEngine:
+    """Per-client and firm-wide exposure over the open investments.
+
+    Investments are loaded once into PortfolioColumns. Committed writes to
+    ClientInvestment in this process are applied incrementally: only the
+    changed rows are read back, and only the affected clients' cached results
+    are dropped. Product changes and bulk statements reload everything, and
+    so does PORTFOLIO_TTL_SECONDS, which picks up other workers' writes.
+    """
+
+    def __init__(self, session_factory: Optional[Callable[[], AsyncSession]] = None, ttl_seconds: Optional[float] = None):
+        self.session_factory = session_factory or SessionLocal
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.PORTFOLIO_TTL_SECONDS
+        self.currencies = _Codes()
+        self.risk_levels = _Codes()
+        self._columns: Optional[PortfolioColumns] = None
+        self._loaded_at = 0.0
+        self._version = 0
+        self._reload = True
+        self._changes: Dict[int, Set[int]] = {}  # investment id -> affected client ids
+        self._changes_lock = threading.Lock()
+        self._lock: Optional[asyncio.Lock] = None
+        self._results: "OrderedDict[Tuple[Optional[int], date], Dict[str, Any]]" = OrderedDict()
+        self._full_reloads = 0
+        self._incremental_updates = 0
+        # Where sessions keep this engine's pending changes until commit; per
+        # instance, so another engine (or a second import of this module) never
+        # takes them
+        self.changes_key = ("portfolio_changes", id(self))
+        self.reload_key = ("portfolio_reload", id(self))
+
+    def record_changes(self, changes: Dict[int, Set[int]]):
+        with self._changes_lock:
+            for investment_id, client_ids in changes.items():
+                self._changes.setdefault(investment_id, set()).update(client_ids)
+
+    def invalidate(self):
+        self._reload = True
+
+    async def client_portfolio(self, client_id: int, as_of: Optional[date] = None) -> Dict[str, Any]:
+        """The client's open positions by product, currency and risk level, with a maturity ladder"""
+        columns = await self._current()
+        return self._cached((client_id, as_of or date.today()), lambda day: {
+            "client_id": client_id,
+            **columns.exposure(columns.client_rows(client_id), day, self.currencies, self.risk_levels)
+        }, columns)
+
+    async def firm_exposure(self, as_of: Optional[date] = None) -> Dict[str, Any]:
+        columns = await self._current()
+        return self._cached((None, as_of or date.today()), lambda day: {
+            # -1 marks positions without a client
+            "clients": int(len(np.unique(columns.client_id[columns.client_id != -1]))),
+            **columns.exposure(slice(None), day, self.currencies, self.risk_levels)
+        }, columns)
+
+    def _cached(self, key: Tuple[Optional[int], date], compute: Callable[[date], Dict[str, Any]], columns: PortfolioColumns) -> Dict[str, Any]:
+        result = self._results.get(key)
+        if result is None:
+            result = compute(key[1])
+            result.update(as_of=key[1].isoformat(), version=columns.version)
+            self._results[key] = result
+            if len(self._results) > MAX_CACHED_RESULTS:
+                self._results.popitem(last=False)
+        else:
+            self._results.move_to_end(key)
+        # Callers get their own copy, so changing it cannot alter the cached result
+        return copy.deepcopy(result)
+
+    async def _current(self) -> PortfolioColumns:
+        if self._up_to_date():
+            return self._columns
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._reload or self._columns is None or self._expired():
+                await self._reload_all()
+            elif self._changes:
+                await self._apply_changes()
+        return self._columns
+
+    def _expired(self) -> bool:
+        return time.monotonic() - self._loaded_at >= self.ttl_seconds
+
+    def _up_to_date(self) -> bool:
+        return self._columns is not None and not self._reload and not self._changes and not self._expired()
+
+    async def _load(self, ids: Optional[List[int]] = None) -> List[Row]:
+        statement = (
+            select(
+                ClientInvestment.id, ClientInvestment.client_id, ClientInvestment.product_id,
+                ClientInvestment.amount, ClientInvestment.maturity_date,
+                StructuredProduct.currency, StructuredProduct.risk_level, StructuredProduct.name
+            )
+            .outerjoin(StructuredProduct, ClientInvestment.product_id == StructuredProduct.id)
+            .where(or_(ClientInvestment.status.is_(None), func.lower(ClientInvestment.status).notin_(CLOSED_STATUSES)))
+        )
+        if ids is not None:
+            statement = statement.where(ClientInvestment.id.in_(ids))
+        async with self.session_factory() as db:
+            return [tuple(row) for row in await db.execute(statement)]
+
+    async def _reload_all(self):
+        # Cleared before reading, so changes committed during the load are applied next time
+        self._reload = False
+        with self._changes_lock:
+            self._changes = {}
+        try:
+            rows = await self._load()
+        except BaseException:
+            # Failed or cancelled (a caller's timeout): the next call reloads again
+            self._reload = True
+            raise
+        self._version += 1
+        self._columns = PortfolioColumns(
+            PortfolioColumns.arrays(rows, self.currencies, self.risk_levels),
+            {row[2]: row[7] for row in rows if row[2] is not None},
+            self._version
+        )
+        self._loaded_at = time.monotonic()
+        self._results.clear()
+        self._full_reloads += 1
+        logger.info(f"Portfolio columns version {self._version} loaded with {len(rows)} open investments")
+
+    async def _apply_changes(self):
+        with self._changes_lock:
+            changes, self._changes = self._changes, {}
+        try:
+            rows = await self._load(list(changes))
+        except BaseException:
+            # Failed or cancelled: keep the changes for the next call
+            self.record_changes(changes)
+            raise
+        self._version += 1
+        self._columns = self._columns.with_changes(
+            set(changes),
+            PortfolioColumns.arrays(rows, self.currencies, self.risk_levels),
+            {row[2]: row[7] for row in rows if row[2] is not None},
+            self._version
+        )
+        # Only the affected clients and the firm-wide totals are recomputed
+        affected = {client_id for client_ids in changes.values() for client_id in client_ids} | {None}
+        for key in [key for key in self._results if key[0] in affected]:
+            del self._results[key]
+        self._incremental_updates += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "version": self._version,
+            "investments": len(self._columns) if self._columns is not None else 0,
+            "cached_results": len(self._results),
+            "full_reloads": self._full_reloads,
+            "incremental_updates": self._incremental_updates,
+        }
+
+
+portfolio_engine = PortfolioEngine()
+
+
+def _session_changes(session: Optional[Session]) -> Dict[int, Set[int]]:
+    return session.info.setdefault(portfolio_engine.changes_key, {}) if session is not None else {}
+
+
+def _record_investment(_mapper, _connection, target: ClientInvestment):
+    # Both the current and any previous owner of a reassigned investment are affected
+    client_ids = {target.client_id, *inspect(target).attrs.client_id.history.deleted}
+    _session_changes(object_session(target)).setdefault(target.id, set()).update(c for c in client_ids if c is not None)
+
+
+def _mark_reload(session: Optional[Session]):
+    if session is not None:
+        session.info[portfolio_engine.reload_key] = True
+
+
+for _event_name in ("after_insert", "after_update", "after_delete"):
+    event.listen(ClientInvestment, _event_name, _record_investment)
+    # A product's currency or risk level changes every position in it
+    event.listen(StructuredProduct, _event_name, lambda _mapper, _connection, target: _mark_reload(object_session(target)))
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _reload_on_bulk_change(orm_execute_state):
+    # Bulk statements bypass the mapper events and do not say which rows changed
+    if orm_execute_state.is_select:
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and mapper.class_ in (ClientInvestment, StructuredProduct):
+        _mark_reload(orm_execute_state.session)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_after_commit(session: Session):
+    # Applied once committed, so the engine never reads rows that may roll back
+    changes = session.info.pop(portfolio_engine.changes_key, None)
+    if session.info.pop(portfolio_engine.reload_key, False):
+        portfolio_engine.invalidate()
+    elif changes:
+        portfolio_engine.record_changes(changes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back(session: Session):
+    session.info.pop(portfolio_engine.changes_key, None)
+    session.info.pop(portfolio_engine.reload_key, None)
@@ -1,79 +1,147 @@
-from typing import List, Dict, Any
-from sqlalchemy.orm import Session
+from typing import Any, Awaitable, Callable, Dict, List, Optional, TypeVar, Union
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..core.rag_config import rag_settings
+from ..db.session import SessionLocal
 from ..models.models import Client, StructuredProduct, Conversation, Message
+from .payoff_simulator import PayoffSimulator, describe_scenarios, payoff_simulator
+from .portfolio import PortfolioEngine, portfolio_engine
+from .product_catalog import CatalogProduct, ProductCatalog, product_catalog, risk_rank
 from .rag_service import RAGService
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
 
 class ProductAdvisor:
-    def __init__(self, db: Session):
-        self.db = db
-        self.rag_service = RAGService(db)
+    def __init__(
+        self,
+        rag_service: Optional[RAGService] = None,
+        session_factory: Optional[Callable[[], AsyncSession]] = None,
+        catalog: Optional[ProductCatalog] = None,
+        portfolio: Optional[PortfolioEngine] = None,
+        simulator: Optional[PayoffSimulator] = None
+    ):
+        self.rag_service = rag_service or RAGService()
+        # Async lookups each get their own session, so they can run at the same time
+        self.session_factory = session_factory or SessionLocal
+        self.catalog = catalog or product_catalog
+        self.portfolio = portfolio or portfolio_engine
+        self.simulator = simulator or payoff_simulator
+        # Compliance context per risk level, fetched once per advisor
+        self._compliance_rules: Dict[Optional[str], List[str]] = {}
     
-    def get_suitable_products(self, client: Client) -> List[StructuredProduct]:
-        """Find suitable products based on client's risk profile and investment goals"""
-        return self.db.query(StructuredProduct).filter(
-            StructuredProduct.risk_level == client.risk_profile,
-            StructuredProduct.is_active == True
-        ).all()
+    async def get_suitable_products_async(self, client: Client) -> List[CatalogProduct]:
+        """Active products at or below the client's risk profile, from the in-memory catalog"""
+        return (await self.catalog.get()).suitable_for(client.risk_profile)
     
-    def analyze_client_query(self, client_id: int, query: str) -> Dict[str, Any]:
-        """Analyze client query and provide relevant context for response generation"""
-        client = self.db.query(Client).filter(Client.id == client_id).first()
-        
-        # Get relevant product information
-        product_context = self.rag_service.get_product_information(query)
-        
-        # Get compliance requirements
-        compliance_context = self.rag_service.get_compliance_context(
-            product_type="structured_product",
-            risk_level=client.risk_profile
+    async def analyze_client_query_async(self, client_id: int, query: str, timeouts: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+        """Context for answering a client query, with the lookups running concurrently.
+
+        Each source has its own timeout (rag_settings.CONTEXT_TIMEOUTS, overridden
+        by timeouts). A source that fails or times out contributes an empty
+        fallback and is listed under "degraded" instead of failing the request.
+        Compliance context depends on the client's risk profile, so it starts as
+        soon as the client row (a primary key lookup) arrives. "timings" has the
+        seconds each source took.
+        """
+        timeouts = {**rag_settings.CONTEXT_TIMEOUTS, **(timeouts or {})}
+        timings: Dict[str, float] = {}
+        degraded: List[str] = []
+
+        async def timed(name: str, lookup: Awaitable[T], fallback: T) -> T:
+            started = time.perf_counter()
+            try:
+                return await asyncio.wait_for(lookup, timeouts[name])
+            except asyncio.TimeoutError:
+                logger.warning(f"Context lookup {name} timed out after {timeouts[name]}s for client {client_id}")
+            except Exception as e:
+                logger.error(f"Context lookup {name} failed for client {client_id}: {str(e)}")
+            finally:
+                timings[name] = round(time.perf_counter() - started, 4)
+            degraded.append(name)
+            return fallback
+
+        client_task = asyncio.create_task(timed("client", self._fetch_client(client_id), None))
+
+        async def compliance() -> List[str]:
+            # Shielded: a compliance timeout must not cancel the client lookup
+            client = await asyncio.shield(client_task)
+            return await asyncio.to_thread(
+                self.rag_service.get_compliance_context,
+                product_type="structured_product",
+                risk_level=client.risk_profile if client else None
+            )
+
+        client, product_context, compliance_context, recent_conversation, portfolio = await asyncio.gather(
+            client_task,
+            timed("products", asyncio.to_thread(self.rag_service.get_product_information, query), []),
+            timed("compliance", compliance(), []),
+            timed("conversation", self._fetch_recent_conversation(client_id), []),
+            timed("portfolio", self.portfolio.client_portfolio(client_id), None)
         )
-        
-        # Get conversation history
-        recent_conversation = self.get_recent_conversation_context(client_id)
-        
+
         return {
             "client_profile": {
-                "risk_profile": client.risk_profile,
-                "investment_goals": client.investment_goals
+                "risk_profile": client.risk_profile if client else None,
+                "investment_goals": client.investment_goals if client else None
             },
             "product_context": product_context,
             "compliance_context": compliance_context,
-            "conversation_history": recent_conversation
+            "conversation_history": recent_conversation,
+            "portfolio": portfolio,
+            "timings": timings,
+            "degraded": degraded
         }
     
-    def get_recent_conversation_context(self, client_id: int, limit: int = 5) -> List[Dict[str, Any]]:
-        """Retrieve recent conversation context for the client"""
-        recent_messages = self.db.query(Message).join(Conversation).\
-            filter(Conversation.client_id == client_id).\
-            order_by(Message.timestamp.desc()).\
-            limit(limit).all()
-        
+    async def _fetch_client(self, client_id: int) -> Optional[Client]:
+        async with self.session_factory() as db:
+            return await db.get(Client, client_id)
+    
+    async def _fetch_recent_conversation(self, client_id: int, limit: int = 5) -> List[Dict[str, Any]]:
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(Message).join(Conversation)
+                .where(Conversation.client_id == client_id)
+                .order_by(Message.timestamp.desc())
+                .limit(limit)
+            )
+            return self._message_context(result.scalars())
+    
+    @staticmethod
+    def _message_context(messages) -> List[Dict[str, Any]]:
         return [{
             "role": msg.role,
             "content": msg.content,
             "timestamp": msg.timestamp
-        } for msg in recent_messages]
+        } for msg in messages]
     
-    def validate_recommendation(self, product: StructuredProduct, client: Client) -> bool:
+    def validate_recommendation(self, product: Union[StructuredProduct, CatalogProduct], client: Client) -> bool:
         """Validate if a product recommendation complies with regulations and client suitability"""
-        if product.risk_level > client.risk_profile:
+        product_rank, client_rank = risk_rank(product.risk_level), risk_rank(client.risk_profile)
+        if product_rank is None or client_rank is None or product_rank > client_rank:
             return False
         
         # Get regulatory requirements
-        compliance_rules = self.rag_service.get_compliance_context(
-            product_type="structured_product",
-            risk_level=product.risk_level
-        )
+        compliance_rules = self._compliance_rules.get(product.risk_level)
+        if compliance_rules is None:
+            compliance_rules = self._compliance_rules[product.risk_level] = self.rag_service.get_compliance_context(
+                product_type="structured_product",
+                risk_level=product.risk_level
+            )
         
         # Implement compliance validation logic here
         # This is a placeholder for actual regulatory compliance checks
         return True
     
-    def generate_product_explanation(self, product: StructuredProduct, client: Client) -> str:
+    def generate_product_explanation(self, product: Union[StructuredProduct, CatalogProduct], client: Client) -> str:
         """Generate a personalized explanation of the product for the client"""
         product_info = self.rag_service.get_product_information(
             product.name,
-            language="he" if client.preferred_language == "he" else "en"
+            language="he" if getattr(client, "preferred_language", None) == "he" else "en"
         )
         
         # Implement explanation generation logic here
@@ -82,4 +150,9 @@ class ProductAdvisor:
         explanation += f"this {product.name} offers {product.expected_return}% expected return "
         explanation += f"over {product.term_length} months with {product.risk_level} risk level."
         
+        # Scenario payoffs from the product's rules (cached per rules and market parameters)
+        scenarios = self.simulator.simulate(product)
+        if scenarios:
+            explanation += " " + describe_scenarios(scenarios)
+        
         return explanation
\ No newline at end of file
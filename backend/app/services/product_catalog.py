@@ -0,0 +1,270 @@
+from bisect import bisect_left, bisect_right
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+import asyncio
+import logging
+import time
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, object_session
+from ..core.config import settings
+from ..db.session import SessionLocal
+from ..models.models import StructuredProduct
+
+logger = logging.getLogger(__name__)
+
+# Product risk levels and client risk profiles on one scale
+RISK_RANKS: Dict[str, int] = {
+    "low": 1,
+    "conservative": 1,
+    "medium": 2,
+    "moderate": 2,
+    "high": 3,
+    "aggressive": 3,
+}
+
+
+def risk_rank(level: Optional[str]) -> Optional[int]:
+    """Position of a risk level or profile on the common scale; None if unknown"""
+    return RISK_RANKS.get(level.strip().casefold()) if level else None
+
+
+class CatalogProduct:
+    """Read-only copy of a StructuredProduct row, safe to share between requests"""
+
+    __slots__ = (
+        "id", "name", "description", "risk_level", "risk_rank", "min_investment",
+        "term_length", "expected_return", "currency", "product_rules"
+    )
+
+    def __init__(self, row: StructuredProduct):
+        self.id = row.id
+        self.name = row.name
+        self.description = row.description
+        self.risk_level = row.risk_level
+        self.risk_rank = risk_rank(row.risk_level)
+        self.min_investment = row.min_investment
+        self.term_length = row.term_length
+        self.expected_return = row.expected_return
+        self.currency = row.currency
+        self.product_rules = row.product_rules
+
+    def __repr__(self) -> str:
+        return f"CatalogProduct(id={self.id}, name={self.name!r}, risk_level={self.risk_level!r})"
+
+
+class _RangeIndex:
+    """Product ids sorted by a numeric attribute, for range lookups by bisection"""
+
+    def __init__(self, products: Iterable[CatalogProduct], attribute: str):
+        pairs = sorted((getattr(p, attribute), p.id) for p in products if getattr(p, attribute) is not None)
+        self.values = [value for value, _ in pairs]
+        self.ids = [id_ for _, id_ in pairs]
+
+    def between(self, low: Optional[float] = None, high: Optional[float] = None) -> FrozenSet[int]:
+        start = bisect_left(self.values, low) if low is not None else 0
+        end = bisect_right(self.values, high) if high is not None else len(self.values)
+        return frozenset(self.ids[start:end])
+
+
+class CatalogSnapshot:
+    """Active products at one version, with the indexes built once up front"""
+
+    def __init__(self, products: Iterable[CatalogProduct], version: int):
+        self.version = version
+        self.created_at = time.monotonic()
+        self.products: Dict[int, CatalogProduct] = {p.id: p for p in products}
+        self._order = sorted(self.products)
+
+        self.by_risk: Dict[int, FrozenSet[int]] = self._group(lambda p: p.risk_rank)
+        self.by_currency: Dict[str, FrozenSet[int]] = self._group(lambda p: (p.currency or "").upper() or None)
+        self.by_term = _RangeIndex(self.products.values(), "term_length")
+        self.by_min_investment = _RangeIndex(self.products.values(), "min_investment")
+        # Products at or below each risk rank, highest expected return first
+        self._suitable: Dict[int, List[CatalogProduct]] = {}
+        for rank in sorted(set(RISK_RANKS.values())):
+            eligible = [p for p in self.products.values() if p.risk_rank is not None and p.risk_rank <= rank]
+            self._suitable[rank] = sorted(eligible, key=lambda p: (-(p.expected_return or 0.0), p.id))
+
+    def _group(self, key: Callable[[CatalogProduct], Any]) -> Dict[Any, FrozenSet[int]]:
+        groups: Dict[Any, set] = {}
+        for product in self.products.values():
+            value = key(product)
+            if value is not None:
+                groups.setdefault(value, set()).add(product.id)
+        return {value: frozenset(ids) for value, ids in groups.items()}
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def get(self, product_id: int) -> Optional[CatalogProduct]:
+        return self.products.get(product_id)
+
+    def suitable_for(self, risk_profile: Optional[str]) -> List[CatalogProduct]:
+        """Products whose risk level does not exceed the client's profile"""
+        rank = risk_rank(risk_profile)
+        return list(self._suitable.get(rank, [])) if rank is not None else []
+
+    def filter(
+        self,
+        risk_profile: Optional[str] = None,
+        risk_level: Optional[str] = None,
+        currency: Optional[str] = None,
+        min_term: Optional[int] = None,
+        max_term: Optional[int] = None,
+        amount: Optional[float] = None,
+    ) -> List[CatalogProduct]:
+        """Products matching every given criterion, by id.
+
+        risk_profile keeps products suitable for a client with that profile;
+        risk_level keeps one level exactly; amount keeps products whose minimum
+        investment it covers.
+        """
+        candidates: List[FrozenSet[int]] = []
+        if risk_profile is not None:
+            candidates.append(frozenset(p.id for p in self.suitable_for(risk_profile)))
+        if risk_level is not None:
+            candidates.append(self.by_risk.get(risk_rank(risk_level), frozenset()))
+        if currency is not None:
+            candidates.append(self.by_currency.get(currency.upper(), frozenset()))
+        if min_term is not None or max_term is not None:
+            candidates.append(self.by_term.between(min_term, max_term))
+        if amount is not None:
+            candidates.append(self.by_min_investment.between(high=amount))
+        if not candidates:
+            return [self.products[id_] for id_ in self._order]
+        # Intersect starting from the smallest set
+        candidates.sort(key=len)
+        ids = set(candidates[0]).intersection(*candidates[1:])
+        return [self.products[id_] for id_ in sorted(ids)]
+
+
+class ProductCatalog:
+    """Process-wide snapshot of the active products.
+
+    Readers get the current snapshot without touching the database. Writes to
+    StructuredProduct through any session in this process invalidate it, and
+    the next read reloads it once, however many requests are waiting. Changes
+    made by other processes are picked up within PRODUCT_CATALOG_TTL_SECONDS.
+    """
+
+    def __init__(self, session_factory: Optional[Callable[[], AsyncSession]] = None, ttl_seconds: Optional[float] = None):
+        self.session_factory = session_factory or SessionLocal
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.PRODUCT_CATALOG_TTL_SECONDS
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._version = 0
+        self._stale = True
+        self._lock: Optional[asyncio.Lock] = None
+        self._reloads = 0
+        self._reload_seconds = 0.0
+        # Marks sessions that changed products, until they commit; per instance,
+        # so another catalog (or a second import of this module) never takes it
+        self.changed_key = ("product_catalog_changed", id(self))
+
+    @property
+    def current(self) -> Optional[CatalogSnapshot]:
+        """The last snapshot loaded, even if stale; None before the first load"""
+        return self._snapshot
+
+    @property
+    def fresh(self) -> bool:
+        snapshot = self._snapshot
+        return (
+            snapshot is not None and not self._stale
+            and time.monotonic() - snapshot.created_at < self.ttl_seconds
+        )
+
+    def invalidate(self):
+        self._stale = True
+
+    async def get(self) -> CatalogSnapshot:
+        """The current snapshot, reloaded first if it is stale"""
+        if self.fresh:
+            return self._snapshot
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not self.fresh:
+                await self.refresh()
+        return self._snapshot
+
+    async def refresh(self) -> CatalogSnapshot:
+        # Cleared before reading, so a write during the load marks it stale again
+        self._stale = False
+        started = time.perf_counter()
+        try:
+            async with self.session_factory() as db:
+                result = await db.execute(select(StructuredProduct).where(StructuredProduct.is_active == True))
+                rows = list(result.scalars())
+        except BaseException:
+            # Failed or cancelled: the old snapshot must not pass for fresh
+            self._stale = True
+            raise
+        self._reload_seconds = time.perf_counter() - started
+        return self.load_rows(rows)
+
+    def load_rows(self, rows: Iterable[StructuredProduct]) -> CatalogSnapshot:
+        """Build and publish a new snapshot from product rows"""
+        self._version += 1
+        snapshot = CatalogSnapshot((CatalogProduct(row) for row in rows if row.is_active is not False), self._version)
+        self._snapshot = snapshot
+        self._reloads += 1
+        logger.info(f"Product catalog version {snapshot.version} loaded with {len(snapshot)} products")
+        return snapshot
+
+    async def warm_up(self):
+        """Load the catalog at startup; on failure the first request retries"""
+        try:
+            await self.get()
+        except Exception as e:
+            logger.error(f"Product catalog warm-up failed: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            "version": snapshot.version if snapshot else 0,
+            "products": len(snapshot) if snapshot else 0,
+            "fresh": self.fresh,
+            "reloads": self._reloads,
+            "reload_seconds": round(self._reload_seconds, 4),
+        }
+
+
+product_catalog = ProductCatalog()
+
+
+def _mark_changed(session: Optional[Session]):
+    # Invalidate now and again once committed: a reload between the flush and
+    # the commit would otherwise cache the old rows until the TTL expires
+    product_catalog.invalidate()
+    if session is not None:
+        session.info[product_catalog.changed_key] = True
+
+
+def _invalidate_on_change(_mapper, _connection, target):
+    _mark_changed(object_session(target))
+
+
+# Row-level writes through the ORM unit of work
+for _event_name in ("after_insert", "after_update", "after_delete"):
+    event.listen(StructuredProduct, _event_name, _invalidate_on_change)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _invalidate_on_bulk_change(orm_execute_state):
+    # Bulk insert(), update() and delete() statements bypass the mapper events
+    if orm_execute_state.is_select:
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and mapper.class_ is StructuredProduct:
+        _mark_changed(orm_execute_state.session)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session: Session):
+    if session.info.pop(product_catalog.changed_key, False):
+        product_catalog.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back(session: Session):
+    session.info.pop(product_catalog.changed_key, None)
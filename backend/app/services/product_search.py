@@ -0,0 +1,262 @@
+from typing import Any, Dict, List, Optional, Tuple, Union
+import base64
+import json
+import logging
+import threading
+import numpy as np
+from .product_catalog import CatalogProduct, CatalogSnapshot, risk_rank
+
+logger = logging.getLogger(__name__)
+
+SORT_FIELDS = ("expected_return", "term_length", "min_investment")
+# Rows tested per step of a scan; the scan stops once a page is filled
+SCAN_BLOCK = 4096
+
+RuleValue = Union[bool, int, float, str]
+
+
+def flatten_rules(rules: Any, prefix: str = "") -> Dict[str, RuleValue]:
+    """product_rules as dotted scalar fields: {"barrier": {"level": 70}} -> {"barrier.level": 70}"""
+    flat: Dict[str, RuleValue] = {}
+    if not isinstance(rules, dict):
+        return flat
+    for key, value in rules.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten_rules(value, name + "."))
+        elif isinstance(value, (bool, int, float, str)):
+            flat[name] = value
+    return flat
+
+
+def _encode_cursor(payload: Dict[str, Any]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {str(e)}")
+
+
+class _Categorical:
+    """String column stored as integer codes; -1 marks a missing value"""
+
+    def __init__(self, values: List[Optional[str]]):
+        self.codes_of: Dict[str, int] = {}
+        codes = np.full(len(values), -1, dtype=np.int32)
+        for row, value in enumerate(values):
+            if value is not None:
+                codes[row] = self.codes_of.setdefault(value, len(self.codes_of))
+        self.codes = codes
+
+    def isin(self, values: List[str], rows: np.ndarray) -> np.ndarray:
+        wanted = [self.codes_of[value] for value in values if value in self.codes_of]
+        return np.isin(self.codes[rows], wanted)
+
+
+class ProductPage:
+    def __init__(self, products: List[CatalogProduct], next_cursor: Optional[str], version: int, scanned: int):
+        self.products = products
+        self.next_cursor = next_cursor
+        self.version = version
+        self.scanned = scanned
+
+
+class ProductColumns:
+    """Column store of one catalog snapshot for filtered, ranked product search.
+
+    Numeric fields are float64 arrays (NaN when missing), strings are coded
+    categoricals, and every scalar in product_rules becomes a "rules.<path>"
+    column. Row orders for each sort field and direction are computed once, so
+    a search walks rows in rank order and stops as soon as a page is filled:
+    its cost follows the page size and filter selectivity, not catalog size.
+    """
+
+    def __init__(self, snapshot: CatalogSnapshot):
+        self.version = snapshot.version
+        self.products: List[CatalogProduct] = [snapshot.products[id_] for id_ in sorted(snapshot.products)]
+        self.ids = np.array([p.id for p in self.products], dtype=np.int64)
+        self.numeric: Dict[str, np.ndarray] = {
+            field: self._floats([getattr(p, field) for p in self.products]) for field in SORT_FIELDS
+        }
+        self.numeric["risk_rank"] = self._floats([p.risk_rank for p in self.products])
+        self.categorical: Dict[str, _Categorical] = {
+            "currency": _Categorical([(p.currency or "").upper() or None for p in self.products])
+        }
+
+        flat = [flatten_rules(p.product_rules) for p in self.products]
+        for name in sorted({key for rules in flat for key in rules}):
+            values = [rules.get(name) for rules in flat]
+            present = [value for value in values if value is not None]
+            if all(isinstance(value, (bool, int, float)) for value in present):
+                self.numeric[f"rules.{name}"] = self._floats(values)
+            else:
+                self.categorical[f"rules.{name}"] = _Categorical([None if value is None else str(value).casefold() for value in values])
+
+        # Rank orders; ties broken by id, missing values last in both directions
+        self.orders: Dict[Tuple[str, bool], np.ndarray] = {}
+        for field in SORT_FIELDS:
+            values = self.numeric[field]
+            missing = np.isnan(values)
+            filled = np.where(missing, 0.0, values)
+            self.orders[(field, False)] = np.lexsort((self.ids, filled, missing)).astype(np.int32)
+            self.orders[(field, True)] = np.lexsort((self.ids, -filled, missing)).astype(np.int32)
+
+    @staticmethod
+    def _floats(values: List[Any]) -> np.ndarray:
+        return np.array([np.nan if value is None else float(value) for value in values], dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def search(
+        self,
+        risk_profile: Optional[str] = None,
+        risk_levels: Optional[List[str]] = None,
+        currencies: Optional[List[str]] = None,
+        term_min: Optional[float] = None,
+        term_max: Optional[float] = None,
+        min_investment_max: Optional[float] = None,
+        expected_return_min: Optional[float] = None,
+        rules: Optional[Dict[str, RuleValue]] = None,
+        rules_min: Optional[Dict[str, float]] = None,
+        rules_max: Optional[Dict[str, float]] = None,
+        sort_by: str = "expected_return",
+        descending: bool = True,
+        limit: int = 20,
+        cursor: Optional[str] = None,
+    ) -> ProductPage:
+        """One page of products matching every filter, in rank order.
+
+        rules matches flattened product_rules fields exactly; rules_min and
+        rules_max bound numeric ones. A field no product has matches nothing.
+        Pass the returned next_cursor to get the following page; a cursor from
+        an older catalog version resumes after the last product it returned.
+        """
+        if sort_by not in SORT_FIELDS:
+            raise ValueError(f"Unsupported sort field: {sort_by}")
+        if limit < 1:
+            raise ValueError("limit must be at least 1")
+        order = self.orders[(sort_by, descending)]
+        start = self._start(order, sort_by, descending, cursor) if cursor else 0
+
+        predicates = self._predicates(
+            risk_profile, risk_levels, currencies, term_min, term_max,
+            min_investment_max, expected_return_min, rules or {}, rules_min or {}, rules_max or {}
+        )
+        hits: List[int] = []
+        position = start
+        # One extra hit tells whether another page exists
+        while position < len(order) and len(hits) <= limit:
+            rows = order[position:position + SCAN_BLOCK]
+            mask = np.ones(len(rows), dtype=bool)
+            for predicate in predicates:
+                mask &= predicate(rows)
+                if not mask.any():
+                    break
+            matched = np.flatnonzero(mask)[:limit + 1 - len(hits)]
+            hits.extend((position + matched).tolist())
+            position += len(rows)
+
+        page = hits[:limit]
+        next_cursor = None
+        if len(hits) > limit:
+            last = order[page[-1]]
+            value = self.numeric[sort_by][last]
+            next_cursor = _encode_cursor({
+                "v": self.version,
+                "s": sort_by,
+                "d": descending,
+                "p": page[-1] + 1,
+                "k": [None if np.isnan(value) else float(value), int(self.ids[last])],
+            })
+        return ProductPage([self.products[order[i]] for i in page], next_cursor, self.version, position - start)
+
+    def _start(self, order: np.ndarray, sort_by: str, descending: bool, cursor: str) -> int:
+        payload = _decode_cursor(cursor)
+        try:
+            if payload["s"] != sort_by or payload["d"] != descending:
+                raise ValueError("Cursor belongs to a different sort order")
+            if payload["v"] == self.version:
+                position = int(payload["p"])
+                if not 0 <= position <= len(order):
+                    raise ValueError(f"Cursor position {position} is outside the {len(order)} results")
+                return position
+            # The catalog changed: resume after the last (value, id) returned
+            value, last_id = payload["k"]
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"Invalid cursor: {str(e)}")
+        values = self.numeric[sort_by][order]
+        ids = self.ids[order]
+        missing = np.isnan(values)
+        if value is None:
+            after = missing & (ids > last_id)
+        else:
+            beyond = values < value if descending else values > value
+            after = missing | beyond | ((values == value) & (ids > last_id))
+        following = np.flatnonzero(after)
+        return int(following[0]) if len(following) else len(order)
+
+    def _predicates(
+        self, risk_profile, risk_levels, currencies, term_min, term_max,
+        min_investment_max, expected_return_min, rules, rules_min, rules_max
+    ) -> List:
+        """Vectorized row tests, each taking an array of row numbers"""
+        predicates = []
+
+        def between(column: str, low: Optional[float] = None, high: Optional[float] = None):
+            values = self.numeric.get(column)
+            if values is None:
+                return lambda rows: np.zeros(len(rows), dtype=bool)
+            if low is not None and high is not None:
+                return lambda rows: (values[rows] >= low) & (values[rows] <= high)
+            if low is not None:
+                return lambda rows: values[rows] >= low
+            return lambda rows: values[rows] <= high
+
+        def one_of(column: str, wanted: List[str]):
+            categorical = self.categorical.get(column)
+            if categorical is None:
+                return lambda rows: np.zeros(len(rows), dtype=bool)
+            return lambda rows: categorical.isin(wanted, rows)
+
+        if risk_profile is not None:
+            predicates.append(between("risk_rank", high=risk_rank(risk_profile) or 0))
+        if risk_levels:
+            ranks = np.array([rank for rank in map(risk_rank, risk_levels) if rank is not None], dtype=np.float64)
+            predicates.append(lambda rows: np.isin(self.numeric["risk_rank"][rows], ranks))
+        if currencies:
+            predicates.append(one_of("currency", [currency.upper() for currency in currencies]))
+        if term_min is not None or term_max is not None:
+            predicates.append(between("term_length", term_min, term_max))
+        if min_investment_max is not None:
+            predicates.append(between("min_investment", high=min_investment_max))
+        if expected_return_min is not None:
+            predicates.append(between("expected_return", low=expected_return_min))
+        for name, value in rules.items():
+            column = f"rules.{name}"
+            if isinstance(value, str) and column not in self.numeric:
+                predicates.append(one_of(column, [value.casefold()]))
+            elif isinstance(value, str):
+                predicates.append(lambda rows: np.zeros(len(rows), dtype=bool))
+            else:
+                predicates.append(between(column, float(value), float(value)))
+        for name in set(rules_min) | set(rules_max):
+            predicates.append(between(f"rules.{name}", rules_min.get(name), rules_max.get(name)))
+        return predicates
+
+
+_columns: Optional[ProductColumns] = None
+_columns_lock = threading.Lock()
+
+
+def get_product_columns(snapshot: CatalogSnapshot) -> ProductColumns:
+    """The column store for a catalog snapshot, rebuilt once per catalog version"""
+    global _columns
+    with _columns_lock:
+        if _columns is None or _columns.version != snapshot.version:
+            _columns = ProductColumns(snapshot)
+            logger.info(f"Product column store built for catalog version {snapshot.version} ({len(_columns)} products)")
+        return _columns
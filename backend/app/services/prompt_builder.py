@@ -0,0 +1,157 @@
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence
+import logging
+import threading
+from ..core.config import settings
+from ..core.rag_config import rag_settings
+from ..core.lazy import LazyResource, register_warm_up
+
+logger = logging.getLogger(__name__)
+
+# Chat formats add a few tokens of framing per message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class TokenCounter:
+    """Counts tokens with the model's tokenizer, caching counts of repeated text.
+
+    The tokenizer is loaded on first use. Falls back to a character-based
+    estimate when tiktoken or its encoding files are unavailable (e.g. offline
+    builds).
+    """
+
+    def __init__(self, model: str):
+        self.model = model
+        # Warmed up through the module-level "tokenizers" task, not one task per counter
+        self._tokenizer = LazyResource(f"tokenizer:{model}", lambda: self._load_encoding(model), warm_up=False)
+        self._count_cached = lru_cache(maxsize=4096)(self._count)
+
+    @property
+    def _encoding(self):
+        return self._tokenizer.get()
+
+    def load(self):
+        """Load the tokenizer now rather than on the first count"""
+        self._tokenizer.get()
+
+    @staticmethod
+    def _load_encoding(model: str):
+        try:
+            import tiktoken
+            try:
+                return tiktoken.encoding_for_model(model)
+            except KeyError:
+                return tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            logger.warning(f"Tokenizer unavailable for {model}, estimating token counts: {str(e)}")
+            return None
+
+    def _count(self, text: str) -> int:
+        if self._encoding is not None:
+            return len(self._encoding.encode(text))
+        # Hebrew tokenizes roughly twice as densely as English
+        hebrew = sum(1 for c in text if '\u0590' <= c <= '\u05FF')
+        return (len(text) - hebrew + 3) // 4 + (hebrew + 1) // 2
+
+    def count(self, text: str) -> int:
+        return self._count_cached(text)
+
+    def count_message(self, message: Dict) -> int:
+        """Tokens for a chat message, using its precomputed count when present"""
+        tokens = message.get("tokens")
+        if tokens is None:
+            tokens = self.count(message["content"])
+        return tokens + MESSAGE_OVERHEAD_TOKENS
+
+
+_counters: Dict[str, TokenCounter] = {}
+_counters_lock = threading.Lock()
+
+
+def get_token_counter(model: str) -> TokenCounter:
+    """Return the shared counter for a model, loading the tokenizer once"""
+    with _counters_lock:
+        counter = _counters.get(model)
+        if counter is None:
+            counter = TokenCounter(model)
+            _counters[model] = counter
+        return counter
+
+
+def _warm_up_tokenizers():
+    """Load the tokenizers of the configured chat model, the chunker and any counter already created"""
+    chat_model = settings.OLLAMA_MODEL if settings.LLM_BACKEND == "ollama" else settings.OPENAI_MODEL
+    for model in (chat_model, settings.OPENAI_MODEL):
+        get_token_counter(model)
+    with _counters_lock:
+        counters = list(_counters.values())
+    for counter in counters:
+        counter.load()
+
+
+register_warm_up("tokenizers", _warm_up_tokenizers)
+
+
+class AssembledPrompt:
+    def __init__(self, messages: List[Dict[str, str]], context_chunks: List[str], history: List[Dict[str, str]], tokens: int, dropped_chunks: int, dropped_history: int):
+        self.messages = messages
+        self.context_chunks = context_chunks
+        self.history = history
+        self.tokens = tokens
+        self.dropped_chunks = dropped_chunks
+        self.dropped_history = dropped_history
+
+
+class PromptAssembler:
+    """Packs a prompt into the context window by priority.
+
+    The system prompt and the user message are always sent. Retrieved chunks
+    are added next in rank order, then history from newest to oldest (at most
+    CONVERSATION_MEMORY_K messages), as long as the total stays within
+    MAX_CONTEXT_WINDOW minus the tokens reserved for the response.
+    """
+
+    def __init__(self, counter: TokenCounter, max_tokens: Optional[int] = None, response_reserve: Optional[int] = None, max_history: Optional[int] = None):
+        self.counter = counter
+        window = max_tokens or rag_settings.MAX_CONTEXT_WINDOW
+        reserve = rag_settings.RESPONSE_TOKEN_RESERVE if response_reserve is None else response_reserve
+        self.budget = window - reserve
+        self.max_history = rag_settings.CONVERSATION_MEMORY_K if max_history is None else max_history
+
+    def assemble(self, system_prompt: str, message: str, history: Sequence[Dict] = (), context_chunks: Sequence[str] = ()) -> AssembledPrompt:
+        used = self.counter.count_message({"content": system_prompt}) + self.counter.count_message({"content": message})
+        if used > self.budget:
+            logger.warning(f"System prompt and message alone use {used} tokens, over the {self.budget} token budget")
+
+        chunks: List[str] = []
+        for chunk in context_chunks:
+            tokens = self.counter.count(chunk) + 1  # separator
+            if used + tokens <= self.budget:
+                chunks.append(chunk)
+                used += tokens
+
+        # Walk back from the newest message; stop at the first that does not fit so
+        # the kept history stays contiguous
+        recent = list(history)[-self.max_history:] if self.max_history else []
+        kept: List[Dict[str, str]] = []
+        for entry in reversed(recent):
+            tokens = self.counter.count_message(entry)
+            if used + tokens > self.budget:
+                break
+            kept.append({"role": entry["role"], "content": entry["content"]})
+            used += tokens
+        kept.reverse()
+
+        system_content = system_prompt
+        if chunks:
+            system_content += "\n\nContext:\n" + "\n".join(chunks)
+
+        messages = [{"role": "system", "content": system_content}] + kept + [{"role": "user", "content": message}]
+        return AssembledPrompt(
+            messages=messages,
+            context_chunks=chunks,
+            history=kept,
+            tokens=used,
+            dropped_chunks=len(context_chunks) - len(chunks),
+            dropped_history=len(history) - len(kept)
+        )
@@ -1,6 +1,39 @@
+from typing import List, Optional
+from ..core.rag_config import rag_settings
+from .vectorstore import VectorStore
+
+# Document types searched for each kind of context
+PRODUCT_DOC_TYPES = ["product_guide", "term_sheet", "marketing_material"]
+COMPLIANCE_DOC_TYPES = ["regulation", "risk_disclosure"]
+
+
 class RAGService:
-    def __init__(self):
+    def __init__(self, vector_store: Optional[VectorStore] = None):
         self.initialized = True
+        self._vector_store = vector_store
+
+    @property
+    def vector_store(self) -> VectorStore:
+        # Created on first use; the collection and encoder behind it are shared
+        if self._vector_store is None:
+            self._vector_store = VectorStore()
+        return self._vector_store
 
     async def query(self, text: str) -> str:
         return f"RAG response for: {text}"
+
+    def get_product_information(self, query: str, language: Optional[str] = None, n_results: Optional[int] = None) -> List[str]:
+        """Product guide, term sheet and marketing chunks relevant to query"""
+        return self._search(query, PRODUCT_DOC_TYPES, language, n_results)
+
+    def get_compliance_context(self, product_type: str, risk_level: Optional[str] = None, language: Optional[str] = None) -> List[str]:
+        """Regulation and risk disclosure chunks for a product type and risk level"""
+        query = " ".join(part for part in (product_type.replace("_", " "), risk_level, "risk suitability") if part)
+        return self._search(query, COMPLIANCE_DOC_TYPES, language)
+
+    def _search(self, query: str, document_types: List[str], language: Optional[str] = None, n_results: Optional[int] = None) -> List[str]:
+        conditions = [{"document_type": {"$in": document_types}}]
+        if language:
+            conditions.append({"language": language})
+        where = conditions[0] if len(conditions) == 1 else {"$and": conditions}
+        return self.vector_store.search(query, n_results or rag_settings.MAX_RELEVANT_CHUNKS, where=where)
@@ -0,0 +1,182 @@
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+import logging
+import re
+import threading
+import time
+import numpy as np
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+Partition = Tuple[str, bool]
+
+
+def normalize_query(text: str) -> str:
+    """Collapse whitespace and case so trivially different questions share a key"""
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+
+def _default_encoder():
+    # Reuse the encoder loaded for the vector store instead of loading a second model
+    from .vectorstore import get_encoder
+    return get_encoder()
+
+
+class CacheKey:
+    """A query bound to its partition; the embedding is computed at most once"""
+
+    def __init__(self, cache: "SemanticCache", query: str, language: str, is_qualified: bool):
+        self.cache = cache
+        self.text = normalize_query(query)
+        self.partition: Partition = (language, bool(is_qualified))
+        self._embedding: Optional[np.ndarray] = None
+
+    @property
+    def embedding(self) -> np.ndarray:
+        if self._embedding is None:
+            self._embedding = self.cache.embed(self.text)
+        return self._embedding
+
+
+class _Entry:
+    __slots__ = ("text", "embedding", "response", "created_at")
+
+    def __init__(self, text: str, embedding: np.ndarray, response: str):
+        self.text = text
+        self.embedding = embedding
+        self.response = response
+        self.created_at = time.monotonic()
+
+
+class _PartitionStore:
+    def __init__(self):
+        self.entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._matrix: Optional[np.ndarray] = None
+        self._texts = []
+
+    def matrix(self) -> Tuple[np.ndarray, list]:
+        # Stacked lazily; rebuilt only after entries were added or removed
+        if self._matrix is None:
+            self._texts = list(self.entries)
+            self._matrix = np.stack([self.entries[t].embedding for t in self._texts]) if self._texts else None
+        return self._matrix, self._texts
+
+    def changed(self):
+        self._matrix = None
+
+
+class SemanticCache:
+    """Response cache matched on embedding similarity.
+
+    Entries are partitioned by language and qualified-investor flag, so an answer
+    is never served across those boundaries. Exact (normalized) repeats are
+    answered without running the encoder at all.
+    """
+
+    def __init__(
+        self,
+        threshold: Optional[float] = None,
+        ttl_seconds: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        encoder_factory: Optional[Callable] = None,
+    ):
+        self.threshold = threshold if threshold is not None else settings.SEMANTIC_CACHE_THRESHOLD
+        self.ttl_seconds = ttl_seconds or settings.SEMANTIC_CACHE_TTL_SECONDS
+        self.max_entries = max_entries or settings.SEMANTIC_CACHE_MAX_ENTRIES
+        self._encoder_factory = encoder_factory or _default_encoder
+        self._partitions: Dict[Partition, _PartitionStore] = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._exact_hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    def key(self, query: str, language: str, is_qualified: bool) -> CacheKey:
+        return CacheKey(self, query, language, is_qualified)
+
+    def embed(self, text: str) -> np.ndarray:
+        embedding = self._encoder_factory().encode(text, normalize_embeddings=True)
+        return np.asarray(embedding, dtype=np.float32)
+
+    def get(self, key: CacheKey) -> Optional[str]:
+        with self._lock:
+            store = self._partitions.get(key.partition)
+            if store is None or not store.entries:
+                self._misses += 1
+                return None
+            self._expire(store)
+
+            entry = store.entries.get(key.text)
+            if entry is not None:
+                store.entries.move_to_end(key.text)
+                self._hits += 1
+                self._exact_hits += 1
+                return entry.response
+
+        # Encoding happens outside the lock
+        embedding = key.embedding
+
+        with self._lock:
+            if self._partitions.get(key.partition) is not store:
+                # Invalidated (and possibly refilled) while encoding
+                self._misses += 1
+                return None
+            matrix, texts = store.matrix()
+            if matrix is None:
+                self._misses += 1
+                return None
+            scores = matrix @ embedding
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold or texts[best] not in store.entries:
+                self._misses += 1
+                return None
+            store.entries.move_to_end(texts[best])
+            self._hits += 1
+            return store.entries[texts[best]].response
+
+    def set(self, key: CacheKey, response: str):
+        embedding = key.embedding
+        with self._lock:
+            store = self._partitions.setdefault(key.partition, _PartitionStore())
+            store.entries[key.text] = _Entry(key.text, embedding, response)
+            store.entries.move_to_end(key.text)
+            while len(store.entries) > self.max_entries:
+                store.entries.popitem(last=False)
+            store.changed()
+
+    def invalidate(self, language: Optional[str] = None, is_qualified: Optional[bool] = None):
+        """Drop cached answers, e.g. after the knowledge base changed"""
+        with self._lock:
+            for partition in list(self._partitions):
+                if language is not None and partition[0] != language:
+                    continue
+                if is_qualified is not None and partition[1] != bool(is_qualified):
+                    continue
+                del self._partitions[partition]
+            self._invalidations += 1
+        logger.info("Semantic cache invalidated")
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": sum(len(s.entries) for s in self._partitions.values()),
+                "hits": self._hits,
+                "exact_hits": self._exact_hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "invalidations": self._invalidations,
+            }
+
+    def _expire(self, store: _PartitionStore):
+        # Entries are kept in LRU order, but TTL is measured from creation
+        now = time.monotonic()
+        expired = [text for text, entry in store.entries.items() if now - entry.created_at > self.ttl_seconds]
+        for text in expired:
+            del store.entries[text]
+        if expired:
+            store.changed()
+
+
+semantic_cache = SemanticCache()
@@ -0,0 +1,134 @@
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+import asyncio
+import hashlib
+import json
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+
+def request_key(model: str, temperature: float, messages: List[Dict[str, str]]) -> str:
+    """Hash the parts of an LLM request that determine its answer.
+
+    Message content is whitespace- and case-normalized so the same question typed
+    slightly differently still shares one upstream call.
+    """
+    normalized = [
+        {"role": m["role"], "content": re.sub(r"\s+", " ", m["content"]).strip().casefold()}
+        for m in messages
+    ]
+    payload = json.dumps([model, temperature, normalized], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _SharedStream:
+    """One upstream token stream replayed to every subscriber"""
+
+    def __init__(self, source: AsyncIterator[str], on_finish: Callable[["_SharedStream"], None]):
+        self.tokens: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._changed = asyncio.Condition()
+        self._on_finish = on_finish
+        self._task = asyncio.ensure_future(self._pump(source))
+
+    async def _pump(self, source: AsyncIterator[str]):
+        try:
+            async for token in source:
+                async with self._changed:
+                    self.tokens.append(token)
+                    self._changed.notify_all()
+        except asyncio.CancelledError:
+            self.error = asyncio.CancelledError()
+        except Exception as e:
+            self.error = e
+        finally:
+            self._on_finish(self)
+            await source.aclose()
+            async with self._changed:
+                self.done = True
+                self._changed.notify_all()
+
+    def subscribe(self) -> AsyncIterator[str]:
+        # Counted on joining, not on the first iteration, so a subscriber that
+        # has not started reading yet keeps the upstream call alive
+        self.subscribers += 1
+        return self._replay()
+
+    async def _replay(self) -> AsyncIterator[str]:
+        position = 0
+        try:
+            while True:
+                async with self._changed:
+                    await self._changed.wait_for(lambda: position < len(self.tokens) or self.done)
+                    pending = self.tokens[position:]
+                    finished = self.done
+                for token in pending:
+                    yield token
+                position += len(pending)
+                if finished and position >= len(self.tokens):
+                    break
+            if self.error is not None:
+                raise self.error
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                # Last listener left, stop paying for the upstream call
+                self._on_finish(self)
+                self._task.cancel()
+
+
+class SingleFlight:
+    """Coalesce identical concurrent calls into one.
+
+    Callers passing the same key while a call is in flight wait for (or subscribe
+    to) that call instead of starting their own. Keys are forgotten as soon as the
+    call finishes, so results are never served stale.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+        self._streams: Dict[str, _SharedStream] = {}
+        self.coalesced = 0
+        self.upstream_calls = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._calls.get(key)
+        if future is None:
+            self.upstream_calls += 1
+            future = asyncio.ensure_future(fn())
+            self._calls[key] = future
+            future.add_done_callback(lambda f: self._forget(self._calls, key, f))
+        else:
+            self.coalesced += 1
+            logger.debug(f"Coalesced request {key[:12]}")
+        # A cancelled waiter must not cancel the call for everyone else
+        return await asyncio.shield(future)
+
+    def stream(self, key: str, factory: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        shared = self._streams.get(key)
+        if shared is None or shared.done:
+            self.upstream_calls += 1
+            shared = _SharedStream(factory(), lambda s: self._forget(self._streams, key, s))
+            self._streams[key] = shared
+        else:
+            self.coalesced += 1
+            logger.debug(f"Coalesced stream {key[:12]}")
+        return shared.subscribe()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._calls) + len(self._streams),
+            "upstream_calls": self.upstream_calls,
+            "coalesced": self.coalesced,
+        }
+
+    @staticmethod
+    def _forget(registry: Dict[str, Any], key: str, value: Any):
+        if registry.get(key) is value:
+            del registry[key]
+
+
+llm_singleflight = SingleFlight()
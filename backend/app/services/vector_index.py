@@ -0,0 +1,426 @@
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+import json
+import logging
+import operator
+import os
+import threading
+import numpy as np
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, run a single writer
+    fcntl = None
+from ..core.config import settings
+from ..core.rag_config import rag_settings
+
+logger = logging.getLogger(__name__)
+
+# Rows scored per step, so float16 storage is widened a block at a time
+_SCORE_BLOCK_ROWS = 65536
+
+_HEADER = "index.json"
+_WRITE_LOCK = "write.lock"
+
+_COMPARISONS = {"$gt": operator.gt, "$gte": operator.ge, "$lt": operator.lt, "$lte": operator.le}
+
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class NumpyVectorIndex:
+    """In-process vector index stored in a memory-mapped file.
+
+    Speaks the subset of the Chroma collection API that VectorStore uses (add,
+    upsert, get, delete, query, count), so it can stand in for a collection.
+
+    Embeddings are unit-normalized on the way in and stored row by row in
+    vectors-<generation>.bin; documents, metadata and ids are appended to
+    records-<generation>.jsonl. index.json records how many rows are valid and
+    which are deleted, and is replaced atomically after every write; its first
+    line holds a commit counter, so readers only parse the rest when it moved.
+    Every worker maps the same file read-only, so the vectors live once in the
+    page cache; a worker picks up another process's writes on its next call.
+
+    Writers in any thread or process hold an exclusive flock on write.lock
+    while they catch up with the header, append and publish, so concurrent
+    writers never interleave rows. Where fcntl is unavailable only one process
+    may write to an index.
+    """
+
+    def __init__(self, path: Path, dtype: Optional[str] = None, compact_ratio: float = 0.25):
+        self.path = Path(path)
+        self.dtype = np.dtype(dtype or rag_settings.VECTOR_INDEX_DTYPE)
+        self.compact_ratio = compact_ratio
+        self._lock = threading.RLock()
+        self._write_depth = 0
+        self._commit: Optional[int] = None
+        self._generation = 0
+        self._dim: Optional[int] = None
+        self._count = 0
+        self._vectors: Optional[np.memmap] = None
+        self._ids: List[str] = []
+        self._documents: List[str] = []
+        self._metadatas: List[dict] = []
+        self._records_offset = 0
+        self._row_of: Dict[str, int] = {}
+        self._alive = np.zeros(0, dtype=bool)
+        self._columns: Dict[str, np.ndarray] = {}
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._refresh()
+
+    # Storage
+
+    def _vectors_file(self, generation: int) -> Path:
+        return self.path / f"vectors-{generation}.bin"
+
+    def _records_file(self, generation: int) -> Path:
+        return self.path / f"records-{generation}.jsonl"
+
+    def _refresh(self, attempts: int = 3):
+        """Catch up with writes made by this or another process"""
+        for attempt in range(attempts):
+            try:
+                with open(self.path / _HEADER, "r", encoding="utf-8") as f:
+                    commit = json.loads(f.readline())["commit"]
+                    if commit == self._commit:
+                        return
+                    header = json.loads(f.readline())
+            except FileNotFoundError:
+                return
+            try:
+                self._load(header)
+            except FileNotFoundError:
+                # A compaction removed this generation after the header was read
+                self._reset_state()
+                self._generation = -1
+                self._alive, self._row_of, self._columns = np.zeros(0, dtype=bool), {}, {}
+                if attempt == attempts - 1:
+                    raise
+                continue
+            self._commit = commit
+            return
+
+    def _load(self, header: Dict[str, Any]):
+        if header["generation"] != self._generation or header["count"] < self._count:
+            self._reset_state()
+        self._generation = header["generation"]
+        self._dim = header["dim"]
+        self.dtype = np.dtype(header["dtype"])
+        self._read_records(header["count"])
+        self._map_vectors(header["count"])
+        self._alive = np.ones(header["count"], dtype=bool)
+        self._alive[header["deleted"]] = False
+        self._row_of = {id_: row for row, id_ in enumerate(self._ids) if self._alive[row]}
+        self._columns = {}
+
+    def _reset_state(self):
+        self._count = 0
+        self._vectors = None
+        self._ids, self._documents, self._metadatas = [], [], []
+        self._records_offset = 0
+
+    def _read_records(self, count: int):
+        if count == len(self._ids):
+            return
+        with open(self._records_file(self._generation), "rb") as f:
+            f.seek(self._records_offset)
+            while len(self._ids) < count:
+                line = f.readline()
+                record = json.loads(line)
+                self._ids.append(record["id"])
+                self._documents.append(record["document"])
+                self._metadatas.append(record["metadata"])
+            self._records_offset = f.tell()
+
+    def _map_vectors(self, count: int):
+        self._count = count
+        if count == 0:
+            self._vectors = None
+            return
+        self._vectors = np.memmap(self._vectors_file(self._generation), dtype=self.dtype, mode="r", shape=(count, self._dim))
+
+    @contextmanager
+    def _writing(self) -> Iterator[None]:
+        """Hold the thread lock and the cross-process write lock, up to date with the header"""
+        with self._lock:
+            if self._write_depth:
+                # Nested call (upsert) already holds the file lock
+                self._write_depth += 1
+                try:
+                    yield
+                finally:
+                    self._write_depth -= 1
+                return
+            with open(self.path / _WRITE_LOCK, "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self._write_depth = 1
+                try:
+                    self._refresh()
+                    yield
+                finally:
+                    # Closing the file releases the lock
+                    self._write_depth = 0
+
+    def _write_header(self):
+        self._commit = (self._commit or 0) + 1
+        header = {
+            "generation": self._generation,
+            "dim": self._dim,
+            "dtype": self.dtype.name,
+            "count": len(self._ids),
+            "deleted": np.flatnonzero(~self._alive).tolist(),
+        }
+        tmp = self.path / (_HEADER + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"commit": self._commit}) + "\n")
+            json.dump(header, f)
+        os.replace(tmp, self.path / _HEADER)
+
+    def _append(self, vectors: np.ndarray, documents: List[str], metadatas: List[dict], ids: List[str]):
+        # Drop rows a crashed writer appended but never published in the header
+        for path, size in (
+            (self._vectors_file(self._generation), len(self._ids) * (self._dim or 0) * self.dtype.itemsize),
+            (self._records_file(self._generation), self._records_offset),
+        ):
+            if path.exists() and path.stat().st_size > size:
+                os.truncate(path, size)
+        with open(self._vectors_file(self._generation), "ab") as f:
+            f.write(np.ascontiguousarray(vectors, dtype=self.dtype).tobytes())
+        with open(self._records_file(self._generation), "a", encoding="utf-8") as f:
+            for id_, document, metadata in zip(ids, documents, metadatas):
+                f.write(json.dumps({"id": id_, "document": document, "metadata": metadata}, ensure_ascii=False) + "\n")
+        # Rows become visible to readers only once the header counts them
+        first = len(self._ids)
+        self._ids.extend(ids)
+        self._documents.extend(documents)
+        self._metadatas.extend(metadatas)
+        self._alive = np.concatenate([self._alive, np.ones(len(ids), dtype=bool)])
+        for offset, id_ in enumerate(ids):
+            self._row_of[id_] = first + offset
+        self._write_header()
+        self._records_offset = self._records_file(self._generation).stat().st_size
+        self._map_vectors(len(self._ids))
+        self._columns = {}
+
+    def _compact(self):
+        """Rewrite live rows into a new generation, dropping deleted ones"""
+        keep = np.flatnonzero(self._alive)
+        vectors = np.array(self._vectors[keep]) if self._vectors is not None else np.zeros((0, self._dim or 0), dtype=self.dtype)
+        ids = [self._ids[row] for row in keep]
+        documents = [self._documents[row] for row in keep]
+        metadatas = [self._metadatas[row] for row in keep]
+        old = self._generation
+
+        self._reset_state()
+        self._generation = old + 1
+        self._alive = np.zeros(0, dtype=bool)
+        self._row_of = {}
+        self._vectors_file(self._generation).touch()
+        self._records_file(self._generation).touch()
+        self._append(vectors, documents, metadatas, ids)
+        # Readers still mapping the old generation keep their view until they refresh
+        for stale in (self._vectors_file(old), self._records_file(old)):
+            stale.unlink(missing_ok=True)
+        logger.info(f"Compacted vector index {self.path} to {len(ids)} rows")
+
+    # Collection API
+
+    def count(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._row_of)
+
+    def add(
+        self,
+        embeddings: Sequence[Sequence[float]],
+        documents: Optional[List[str]] = None,
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+    ):
+        if ids is None:
+            raise ValueError("ids are required")
+        vectors = _normalize_rows(np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1))
+        documents = documents if documents is not None else [""] * len(ids)
+        metadatas = [metadata or {} for metadata in metadatas] if metadatas is not None else [{}] * len(ids)
+        with self._writing():
+            if self._dim is None:
+                self._dim = vectors.shape[1]
+            elif vectors.shape[1] != self._dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match index dimension {self._dim}")
+
+            seen = set()
+            keep = []
+            for i, id_ in enumerate(ids):
+                if id_ in self._row_of or id_ in seen:
+                    continue
+                seen.add(id_)
+                keep.append(i)
+            if len(keep) < len(ids):
+                logger.warning(f"Skipped {len(ids) - len(keep)} ids already in {self.path}")
+            if keep:
+                self._append(vectors[keep], [documents[i] for i in keep], [metadatas[i] for i in keep], [ids[i] for i in keep])
+
+    def upsert(
+        self,
+        embeddings: Sequence[Sequence[float]],
+        documents: Optional[List[str]] = None,
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+    ):
+        with self._writing():
+            self.delete(ids=ids)
+            self.add(embeddings=embeddings, documents=documents, metadatas=metadatas, ids=ids)
+
+    def delete(self, ids: Optional[Iterable[str]] = None, where: Optional[Dict[str, Any]] = None):
+        with self._writing():
+            rows = [self._row_of[id_] for id_ in ids or () if id_ in self._row_of]
+            if where is not None:
+                rows.extend(np.flatnonzero(self._alive & self._filter(where)).tolist())
+            if not rows:
+                return
+            self._alive[rows] = False
+            for row in rows:
+                self._row_of.pop(self._ids[row], None)
+            if (~self._alive).sum() > self.compact_ratio * len(self._alive):
+                self._compact()
+            else:
+                self._write_header()
+
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        include: Sequence[str] = ("documents", "metadatas"),
+    ) -> Dict[str, list]:
+        with self._lock:
+            self._refresh()
+            if ids is not None:
+                rows = np.array([self._row_of[id_] for id_ in ids if id_ in self._row_of], dtype=np.int64)
+                if where is not None and len(rows):
+                    rows = rows[self._filter(where)[rows]]
+            else:
+                mask = self._alive & self._filter(where) if where is not None else self._alive
+                rows = np.flatnonzero(mask)
+            rows = rows[offset:offset + limit if limit is not None else None]
+            return self._result(rows, include)
+
+    def query(
+        self,
+        query_embeddings: Sequence[Sequence[float]],
+        n_results: int = 10,
+        where: Optional[Dict[str, Any]] = None,
+        include: Sequence[str] = ("documents", "metadatas", "distances"),
+    ) -> Dict[str, list]:
+        """Top-k by cosine similarity; where pre-filters rows before scoring"""
+        queries = _normalize_rows(np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1))
+        results: Dict[str, list] = {"ids": []}
+        for key in include:
+            results[key] = []
+        with self._lock:
+            self._refresh()
+            mask = self._alive & self._filter(where) if where is not None else self._alive
+            candidates = np.flatnonzero(mask)
+            for query in queries:
+                if self._vectors is None or not len(candidates):
+                    rows, scores = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+                else:
+                    rows, scores = self._top_k(self._vectors, candidates, query, n_results)
+                for key, values in self._result(rows, include).items():
+                    results[key].append(values)
+                if "distances" in include:
+                    results["distances"].append((1.0 - scores).tolist())
+        return results
+
+    # Helpers
+
+    @staticmethod
+    def _top_k(vectors: np.ndarray, candidates: np.ndarray, query: np.ndarray, k: int):
+        dense = len(candidates) == len(vectors)
+        scores = np.empty(len(candidates), dtype=np.float32)
+        for start in range(0, len(candidates), _SCORE_BLOCK_ROWS):
+            if dense:
+                block = vectors[start:start + _SCORE_BLOCK_ROWS]
+            else:
+                block = vectors[candidates[start:start + _SCORE_BLOCK_ROWS]]
+            scores[start:start + len(block)] = block.astype(np.float32, copy=False) @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return candidates[top], scores[top]
+
+    def _result(self, rows: np.ndarray, include: Sequence[str]) -> Dict[str, list]:
+        result: Dict[str, list] = {"ids": [self._ids[row] for row in rows]}
+        if "documents" in include:
+            result["documents"] = [self._documents[row] for row in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [self._metadatas[row] for row in rows]
+        if "embeddings" in include:
+            result["embeddings"] = [self._vectors[row].astype(np.float32).tolist() for row in rows]
+        return result
+
+    def _column(self, field: str) -> np.ndarray:
+        # One object array per filtered field, rebuilt after writes
+        column = self._columns.get(field)
+        if column is None:
+            column = np.empty(len(self._metadatas), dtype=object)
+            column[:] = [metadata.get(field) for metadata in self._metadatas]
+            self._columns[field] = column
+        return column
+
+    def _filter(self, where: Dict[str, Any]) -> np.ndarray:
+        """Boolean row mask for a Chroma-style where clause"""
+        mask = np.ones(len(self._ids), dtype=bool)
+        for field, condition in where.items():
+            if field == "$and":
+                for clause in condition:
+                    mask &= self._filter(clause)
+                continue
+            if field == "$or":
+                any_mask = np.zeros(len(self._ids), dtype=bool)
+                for clause in condition:
+                    any_mask |= self._filter(clause)
+                mask &= any_mask
+                continue
+            column = self._column(field)
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for op, value in condition.items():
+                if op == "$eq":
+                    mask &= column == value
+                elif op == "$ne":
+                    mask &= column != value
+                elif op == "$in":
+                    mask &= np.isin(column, list(value))
+                elif op == "$nin":
+                    mask &= ~np.isin(column, list(value))
+                elif op in _COMPARISONS:
+                    compare = _COMPARISONS[op]
+                    mask &= np.fromiter(
+                        (isinstance(v, (int, float)) and compare(v, value) for v in column),
+                        dtype=bool,
+                        count=len(column),
+                    )
+                else:
+                    raise ValueError(f"Unsupported where operator: {op}")
+        return mask
+
+
+_indexes: Dict[Path, NumpyVectorIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_vector_index(name: str, root: Optional[Path] = None) -> NumpyVectorIndex:
+    """The process-wide index stored under root/name, opened once"""
+    path = (Path(root) if root is not None else Path(settings.KNOWLEDGE_BASE_PATH) / "vector_index") / name
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None:
+            index = _indexes[path] = NumpyVectorIndex(path)
+        return index
@@ -1,31 +1,273 @@
-import chromadb
-from chromadb.config import Settings as ChromaSettings
-from sentence_transformers import SentenceTransformer
+from itertools import islice
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import hashlib
+import logging
+import threading
+import time
 from ..core.config import settings
+from ..core.lazy import LazyResource, register_warm_up
+from ..core.rag_config import rag_settings
+from .embedding_cache import embedding_cache
+from .lexical_index import LexicalIndex, get_lexical_index, reciprocal_rank_fusion
+from .semantic_cache import semantic_cache
+
+logger = logging.getLogger(__name__)
+
+def _load_encoder():
+    # Imported here: sentence_transformers pulls in torch
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(str(settings.MODEL_PATH))
+
+_chroma_clients: Dict[str, object] = {}
+_chroma_clients_lock = threading.Lock()
+
+def get_chroma_client(path: Optional[Path] = None):
+    """The process-wide Chroma client for a persist directory, created once.
+
+    Every Chroma-backed store goes through here, so a directory is never opened
+    by two clients in the same worker.
+    """
+    path = str(Path(path if path is not None else settings.KNOWLEDGE_BASE_PATH).resolve())
+    with _chroma_clients_lock:
+        client = _chroma_clients.get(path)
+        if client is None:
+            import chromadb
+            from chromadb.config import Settings as ChromaSettings
+            client = _chroma_clients[path] = chromadb.PersistentClient(
+                path=path,
+                settings=ChromaSettings(allow_reset=True, anonymized_telemetry=False)
+            )
+        return client
+
+def get_chroma_collection(name: str, path: Optional[Path] = None, metadata: Optional[dict] = None):
+    """A collection without an embedding function: callers pass embeddings explicitly,
+    so Chroma never loads its own default model next to the shared encoder."""
+    return get_chroma_client(path).get_or_create_collection(name=name, metadata=metadata, embedding_function=None)
+
+encoder = LazyResource("encoder", _load_encoder)
+# Only warmed up when it is the configured backend
+chroma_client = LazyResource("chroma_client", get_chroma_client, warm_up=settings.VECTOR_BACKEND == "chroma")
+register_warm_up("lexical_index", lambda: get_lexical_index("documents"))
+
+def get_encoder():
+    """Return the process-wide sentence encoder, loading it on first use"""
+    return encoder.get()
+
+def _batches(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def chunk_id(text: str, source: str = "") -> str:
+    """Stable content-addressed id: the same chunk of the same source always maps to it"""
+    return hashlib.sha256(f"{source}\x00{text}".encode("utf-8")).hexdigest()[:32]
+
+class IngestStats:
+    """Progress of a (possibly still running) add_documents call"""
 
-class VectorStore:
     def __init__(self):
-        self.client = chromadb.PersistentClient(
-            path=str(settings.KNOWLEDGE_BASE_PATH),
-            settings=ChromaSettings(allow_reset=True)
-        )
-        self.collection = self.client.get_or_create_collection("documents")
-        self.encoder = SentenceTransformer(str(settings.MODEL_PATH))
+        self.chunks = 0
+        self.skipped = 0
+        self.batches = 0
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+
+    @property
+    def chunks_per_second(self) -> float:
+        return round(self.chunks / self.seconds, 1) if self.seconds else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "chunks": self.chunks,
+            "skipped": self.skipped,
+            "batches": self.batches,
+            "seconds": round(self.seconds, 3),
+            "chunks_per_second": self.chunks_per_second
+        }
+
+class VectorStore:
+    """Document store over a pluggable backend; the backend and encoder load on first use.
+
+    backend is "chroma" (a Chroma collection) or "numpy" (a memory-mapped
+    NumpyVectorIndex shared by all workers through the page cache).
+    """
+
+    def __init__(self, backend: Optional[str] = None):
+        self.backend = backend or settings.VECTOR_BACKEND
+        if self.backend not in ("chroma", "numpy"):
+            raise ValueError(f"Unknown vector backend: {self.backend}")
+        self._collection = None
     
-    def add_documents(self, texts: list[str], metadatas: list[dict] = None):
-        embeddings = self.encoder.encode(texts).tolist()
-        ids = [str(i) for i in range(len(texts))]
+    @property
+    def client(self):
+        return chroma_client.get()
+    
+    @property
+    def collection(self):
+        if self._collection is None:
+            if self.backend == "numpy":
+                from .vector_index import get_vector_index
+                self._collection = get_vector_index("documents")
+            else:
+                self._collection = get_chroma_collection("documents")
+        return self._collection
+    
+    @property
+    def encoder(self):
+        return encoder.get()
+
+    @property
+    def lexical(self) -> LexicalIndex:
+        return get_lexical_index("documents")
+    
+    def add_documents(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[Iterable[dict]] = None,
+        ids: Optional[Iterable[str]] = None,
+        encode_batch_size: Optional[int] = None,
+        write_batch_size: Optional[int] = None,
+        processes: Optional[int] = None,
+        progress: Optional[Callable[[IngestStats], None]] = None
+    ) -> IngestStats:
+        """Encode and store documents in fixed-size batches.
+
+        texts (and metadatas, ids) may be any iterable, including generators: only
+        one write batch of texts and embeddings is held in memory at a time. With
+        processes > 1 encoding is spread over a pool of encoder processes.
+
+        Ids default to chunk_id(text, metadata["source"]). Chunks whose id is
+        already stored are skipped without being encoded. Every chunk is also
+        added to the lexical index, which is saved once the call finishes.
+        """
+        encode_batch_size = encode_batch_size or rag_settings.EMBED_BATCH_SIZE
+        write_batch_size = write_batch_size or rag_settings.WRITE_BATCH_SIZE
+        processes = rag_settings.EMBED_PROCESSES if processes is None else processes
+
+        records = self._records(texts, metadatas, ids)
+        stats = IngestStats()
+        pool = self.encoder.start_multi_process_pool(target_devices=["cpu"] * processes) if processes > 1 else None
+        try:
+            for batch in _batches(records, write_batch_size):
+                self.index_lexically(batch)
+                new = self.new_records(batch)
+                stats.skipped += len(batch) - len(new)
+                if new:
+                    self.write(new, self.encode([text for text, _, _ in new], encode_batch_size, pool))
+                    stats.chunks += len(new)
+                stats.batches += 1
+                stats.seconds = time.perf_counter() - stats.started
+                if progress is not None:
+                    progress(stats)
+                logger.info(f"Indexed {stats.chunks} chunks, skipped {stats.skipped} ({stats.chunks_per_second} chunks/sec)")
+        finally:
+            if pool is not None:
+                self.encoder.stop_multi_process_pool(pool)
+            self.commit(changed=stats.chunks > 0)
+
+        stats.seconds = time.perf_counter() - stats.started
+        return stats
+
+    # The steps of add_documents, for pipelines that run them on separate workers
+
+    def encode(self, texts: List[str], batch_size: Optional[int] = None, pool=None):
+        batch_size = batch_size or rag_settings.EMBED_BATCH_SIZE
+        if pool is not None:
+            return self.encoder.encode_multi_process(texts, pool, batch_size=batch_size)
+        return self.encoder.encode(texts, batch_size=batch_size)
+
+    def write(self, records: List[Tuple[str, dict, str]], embeddings):
+        """Store (text, metadata, id) records with their precomputed embeddings"""
         self.collection.add(
-            embeddings=embeddings,
-            documents=texts,
-            metadatas=metadatas or [{}] * len(texts),
-            ids=ids
+            embeddings=embeddings.tolist() if hasattr(embeddings, "tolist") else embeddings,
+            documents=[text for text, _, _ in records],
+            metadatas=[metadata for _, metadata, _ in records],
+            ids=[id_ for _, _, id_ in records]
         )
+
+    def index_lexically(self, records: List[Tuple[str, dict, str]]):
+        self.lexical.add((id_ for _, _, id_ in records), (text for text, _, _ in records))
+
+    def commit(self, changed: bool = True):
+        """Persist the lexical index and, if anything was stored, drop stale cached answers"""
+        self.lexical.save()
+        if changed:
+            # Cached answers may be based on outdated knowledge
+            semantic_cache.invalidate()
+
+    @staticmethod
+    def _records(texts: Iterable[str], metadatas: Optional[Iterable[dict]], ids: Optional[Iterable[str]]) -> Iterator[Tuple[str, dict, str]]:
+        metadatas = iter(metadatas) if metadatas is not None else None
+        ids = iter(ids) if ids is not None else None
+        for text in texts:
+            metadata = (next(metadatas) if metadatas is not None else None) or {}
+            id_ = next(ids) if ids is not None else chunk_id(text, metadata.get("source", ""))
+            yield text, metadata, id_
+
+    def new_records(self, batch: List[Tuple[str, dict, str]]) -> List[Tuple[str, dict, str]]:
+        """Drop records already stored, or repeated within the batch"""
+        existing = set(self.collection.get(ids=[id_ for _, _, id_ in batch], include=[])["ids"])
+        new = []
+        for record in batch:
+            if record[2] not in existing:
+                existing.add(record[2])
+                new.append(record)
+        return new
+
+    def delete(self, ids: Iterable[str], batch_size: Optional[int] = None) -> int:
+        """Remove chunks by id, in batches; returns how many ids were passed"""
+        deleted = 0
+        for batch in _batches(ids, batch_size or rag_settings.WRITE_BATCH_SIZE):
+            self.collection.delete(ids=batch)
+            self.lexical.delete(batch)
+            deleted += len(batch)
+        if deleted:
+            self.lexical.save()
+            semantic_cache.invalidate()
+        return deleted
+
+    def rebuild_lexical_index(self, batch_size: Optional[int] = None) -> int:
+        """Index every stored chunk lexically, e.g. for a store built before hybrid search"""
+        batch_size = batch_size or rag_settings.WRITE_BATCH_SIZE
+        added = offset = 0
+        while True:
+            page = self.collection.get(limit=batch_size, offset=offset, include=["documents"])
+            if not page["ids"]:
+                break
+            added += self.lexical.add(page["ids"], page["documents"])
+            offset += len(page["ids"])
+        self.lexical.save()
+        logger.info(f"Lexical index rebuilt: {added} chunks added")
+        return added
     
-    def search(self, query: str, n_results: int = 3):
-        query_embedding = self.encoder.encode(query).tolist()
+    def search(self, query: str, n_results: int = 3, where: Optional[dict] = None):
+        """Documents most relevant to query; where filters on metadata first.
+
+        With hybrid search, dense and BM25 candidates are fused by reciprocal
+        rank, so exact product codes, ISINs and Hebrew terms are not missed.
+        """
+        hybrid = rag_settings.HYBRID_SEARCH_ENABLED and len(self.lexical) > 0
+        candidates = max(n_results, rag_settings.HYBRID_CANDIDATES) if hybrid else n_results
+        # Repeated queries reuse their embedding instead of running the model
+        query_embedding = embedding_cache.encode(query, self.encoder).tolist()
         results = self.collection.query(
             query_embeddings=[query_embedding],
-            n_results=n_results
+            n_results=candidates,
+            where=where
         )
-        return results["documents"][0]
+        if not hybrid:
+            return results["documents"][0]
+
+        documents = dict(zip(results["ids"][0], results["documents"][0]))
+        lexical_ids = [id_ for id_, _ in self.lexical.search(query, candidates)]
+        fused = reciprocal_rank_fusion([results["ids"][0], lexical_ids])
+        missing = [id_ for id_ in fused[:n_results * 2] if id_ not in documents]
+        if missing:
+            # Lexical-only hits still have to pass the metadata filter
+            fetched = self.collection.get(ids=missing, where=where, include=["documents"])
+            documents.update(zip(fetched["ids"], fetched["documents"]))
+        return [documents[id_] for id_ in fused if id_ in documents][:n_results]
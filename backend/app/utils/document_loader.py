@@ -1,19 +1,350 @@
+import asyncio
+import codecs
+import io
+import json
+import logging
 import os
-from typing import List
+import re
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from ..core.config import settings
+from ..core.rag_config import rag_settings
+from ..services.prompt_builder import TokenCounter, get_token_counter
+from ..services.ingest_pipeline import IngestPipeline, ParsedFile
 from ..services.vectorstore import VectorStore
+from .index_manifest import IndexManifest, file_sha256
 
-def load_documents(directory: str) -> List[str]:
-    texts = []
-    for filename in os.listdir(directory):
-        if filename.endswith(".txt"):
-            with open(os.path.join(directory, filename), "r", encoding="utf-8") as f:
-                text = f.read()
-                # Split into smaller chunks if needed
-                chunks = [text[i:i+1000] for i in range(0, len(text), 1000)]
-                texts.extend(chunks)
-    return texts
-
-def initialize_knowledge_base(docs_directory: str):
+logger = logging.getLogger(__name__)
+
+# Paragraph breaks, or whitespace after sentence-ending punctuation (incl. Hebrew sof pasuq)
+_BOUNDARY = re.compile(r"(\n\s*\n|(?<=[.!?׃])\s+)")
+_WHITESPACE = re.compile(r"(\s+)")
+
+def read_blocks(path: Path, block_size: Optional[int] = None) -> Iterator[str]:
+    """Yield a text file in blocks of at most block_size characters"""
+    block_size = block_size or rag_settings.READ_BLOCK_CHARS
+    with open(path, "r", encoding="utf-8") as f:
+        for block in iter(lambda: f.read(block_size), ""):
+            yield block
+
+class SegmentSplitter:
+    """Incremental iter_segments: feed it blocks, get back (segment, separator) pairs.
+
+    Its only state is the unfinished tail, so a split can be resumed in another
+    process from carry.
+    """
+
+    def __init__(self, max_chars: Optional[int] = None, carry: str = ""):
+        self.max_chars = max_chars or rag_settings.READ_BLOCK_CHARS
+        self.carry = carry
+
+    def feed(self, block: str) -> List[Tuple[str, str]]:
+        segments: List[Tuple[str, str]] = []
+        parts = _BOUNDARY.split(self.carry + block)
+        self.carry = parts.pop()
+        for segment, separator in zip(parts[0::2], parts[1::2]):
+            if segment.strip():
+                segments.append((segment.strip(), "\n\n" if "\n" in separator else " "))
+        if len(self.carry) > self.max_chars:
+            words = _WHITESPACE.split(self.carry)
+            self.carry = words.pop()
+            head = "".join(words).strip()
+            if head:
+                segments.append((head, " "))
+        return segments
+
+    def finish(self) -> List[Tuple[str, str]]:
+        tail, self.carry = self.carry.strip(), ""
+        return [(tail, "")] if tail else []
+
+def iter_segments(blocks: Iterable[str], max_chars: Optional[int] = None) -> Iterator[Tuple[str, str]]:
+    """Split streamed text into (segment, separator) pairs on sentence and paragraph boundaries.
+
+    The unfinished tail of each block is carried into the next one. A tail that
+    grows past max_chars without a boundary is cut at whitespace instead, so the
+    carried buffer stays bounded and words are never split.
+    """
+    splitter = SegmentSplitter(max_chars)
+    for block in blocks:
+        yield from splitter.feed(block)
+    yield from splitter.finish()
+
+def _split_long(segment: str, max_tokens: int, counter: TokenCounter) -> Iterator[str]:
+    """Break a segment longer than the chunk size on word boundaries"""
+    words: List[str] = []
+    tokens = 0
+    for word in segment.split():
+        word_tokens = counter.count(word + " ")
+        if words and tokens + word_tokens > max_tokens:
+            yield " ".join(words)
+            words, tokens = [], 0
+        words.append(word)
+        tokens += word_tokens
+    if words:
+        yield " ".join(words)
+
+class Chunker:
+    """Incremental chunk_segments: add segments, get back the chunks they complete.
+
+    window holds the segments of the chunk being built as (text, separator,
+    tokens), and fresh whether any of them is not emitted yet; both can be
+    handed to another Chunker to resume.
+    """
+
+    def __init__(
+        self,
+        chunk_tokens: Optional[int] = None,
+        overlap_tokens: Optional[int] = None,
+        counter: Optional[TokenCounter] = None,
+        window: Optional[List[Tuple[str, str, int]]] = None,
+        fresh: bool = False
+    ):
+        self.chunk_tokens = chunk_tokens or rag_settings.CHUNK_TOKENS
+        self.overlap_tokens = rag_settings.CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+        self.counter = counter or get_token_counter(settings.OPENAI_MODEL)
+        self.window: List[Tuple[str, str, int]] = list(window or [])
+        self.window_tokens = sum(entry[2] for entry in self.window)
+        self.fresh = fresh
+
+    def add(self, segment: str, separator: str) -> List[str]:
+        chunks: List[str] = []
+        tokens = self.counter.count(segment)
+        pieces = [(segment, tokens)] if tokens <= self.chunk_tokens else [
+            (piece, self.counter.count(piece)) for piece in _split_long(segment, self.chunk_tokens, self.counter)
+        ]
+        for index, (piece, piece_tokens) in enumerate(pieces):
+            if self.fresh and self.window_tokens + piece_tokens > self.chunk_tokens:
+                chunks.append(_join(self.window))
+                # Keep the trailing segments that fit in the overlap
+                kept: List[Tuple[str, str, int]] = []
+                kept_tokens = 0
+                for entry in reversed(self.window):
+                    if kept_tokens + entry[2] > self.overlap_tokens or kept_tokens + entry[2] + piece_tokens > self.chunk_tokens:
+                        break
+                    kept.insert(0, entry)
+                    kept_tokens += entry[2]
+                self.window, self.window_tokens = kept, kept_tokens
+            self.window.append((piece, separator if index == len(pieces) - 1 else " ", piece_tokens))
+            self.window_tokens += piece_tokens
+            self.fresh = True
+        return chunks
+
+    def finish(self) -> List[str]:
+        if not self.fresh:
+            return []
+        self.fresh = False
+        return [_join(self.window)]
+
+def chunk_segments(
+    segments: Iterable[Tuple[str, str]],
+    chunk_tokens: Optional[int] = None,
+    overlap_tokens: Optional[int] = None,
+    counter: Optional[TokenCounter] = None
+) -> Iterator[str]:
+    """Pack segments into chunks of about chunk_tokens tokens.
+
+    Consecutive chunks share up to overlap_tokens tokens of whole segments, so a
+    sentence cut off at the end of one chunk is repeated at the start of the next.
+    """
+    chunker = Chunker(chunk_tokens, overlap_tokens, counter)
+    for segment, separator in segments:
+        yield from chunker.add(segment, separator)
+    yield from chunker.finish()
+
+def _join(window: List[Tuple[str, str, int]]) -> str:
+    text = ""
+    for index, (segment, separator, _) in enumerate(window):
+        text += segment
+        if index < len(window) - 1:
+            text += separator or " "
+    return text
+
+def iter_source_files(directory: str) -> Iterator[Tuple[str, Path, Dict]]:
+    """Yield (source, path, metadata) for every supported file under directory.
+
+    JSON files are metadata sidecars, as in DocumentProcessor.batch_process_directory:
+    one with a "content_file" key attaches its "metadata" to that file and is
+    not indexed itself.
+    """
+    root = Path(directory)
+    paths = sorted(p for p in root.rglob("*") if p.is_file() and p.suffix in rag_settings.SUPPORTED_FILE_EXTENSIONS)
+
+    sidecars: Dict[Path, Dict] = {}
+    for path in paths:
+        if path.suffix != ".json":
+            continue
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Skipping unreadable metadata file {path}: {str(e)}")
+            continue
+        if isinstance(data, dict) and data.get("content_file"):
+            sidecars[(path.parent / data["content_file"]).resolve()] = data.get("metadata", {})
+
+    for path in paths:
+        if path.suffix == ".json":
+            continue
+        source = path.relative_to(root).as_posix()
+        yield source, path, dict(sidecars.get(path.resolve(), {}), source=source)
+
+def iter_file_chunks(path: Path) -> Iterator[str]:
+    """Stream one file's chunks; memory is bounded by the read block size"""
+    return chunk_segments(iter_segments(read_blocks(path)))
+
+def load_documents(directory: str) -> Iterator[str]:
+    """Lazily yield the chunks of every document under directory"""
+    for _, path, _ in iter_source_files(directory):
+        yield from iter_file_chunks(path)
+
+class ChunkCursor:
+    """Where chunking of a file stopped: byte offset, unfinished text and chunk window"""
+
+    __slots__ = ("offset", "carry", "window", "fresh")
+
+    def __init__(self, offset: int = 0, carry: str = "", window: Optional[List[Tuple[str, str, int]]] = None, fresh: bool = False):
+        self.offset = offset
+        self.carry = carry
+        self.window = window or []
+        self.fresh = fresh
+
+def read_chunk_part(
+    path: Path,
+    cursor: Optional[ChunkCursor] = None,
+    max_chunks: Optional[int] = None,
+    texts: Optional[List[str]] = None,
+) -> Tuple[List[str], Optional[ChunkCursor]]:
+    """Chunk a file from cursor until about max_chunks chunks are ready.
+
+    Stops at a block boundary and returns the chunks with the cursor to resume
+    from, or None once the file is finished, so only one part of a file is held
+    however large it is. Bytes are decoded as text mode reading would; the
+    decoded text of the part is appended to texts, if given.
+    """
+    max_chunks = max_chunks or rag_settings.INGEST_PART_CHUNKS
+    cursor = cursor or ChunkCursor()
+    splitter = SegmentSplitter(carry=cursor.carry)
+    chunker = Chunker(window=cursor.window, fresh=cursor.fresh)
+    decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder("utf-8")(), translate=True)
+    chunks: List[str] = []
+    with open(path, "rb") as f:
+        f.seek(cursor.offset)
+        while len(chunks) < max_chunks:
+            raw = f.read(rag_settings.READ_BLOCK_CHARS)
+            text = decoder.decode(raw, final=not raw)
+            if texts is not None:
+                texts.append(text)
+            segments = splitter.feed(text)
+            if not raw:
+                segments.extend(splitter.finish())
+            for segment, separator in segments:
+                chunks.extend(chunker.add(segment, separator))
+            if not raw:
+                chunks.extend(chunker.finish())
+                return chunks, None
+        # Bytes the decoder holds back (a split character or a trailing \r) are read again
+        pending, flags = decoder.getstate()
+        offset = f.tell() - len(pending) - (flags & 1)
+    return chunks, ChunkCursor(offset, splitter.carry, chunker.window, chunker.fresh)
+
+def parse_source_file(source: str, path: Path, metadata: Dict, cursor: Optional[ChunkCursor] = None) -> ParsedFile:
+    """Hash and chunk one part of a knowledge base file (runs in the pipeline's worker processes)"""
+    started = time.perf_counter()
+    # The first part carries the hash, read in a separate streaming pass
+    row = {"sha256": file_sha256(path)} if cursor is None else None
+    chunks, next_cursor = read_chunk_part(path, cursor)
+    parsed = ParsedFile(source, path, metadata, chunks, row=row, resume=next_cursor)
+    parsed.seconds = time.perf_counter() - started
+    return parsed
+
+async def synchronize_knowledge_base(docs_directory: str, parse_workers: Optional[int] = None) -> Dict:
+    """Bring the vector store in line with the documents directory.
+
+    Only new or edited files go through the ingestion pipeline, where they are
+    hashed and chunked in worker processes, a part of at most about
+    INGEST_PART_CHUNKS chunks at a time, and embedded on a dedicated thread.
+    Chunks already stored are not re-encoded, and chunks of edited or deleted
+    files are removed. The manifest of what is indexed lives next to the
+    vector store.
+    """
     vector_store = VectorStore()
-    texts = load_documents(docs_directory)
-    vector_store.add_documents(texts)
+    manifest = IndexManifest.load(Path(settings.KNOWLEDGE_BASE_PATH) / "index_manifest.json", str(settings.MODEL_PATH))
+    summary = {
+        "unchanged": 0, "indexed": 0, "removed": 0, "failed": 0,
+        "chunks_added": 0, "chunks_skipped": 0, "chunks_deleted": 0,
+    }
+
+    if manifest.stale_model:
+        # Vectors from another model cannot be mixed with new ones
+        for source in list(manifest.files):
+            summary["chunks_deleted"] += await asyncio.to_thread(vector_store.delete, manifest.remove(source))
+        manifest.stale_model = False
+    elif manifest.files and not len(vector_store.lexical):
+        # Indexed before hybrid search: fill the lexical index from the stored chunks
+        await asyncio.to_thread(vector_store.rebuild_lexical_index)
+
+    seen = set()
+    stats: Dict[str, os.stat_result] = {}
+    # Files whose parts are arriving: hash (from the first part), chunk ids and chunks skipped so far
+    indexing: Dict[str, Dict] = {}
+
+    def jobs() -> Iterator[Tuple[str, Path, Dict]]:
+        for source, path, metadata in iter_source_files(docs_directory):
+            seen.add(source)
+            stat = path.stat()
+            if manifest.is_unchanged(source, stat):
+                summary["unchanged"] += 1
+                continue
+            stats[source] = stat
+            yield source, path, metadata
+
+    async def sink(files: List[ParsedFile]):
+        added, _ = await pipeline.write_vectors(files)
+        summary["chunks_added"] += added
+        for file in files:
+            if file.row is not None:
+                indexing[file.source] = {"sha256": file.row["sha256"], "ids": [], "skipped": 0}
+            progress = indexing[file.source]
+            progress["ids"].extend(file.ids)
+            progress["skipped"] += len(file.chunks) - len(file.new)
+            if file.resume is not None:
+                continue  # more parts to come
+            del indexing[file.source]
+            stat, sha256, ids = stats.pop(file.source), progress["sha256"], progress["ids"]
+            if manifest.files.get(file.source, {}).get("sha256") == sha256:
+                # Touched but not edited
+                manifest.record(file.source, sha256, stat, manifest.chunk_ids(file.source))
+                summary["unchanged"] += 1
+                continue
+            stale = set(manifest.chunk_ids(file.source)) - set(ids)
+            summary["chunks_deleted"] += await asyncio.to_thread(vector_store.delete, stale)
+            summary["chunks_skipped"] += progress["skipped"]
+            summary["indexed"] += 1
+            manifest.record(file.source, sha256, stat, list(dict.fromkeys(ids)))
+
+    pipeline = IngestPipeline(parse_source_file, sink, vector_store, parse_workers=parse_workers)
+    stages = await pipeline.run(jobs())
+
+    for source in pipeline.failed:
+        # Parts stored before the failure belong to no manifest entry; the
+        # previous version, if any, stays indexed and is retried next time
+        stats.pop(source, None)
+        progress = indexing.pop(source, None)
+        if progress is not None:
+            orphaned = set(progress["ids"]) - set(manifest.chunk_ids(source))
+            summary["chunks_deleted"] += await asyncio.to_thread(vector_store.delete, orphaned)
+        summary["failed"] += 1
+
+    for source in set(manifest.files) - seen:
+        summary["chunks_deleted"] += await asyncio.to_thread(vector_store.delete, manifest.remove(source))
+        summary["removed"] += 1
+
+    manifest.save()
+    logger.info(f"Knowledge base synchronized: {summary}")
+    summary["stages"] = stages
+    return summary
+
+def initialize_knowledge_base(docs_directory: str) -> Dict:
+    """Synchronous entry point for scripts; see synchronize_knowledge_base"""
+    return asyncio.run(synchronize_knowledge_base(docs_directory))
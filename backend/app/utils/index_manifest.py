@@ -0,0 +1,82 @@
+from pathlib import Path
+from typing import Dict, List, Optional
+import hashlib
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+
+
+def file_sha256(path: Path, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IndexManifest:
+    """Records which files are indexed, their content hash and their chunk ids.
+
+    Stored as JSON next to the vector store. A manifest written with another
+    embedding model is discarded, since its vectors are not comparable.
+    """
+
+    def __init__(self, path: Path, model: str, files: Optional[Dict[str, Dict]] = None):
+        self.path = Path(path)
+        self.model = model
+        self.files: Dict[str, Dict] = files or {}
+        self.stale_model = False
+
+    @classmethod
+    def load(cls, path: Path, model: str) -> "IndexManifest":
+        path = Path(path)
+        if not path.exists():
+            return cls(path, model)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable index manifest {path}: {str(e)}")
+            return cls(path, model)
+
+        manifest = cls(path, model, data.get("files", {}))
+        if data.get("version") != MANIFEST_VERSION or data.get("model") != model:
+            logger.info("Index manifest was built differently, every file will be re-indexed")
+            manifest.stale_model = True
+        return manifest
+
+    def is_unchanged(self, source: str, stat: os.stat_result) -> bool:
+        """Cheap check on size and mtime, without reading the file"""
+        entry = self.files.get(source)
+        return (
+            not self.stale_model
+            and entry is not None
+            and entry.get("size") == stat.st_size
+            and entry.get("mtime") == stat.st_mtime
+        )
+
+    def chunk_ids(self, source: str) -> List[str]:
+        return self.files.get(source, {}).get("chunk_ids", [])
+
+    def record(self, source: str, sha256: str, stat: os.stat_result, chunk_ids: List[str]):
+        self.files[source] = {
+            "sha256": sha256,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "chunk_ids": chunk_ids,
+        }
+
+    def remove(self, source: str) -> List[str]:
+        return self.files.pop(source, {}).get("chunk_ids", [])
+
+    def save(self):
+        """Write atomically so a crash never leaves a truncated manifest"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "model": self.model, "files": self.files}, f)
+        os.replace(tmp_path, self.path)
@@ -1,6 +1,13 @@
-﻿import pytest
+﻿import os
+import sys
+import pytest
 from fastapi.testclient import TestClient
-from backend.app.main import app
+
+# One import root: the tests import the backend as "app", and loading it a
+# second time as "backend.app" would register every ORM event listener twice
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.main import app
 
 @pytest.fixture
 def client():
@@ -1,17 +1,36 @@
 import pytest
 from fastapi.testclient import TestClient
+import asyncio
+import json
 import sys
 import os
+import threading
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.main import app
+from app.api.deps import get_chat_service
 from app.core.config import settings
+from app.db.session import build_engine, get_db
 
 client = TestClient(app)
 
 def test_health_check():
-    response = client.get("/health")
+    # An in-memory database, so the probe does not need a running server
+    engine = build_engine("sqlite://")
+
+    async def sqlite_db():
+        async with AsyncSession(engine) as db:
+            yield db
+
+    app.dependency_overrides[get_db] = sqlite_db
+    try:
+        # The context manager runs the lifespan, which builds the service container
+        with TestClient(app) as client:
+            response = client.get("/health")
+    finally:
+        app.dependency_overrides.pop(get_db, None)
     assert response.status_code == 200
     assert response.json()["status"] == "healthy"
 
@@ -33,3 +52,77 @@ def test_chat_hebrew(settings):
     assert isinstance(response.json()["response"], str)
     assert len(response.json()["response"]) > 0
     assert "שלום" in response.json()["response"].lower()
+
+
+class ScriptedChatService:
+    """Streams fixed events; a message of "slow" stops after one token until cancelled"""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.cancelled = threading.Event()
+
+    async def process_message_stream(self, message, language="he", is_qualified=False, session_id=None):
+        yield {"type": "token", "content": message}
+        if message == "slow":
+            try:
+                await asyncio.sleep(30)
+            finally:
+                self.cancelled.set()
+        if self.fail:
+            yield {"type": "error", "message": "upstream failed"}
+            return
+        yield {"type": "done", "response": message, "session_id": session_id}
+
+
+@pytest.fixture
+def chat_service():
+    def use(service):
+        app.dependency_overrides[get_chat_service] = lambda: service
+        return service
+
+    yield use
+    app.dependency_overrides.pop(get_chat_service, None)
+
+
+def _sse_events(response):
+    events = []
+    for block in response.text.split("\n\n"):
+        if block:
+            name, data = block.split("\n")
+            events.append((name[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+
+def test_stream_sends_tokens_then_done(chat_service):
+    chat_service(ScriptedChatService())
+    response = client.post("/api/v1/chat/stream", json={"message": "hello", "session_id": "s1"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.headers["x-session-id"] == "s1"
+    events = _sse_events(response)
+    assert [name for name, _ in events] == ["token", "done"]
+    assert events[0][1]["content"] == "hello" and events[1][1]["session_id"] == "s1"
+
+
+def test_stream_ends_with_an_error_event(chat_service):
+    chat_service(ScriptedChatService(fail=True))
+    response = client.post("/api/v1/chat/stream", json={"message": "hello"})
+    events = _sse_events(response)
+    assert [name for name, _ in events] == ["token", "error"]
+    # A session is made up for requests without one
+    assert events[1][1]["message"] == "upstream failed" and response.headers["x-session-id"]
+
+
+def test_websocket_cancel_stops_the_stream(chat_service):
+    service = chat_service(ScriptedChatService())
+    with client.websocket_connect("/api/v1/chat/ws") as websocket:
+        websocket.send_json({"message": "slow"})
+        assert websocket.receive_json() == {"type": "token", "content": "slow"}
+        websocket.send_json({"type": "cancel"})
+        assert service.cancelled.wait(5)
+
+        # The connection stays usable, and the next stream runs to the end
+        websocket.send_json({"message": "again"})
+        assert websocket.receive_json()["type"] == "token"
+        done = websocket.receive_json()
+        assert done["type"] == "done" and done["response"] == "again"
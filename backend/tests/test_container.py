@@ -0,0 +1,7 @@
+from app.services.container import ServiceContainer
+
+
+def test_services_share_the_container_vector_store():
+    container = ServiceContainer()
+    assert container.rag_service is container.rag_service
+    assert container.rag_service.vector_store is container.vector_store
@@ -0,0 +1,20 @@
+import pytest
+from sqlalchemy import text
+from app.db.session import async_database_url, build_engine, pool_stats
+
+
+def test_urls_use_async_drivers():
+    assert async_database_url("postgres://u:p%40ss@db/movne") == "postgresql+asyncpg://u:p%40ss@db/movne"
+    assert async_database_url("postgresql://u@db/movne").startswith("postgresql+asyncpg://")
+    assert async_database_url("sqlite:///./local.db") == "sqlite+aiosqlite:///./local.db"
+
+
+@pytest.mark.asyncio
+async def test_sqlite_engine_reports_pool_usage(tmp_path):
+    engine = build_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    try:
+        async with engine.connect() as conn:
+            assert (await conn.execute(text("SELECT 1"))).scalar() == 1
+            assert pool_stats(engine).get("checkedout", 1) == 1
+    finally:
+        await engine.dispose()
@@ -0,0 +1,86 @@
+import pickle
+from app.core.rag_config import rag_settings
+from app.utils.document_loader import chunk_segments, iter_segments, read_blocks, read_chunk_part
+
+
+class WordCounter:
+    """One token per word"""
+
+    def count(self, text):
+        return len(text.split())
+
+
+def test_segments_carry_unfinished_sentences_across_blocks():
+    blocks = ["The first sen", "tence ends here. The sec", "ond one\n\nstarts a par", "agraph"]
+    assert list(iter_segments(blocks, max_chars=100)) == [
+        ("The first sentence ends here.", " "),
+        ("The second one", "\n\n"),
+        ("starts a paragraph", ""),
+    ]
+
+
+def test_segments_without_boundary_are_cut_at_whitespace():
+    text = "word " * 40
+    blocks = [text[i:i + 16] for i in range(0, len(text), 16)]
+    segments = list(iter_segments(blocks, max_chars=32))
+    assert all(len(segment) <= 48 for segment, _ in segments)
+    # Words are never split
+    assert " ".join(segment for segment, _ in segments).split() == ["word"] * 40
+
+
+def test_chunks_overlap_by_whole_trailing_segments():
+    segments = [(f"s{i} a b.", " ") for i in range(6)]
+    chunks = list(chunk_segments(segments, chunk_tokens=9, overlap_tokens=3, counter=WordCounter()))
+    assert chunks == [
+        "s0 a b. s1 a b. s2 a b.",
+        "s2 a b. s3 a b. s4 a b.",
+        "s4 a b. s5 a b.",
+    ]
+
+
+def test_chunks_without_overlap_and_long_segments_split_on_words():
+    segments = [("one two three four five six seven", " "), ("eight nine.", "")]
+    chunks = list(chunk_segments(segments, chunk_tokens=3, overlap_tokens=0, counter=WordCounter()))
+    assert chunks == ["one two three", "four five six", "seven eight nine."]
+
+
+def test_chunks_do_not_depend_on_the_read_block_size(tmp_path):
+    path = tmp_path / "doc.txt"
+    path.write_text("Alpha sentence. Beta sentence.\n\nGamma paragraph. Delta closes it.", encoding="utf-8")
+    assert "".join(read_blocks(path, block_size=5)) == path.read_text(encoding="utf-8")
+
+    def chunks(block_size):
+        segments = iter_segments(read_blocks(path, block_size=block_size), max_chars=64)
+        return list(chunk_segments(segments, chunk_tokens=4, overlap_tokens=2, counter=WordCounter()))
+
+    assert chunks(5) == chunks(4096) == [
+        "Alpha sentence. Beta sentence.",
+        "Beta sentence.\n\nGamma paragraph.",
+        # Overlap never pushes a chunk past chunk_tokens
+        "Delta closes it.",
+    ]
+
+
+def test_file_parts_resume_where_the_last_part_stopped(tmp_path, monkeypatch):
+    monkeypatch.setattr(rag_settings, "READ_BLOCK_CHARS", 64)
+    monkeypatch.setattr(rag_settings, "CHUNK_TOKENS", 12)
+    monkeypatch.setattr(rag_settings, "CHUNK_OVERLAP_TOKENS", 4)
+    # Multi-byte characters and CRLF line ends fall across block boundaries
+    text = "".join(f"Clause {i} applies to שלום investors.\r\n" for i in range(40))
+    path = tmp_path / "doc.txt"
+    path.write_bytes(text.encode("utf-8"))
+
+    chunks, texts, parts, cursor = [], [], 0, None
+    while True:
+        part, cursor = read_chunk_part(path, cursor, max_chunks=1, texts=texts)
+        chunks.extend(part)
+        parts += 1
+        if cursor is None:
+            break
+        # Each part may be parsed in another process
+        cursor = pickle.loads(pickle.dumps(cursor))
+
+    assert parts > 5
+    assert chunks == list(chunk_segments(iter_segments([text.replace("\r\n", "\n")])))
+    # The parts' texts make up the file exactly once
+    assert "".join(texts) == text.replace("\r\n", "\n")
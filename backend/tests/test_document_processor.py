@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from app.core.rag_config import rag_settings
+from app.db.session import build_engine
+from app.models.base import Base
+from app.models.models import Document
+from app.services import document_processor
+from app.services.document_processor import DocumentProcessor
+
+
+class RecordingVectorStore:
+    """The pipeline-facing steps of VectorStore, recording each write"""
+
+    def __init__(self):
+        self.calls = []
+        self.stored = set()
+        self.committed = None
+
+    def new_records(self, records):
+        return [record for record in records if record[2] not in self.stored]
+
+    def encode(self, texts, batch_size=None, pool=None):
+        return np.ones((len(texts), 3), dtype=np.float32)
+
+    def index_lexically(self, records):
+        pass
+
+    def write(self, records, embeddings):
+        assert len(records) == len(embeddings)
+        self.calls.append(([text for text, _, _ in records], [dict(metadata) for _, metadata, _ in records]))
+        self.stored.update(id_ for _, _, id_ in records)
+
+    def commit(self, changed=True):
+        self.committed = changed
+
+
+@pytest.mark.asyncio
+async def test_bulk_ingestion_batches_and_reports_errors(tmp_path):
+    docs = tmp_path / "docs" / "regulation"
+    docs.mkdir(parents=True)
+    for i in range(5):
+        (docs / f"rule{i}.txt").write_text(f"Rule {i}. Investors must be qualified.", encoding="utf-8")
+    (docs / "hebrew.txt").write_text("תקנה חדשה למשקיעים כשירים.", encoding="utf-8")
+    (tmp_path / "docs" / "notes.txt").write_text("no type can be inferred", encoding="utf-8")
+
+    engine = build_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    vector_store = RecordingVectorStore()
+    try:
+        async with async_sessionmaker(engine, expire_on_commit=False)() as db:
+            report = await DocumentProcessor(db, vector_store=vector_store).batch_process_directory(tmp_path / "docs", batch_size=4, parse_workers=0)
+            assert (await db.execute(select(func.count()).select_from(Document))).scalar() == 6
+            hebrew = (await db.execute(select(Document).where(Document.title == "hebrew"))).scalar_one()
+            assert hebrew.language == "he"
+    finally:
+        await engine.dispose()
+
+    assert report.files == 7 and report.documents == 6 and report.chunks == 6
+    assert [error["source"] for error in report.errors] == ["notes.txt"]
+    # One vector store write per batch of at most batch_size files
+    assert sum(len(texts) for texts, _ in vector_store.calls) == 6
+    assert all(len(texts) <= 4 for texts, _ in vector_store.calls)
+    assert vector_store.committed is True
+    assert set(report.stages) == {"parse", "embed", "sink"} and report.stages["parse"]["items"] == 6
+    assert all(metadata["document_id"] for _, metadatas in vector_store.calls for metadata in metadatas)
+
+
+@pytest.mark.asyncio
+async def test_large_documents_are_chunked_in_parts(tmp_path, monkeypatch):
+    monkeypatch.setattr(rag_settings, "READ_BLOCK_CHARS", 32)
+    monkeypatch.setattr(rag_settings, "CHUNK_TOKENS", 8)
+    monkeypatch.setattr(rag_settings, "INGEST_PART_CHUNKS", 1)
+    docs = tmp_path / "docs" / "regulation"
+    docs.mkdir(parents=True)
+    text = " ".join(f"Rule {i} binds every investor." for i in range(20)) + " תקנה."
+    (docs / "long.txt").write_text(text, encoding="utf-8")
+    opened = []
+    # Every part is read by the chunker only; nothing opens the file again for the language or content
+    monkeypatch.setattr(document_processor, "open", lambda *args, **kwargs: opened.append(args), raising=False)
+
+    engine = build_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    vector_store = RecordingVectorStore()
+    try:
+        async with async_sessionmaker(engine, expire_on_commit=False)() as db:
+            report = await DocumentProcessor(db, vector_store=vector_store).batch_process_directory(tmp_path / "docs", parse_workers=0)
+            document = (await db.execute(select(Document))).scalar_one()
+    finally:
+        await engine.dispose()
+
+    assert report.documents == 1 and not report.errors
+    assert document.content == text and not opened
+    assert report.stages["parse"]["items"] > 1
+    metadatas = [metadata for _, call in vector_store.calls for metadata in call]
+    # Detected from the first part, which holds no Hebrew, and kept for the later parts
+    assert document.language == "en" and {metadata["language"] for metadata in metadatas} == {"en"}
+    assert report.chunks == len(metadatas) > 1
+    assert {metadata["document_id"] for metadata in metadatas} == {document.id}
@@ -0,0 +1,50 @@
+import numpy as np
+from app.services.embedding_cache import EmbeddingCache
+
+
+class CountingEncoder:
+    def __init__(self):
+        self.calls = 0
+        self.texts = []
+
+    def encode(self, text, normalize_embeddings=False):
+        self.calls += 1
+        self.texts.append(text)
+        return np.array([len(text), text.count(" "), 1.0], dtype=np.float32)
+
+
+def test_repeated_query_skips_encoder():
+    cache, encoder = EmbeddingCache(max_entries=10, model="m"), CountingEncoder()
+    first = cache.encode("Capital  protection", encoder)
+    second = cache.encode("capital protection", encoder)
+    assert encoder.calls == 1
+    assert np.array_equal(first, second)
+    # Keyed by the normalized text, but the model sees the query as typed
+    assert encoder.texts == ["Capital  protection"]
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+
+
+def test_lru_bound_and_normalize_flag():
+    cache, encoder = EmbeddingCache(max_entries=2, model="m"), CountingEncoder()
+    cache.encode("a", encoder)
+    cache.encode("a", encoder, normalize=True)
+    cache.encode("b", encoder)
+    assert encoder.calls == 3
+    assert cache.stats()["entries"] == 2
+    cache.encode("a", encoder)  # evicted as least recently used
+    assert encoder.calls == 4
+
+
+def test_persistence_is_per_model(tmp_path):
+    path = tmp_path / "embeddings.npz"
+    cache, encoder = EmbeddingCache(model="m", path=path), CountingEncoder()
+    cache.encode("barrier note", encoder)
+    assert cache.save() == 1
+
+    restored = EmbeddingCache(model="m", path=path)
+    assert restored.load() == 1
+    restored.encode("barrier note", encoder)
+    assert encoder.calls == 1
+
+    assert EmbeddingCache(model="other", path=path).load() == 0
@@ -0,0 +1,183 @@
+import os
+import time
+import numpy as np
+import pytest
+from app.core.config import settings
+from app.core.rag_config import rag_settings
+from app.utils import document_loader
+from app.utils.index_manifest import IndexManifest, file_sha256
+
+
+class MemoryVectorStore:
+    """The VectorStore steps used by synchronize_knowledge_base, kept in a dict"""
+
+    def __init__(self):
+        self.chunks = {}
+        self.lexical = {}
+
+    def new_records(self, records):
+        return [record for record in records if record[2] not in self.chunks]
+
+    def encode(self, texts, batch_size=None, pool=None):
+        return np.ones((len(texts), 3), dtype=np.float32)
+
+    def index_lexically(self, records):
+        self.lexical.update((id_, text) for text, _, id_ in records)
+
+    def write(self, records, embeddings):
+        self.chunks.update((id_, text) for text, _, id_ in records)
+
+    def commit(self, changed=True):
+        pass
+
+    def delete(self, ids, batch_size=None):
+        ids = list(ids)
+        for id_ in ids:
+            self.chunks.pop(id_, None)
+            self.lexical.pop(id_, None)
+        return len(ids)
+
+
+def _write(path, text, mtime):
+    path.write_text(text, encoding="utf-8")
+    os.utime(path, (mtime, mtime))
+
+
+def test_manifest_round_trip_and_change_detection(tmp_path):
+    source = tmp_path / "a.txt"
+    _write(source, "First version.", 1_000_000)
+    manifest = IndexManifest(tmp_path / "manifest.json", "model-a")
+    assert not manifest.is_unchanged("a.txt", source.stat())
+
+    manifest.record("a.txt", file_sha256(source), source.stat(), ["id-1"])
+    manifest.save()
+    loaded = IndexManifest.load(tmp_path / "manifest.json", "model-a")
+    assert loaded.is_unchanged("a.txt", source.stat())
+    assert loaded.chunk_ids("a.txt") == ["id-1"]
+
+    _write(source, "Second version.", 1_000_100)
+    assert not loaded.is_unchanged("a.txt", source.stat())
+    assert loaded.remove("a.txt") == ["id-1"]
+    assert loaded.chunk_ids("a.txt") == []
+
+
+def test_manifest_from_another_model_or_unreadable_is_stale(tmp_path):
+    path = tmp_path / "manifest.json"
+    source = tmp_path / "a.txt"
+    _write(source, "Text.", 1_000_000)
+    manifest = IndexManifest(path, "model-a")
+    manifest.record("a.txt", file_sha256(source), source.stat(), ["id-1"])
+    manifest.save()
+
+    other = IndexManifest.load(path, "model-b")
+    assert other.stale_model and other.files
+    assert not other.is_unchanged("a.txt", source.stat())
+
+    path.write_text("{not json", encoding="utf-8")
+    assert IndexManifest.load(path, "model-a").files == {}
+
+
+@pytest.mark.asyncio
+async def test_synchronize_indexes_only_added_changed_and_deleted_files(tmp_path, monkeypatch):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    store = MemoryVectorStore()
+    monkeypatch.setattr(document_loader, "VectorStore", lambda: store)
+    monkeypatch.setattr(settings, "KNOWLEDGE_BASE_PATH", str(tmp_path / "kb"))
+    monkeypatch.setattr(settings, "MODEL_PATH", "model-a")
+
+    async def sync():
+        summary = await document_loader.synchronize_knowledge_base(str(docs), parse_workers=0)
+        summary.pop("stages")
+        return summary
+
+    _write(docs / "a.txt", "Alpha rules apply.", 1_000_000)
+    _write(docs / "b.txt", "Beta rules apply.", 1_000_000)
+    summary = await sync()
+    assert summary["indexed"] == 2 and summary["chunks_added"] == 2
+    assert sorted(store.chunks.values()) == ["Alpha rules apply.", "Beta rules apply."]
+
+    # Nothing changed: no file is parsed again
+    summary = await sync()
+    assert summary["unchanged"] == 2 and summary["indexed"] == 0
+
+    # a is edited, b only touched, c added
+    _write(docs / "a.txt", "Alpha rules changed.", 1_000_100)
+    os.utime(docs / "b.txt", (1_000_100, 1_000_100))
+    _write(docs / "c.txt", "Gamma rules apply.", 1_000_100)
+    summary = await sync()
+    assert summary["indexed"] == 2 and summary["unchanged"] == 1
+    assert summary["chunks_added"] == 2 and summary["chunks_deleted"] == 1
+    assert sorted(store.chunks.values()) == ["Alpha rules changed.", "Beta rules apply.", "Gamma rules apply."]
+
+    # c deleted
+    (docs / "c.txt").unlink()
+    summary = await sync()
+    assert summary["removed"] == 1 and summary["chunks_deleted"] == 1
+    assert sorted(store.chunks.values()) == ["Alpha rules changed.", "Beta rules apply."]
+    manifest = IndexManifest.load(tmp_path / "kb" / "index_manifest.json", "model-a")
+    assert sorted(manifest.files) == ["a.txt", "b.txt"]
+
+    # Another embedding model: everything is indexed again
+    monkeypatch.setattr(settings, "MODEL_PATH", "model-b")
+    summary = await sync()
+    assert summary["indexed"] == 2 and summary["chunks_deleted"] == 2 and summary["chunks_added"] == 2
+
+
+@pytest.mark.asyncio
+async def test_large_files_are_indexed_in_parts(tmp_path, monkeypatch):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    store = MemoryVectorStore()
+    monkeypatch.setattr(document_loader, "VectorStore", lambda: store)
+    monkeypatch.setattr(settings, "KNOWLEDGE_BASE_PATH", str(tmp_path / "kb"))
+    monkeypatch.setattr(rag_settings, "READ_BLOCK_CHARS", 32)
+    monkeypatch.setattr(rag_settings, "CHUNK_TOKENS", 8)
+    monkeypatch.setattr(rag_settings, "INGEST_PART_CHUNKS", 1)
+    _write(docs / "long.txt", " ".join(f"Rule {i} binds every investor." for i in range(20)), 1_000_000)
+
+    summary = await document_loader.synchronize_knowledge_base(str(docs), parse_workers=0)
+    assert summary["indexed"] == 1
+    assert summary["stages"]["parse"]["items"] > 1
+    manifest = IndexManifest.load(tmp_path / "kb" / "index_manifest.json", str(settings.MODEL_PATH))
+    assert sorted(manifest.chunk_ids("long.txt")) == sorted(store.chunks)
+    assert summary["chunks_added"] == len(store.chunks) > 1
+
+
+@pytest.mark.asyncio
+async def test_chunks_of_a_file_failing_mid_way_are_removed(tmp_path, monkeypatch):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    store = MemoryVectorStore()
+    monkeypatch.setattr(document_loader, "VectorStore", lambda: store)
+    monkeypatch.setattr(settings, "KNOWLEDGE_BASE_PATH", str(tmp_path / "kb"))
+    monkeypatch.setattr(rag_settings, "READ_BLOCK_CHARS", 32)
+    monkeypatch.setattr(rag_settings, "CHUNK_TOKENS", 8)
+    monkeypatch.setattr(rag_settings, "INGEST_PART_CHUNKS", 1)
+    _write(docs / "long.txt", " ".join(f"Rule {i} binds every investor." for i in range(20)), 1_000_000)
+    await document_loader.synchronize_knowledge_base(str(docs), parse_workers=0)
+    indexed = dict(store.chunks)
+
+    parse = document_loader.parse_source_file
+    parts = []
+
+    def fail_on_fourth_part(source, path, metadata, cursor=None):
+        parts.append(cursor)
+        if len(parts) == 4:
+            # Fail once the earlier parts are stored (parsing runs on a thread here)
+            deadline = time.monotonic() + 5
+            while len(store.chunks) == len(indexed) and time.monotonic() < deadline:
+                time.sleep(0.01)
+            raise OSError("read error")
+        return parse(source, path, metadata, cursor)
+
+    monkeypatch.setattr(document_loader, "parse_source_file", fail_on_fourth_part)
+    _write(docs / "long.txt", " ".join(f"Rule {i} binds every advisor." for i in range(20)), 1_000_100)
+    summary = await document_loader.synchronize_knowledge_base(str(docs), parse_workers=0)
+
+    assert summary["failed"] == 1 and summary["indexed"] == 0
+    assert summary["chunks_added"] > 0
+    # The new parts stored before the failure are gone; the previous version is intact
+    assert store.chunks == indexed
+    manifest = IndexManifest.load(tmp_path / "kb" / "index_manifest.json", str(settings.MODEL_PATH))
+    assert sorted(manifest.chunk_ids("long.txt")) == sorted(indexed)
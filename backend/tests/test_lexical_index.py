@@ -0,0 +1,49 @@
+from app.services.lexical_index import LexicalIndex, reciprocal_rank_fusion, tokenize
+
+
+def test_hebrew_prefixes_are_stripped():
+    terms = list(tokenize("ובהשקעה"))
+    assert "השקעה" in terms
+    # Short words keep their first letter
+    assert list(tokenize("של")) == ["של"]
+
+
+def test_codes_match_whole_and_by_part():
+    terms = list(tokenize("ISIN IL0011234567, series SP-2024/01"))
+    assert "il0011234567" in terms
+    assert "sp-2024/01" in terms and "2024" in terms
+
+
+def _index(path=None):
+    index = LexicalIndex(path)
+    index.add(
+        ["a", "b", "c"],
+        [
+            "מוצר מובנה עם הגנת קרן מלאה",
+            "Term sheet for note IL0011234567 with autocall barrier",
+            "ההשקעה במוצר כרוכה בסיכון",
+        ],
+    )
+    return index
+
+
+def test_exact_code_ranks_first():
+    index = _index()
+    assert index.search("IL0011234567")[0][0] == "b"
+    assert [id_ for id_, _ in index.search("השקעה")] == ["c"]
+
+
+def test_delete_and_persist(tmp_path):
+    path = tmp_path / "lexical.npz"
+    index = _index(path)
+    index.delete(["b"])
+    assert index.search("IL0011234567") == []
+    assert index.save()
+
+    restored = LexicalIndex(path)
+    assert len(restored) == 2
+    assert restored.search("הגנת קרן")[0][0] == "a"
+
+
+def test_reciprocal_rank_fusion_prefers_agreement():
+    assert reciprocal_rank_fusion([["x", "y", "z"], ["y", "w"]], k=60)[0] == "y"
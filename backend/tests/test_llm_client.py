@@ -0,0 +1,96 @@
+import json
+import httpx
+import pytest
+from app.core.config import settings
+from app.services import llm_client
+from app.services.llm_client import OllamaClient, OpenAIClient, close_llm_clients, get_llm_client
+
+MESSAGES = [{"role": "user", "content": "What is a barrier?"}]
+
+
+@pytest.fixture
+def transport(monkeypatch):
+    """Route every LLM client's pool to a handler, recording the requests"""
+    requests = []
+    responses = {}
+
+    def handler(request):
+        requests.append(request)
+        return responses["next"](request)
+
+    def build(base_url=""):
+        return httpx.AsyncClient(base_url=base_url or "http://llm.test", transport=httpx.MockTransport(handler))
+
+    monkeypatch.setattr(llm_client, "_build_http_client", build)
+    monkeypatch.setattr(settings, "OPENAI_API_KEY", "test-key")
+    return requests, responses
+
+
+@pytest.mark.asyncio
+async def test_ollama_maps_the_chat_payload(transport):
+    requests, responses = transport
+    responses["next"] = lambda request: httpx.Response(200, json={"message": {"role": "assistant", "content": "A level."}})
+    client = OllamaClient()
+
+    assert await client.complete(MESSAGES, temperature=0.2) == "A level."
+    request = requests[0]
+    assert request.method == "POST" and request.url.path == "/api/chat"
+    assert json.loads(request.content) == {
+        "model": settings.OLLAMA_MODEL,
+        "messages": MESSAGES,
+        "stream": False,
+        "options": {"temperature": 0.2},
+    }
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_ollama_streams_lines_until_done(transport):
+    requests, responses = transport
+    lines = [{"message": {"content": "A "}}, {"message": {"content": "level."}}, {"done": True}, {"message": {"content": "ignored"}}]
+    body = "\n".join(json.dumps(line) for line in lines) + "\n"
+    responses["next"] = lambda request: httpx.Response(200, content=body.encode())
+    client = OllamaClient()
+
+    assert [token async for token in client.stream(MESSAGES)] == ["A ", "level."]
+    payload = json.loads(requests[0].content)
+    assert payload["stream"] is True and payload["options"]["temperature"] == client.temperature
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_openai_completes_and_streams_through_the_shared_pool(transport):
+    requests, responses = transport
+    completion = {
+        "id": "c1", "object": "chat.completion", "created": 0, "model": settings.OPENAI_MODEL,
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "A level."}}],
+    }
+    responses["next"] = lambda request: httpx.Response(200, json=completion)
+    client = OpenAIClient()
+
+    assert await client.complete(MESSAGES) == "A level."
+    payload = json.loads(requests[0].content)
+    assert payload["model"] == settings.OPENAI_MODEL and payload["messages"] == MESSAGES
+
+    def chunk(content):
+        delta = {"id": "c1", "object": "chat.completion.chunk", "created": 0, "model": settings.OPENAI_MODEL,
+                 "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}]}
+        return f"data: {json.dumps(delta)}\n\n"
+
+    events = chunk("A ") + chunk("level.") + "data: [DONE]\n\n"
+    responses["next"] = lambda request: httpx.Response(200, content=events.encode(), headers={"content-type": "text/event-stream"})
+    assert [token async for token in client.stream(MESSAGES)] == ["A ", "level."]
+    assert json.loads(requests[1].content)["stream"] is True
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_shutdown_closes_the_shared_pools(transport, monkeypatch):
+    monkeypatch.setattr(llm_client, "_clients", {})
+    ollama, openai = get_llm_client("ollama"), get_llm_client("openai")
+    assert get_llm_client("ollama") is ollama
+
+    await close_llm_clients()
+    assert ollama._http_client.is_closed and openai._http_client.is_closed
+    # The next request builds a new client instead of reusing a closed pool
+    assert get_llm_client("ollama") is not ollama
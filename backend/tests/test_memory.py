@@ -0,0 +1,51 @@
+import time
+from app.services.memory import ConversationMemory
+
+
+def _message(content: str) -> dict:
+    return {"role": "user", "content": content}
+
+
+def test_sessions_are_isolated():
+    memory = ConversationMemory(max_messages=10)
+    memory.add_message("a", _message("hello from a"))
+    memory.add_message("b", _message("hello from b"))
+    assert memory.get_history("a") == [_message("hello from a")]
+    assert memory.get_history("b") == [_message("hello from b")]
+    assert memory.get_history("unknown") == []
+
+
+def test_ring_buffer_keeps_latest_messages():
+    memory = ConversationMemory(max_messages=3)
+    for i in range(5):
+        memory.add_message("a", _message(str(i)))
+    assert [m["content"] for m in memory.get_history("a")] == ["2", "3", "4"]
+    assert [m["content"] for m in memory.get_history("a", limit=2)] == ["3", "4"]
+    assert memory.metrics()["bytes"] == 3 * len("roleusercontent0".encode("utf-8"))
+
+
+def test_least_recently_used_session_is_evicted():
+    memory = ConversationMemory(max_messages=10, max_sessions=2)
+    memory.add_message("a", _message("1"))
+    memory.add_message("b", _message("2"))
+    memory.get_history("a")
+    memory.add_message("c", _message("3"))
+    assert memory.get_history("b") == []
+    assert memory.get_history("a")
+    assert memory.metrics()["sessions"] == 2
+
+
+def test_byte_cap_evicts_sessions():
+    memory = ConversationMemory(max_messages=10, max_bytes=100)
+    for i in range(10):
+        memory.add_message(f"s{i}", _message("x" * 30))
+    assert memory.metrics()["bytes"] <= 100
+    assert memory.get_history("s9")
+
+
+def test_idle_sessions_expire():
+    memory = ConversationMemory(max_messages=10, ttl_seconds=0.01)
+    memory.add_message("a", _message("hello"))
+    time.sleep(0.02)
+    assert memory.evict_expired() == 1
+    assert memory.metrics()["sessions"] == 0
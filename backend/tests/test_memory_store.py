@@ -0,0 +1,149 @@
+import json
+import sys
+import types
+from pathlib import Path
+import numpy as np
+import pytest
+from app.core.lazy import LazyResource
+from app.memory import memory_store as memory_store_module
+from app.memory.memory_store import MemoryStore
+from app.services import vectorstore
+from app.services.vector_index import NumpyVectorIndex
+
+HOUR_NS = 3600 * 10**9
+
+
+class OnesEncoder:
+    def encode(self, texts, batch_size=None):
+        return np.ones((len(texts), 2), dtype=np.float32)
+
+
+class RecordingIndex(NumpyVectorIndex):
+    """Stands in for a Chroma collection, recording every get"""
+
+    def __init__(self, path):
+        super().__init__(path, dtype="float32")
+        self.gets = []
+
+    def get(self, ids=None, where=None, limit=None, offset=0, include=("documents", "metadatas")):
+        self.gets.append((where, limit))
+        return super().get(ids=ids, where=where, limit=limit, offset=offset, include=include)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        memory_store_module, "get_chroma_collection", lambda name, path, metadata=None: RecordingIndex(tmp_path / name)
+    )
+    return MemoryStore(tmp_path, write_behind=False, history_window_seconds=3600, encoder=OnesEncoder())
+
+
+def _store_conversations(store, client_id, seqs):
+    """Conversations with the given sequence numbers, as add_conversation stores them"""
+    store.conversation_collection.upsert(
+        embeddings=[[1.0, 1.0]] * len(seqs),
+        documents=[json.dumps({"message": f"m{seq}"}) for seq in seqs],
+        metadatas=[{"client_id": client_id, "language": "en", "seq": seq} for seq in seqs],
+        ids=[f"conv_{client_id}_{seq:020d}" for seq in seqs],
+    )
+
+
+def _messages(conversations):
+    return [conversation["message"] for conversation in conversations]
+
+
+def test_pages_follow_the_cursor_newest_first(store):
+    for i in range(5):
+        store.add_conversation("a", f"question {i}", "answer", "en")
+    store.add_conversation("b", "other client", "answer", "en")
+
+    page, cursor = store.get_client_history_page("a", limit=2)
+    assert _messages(page) == ["question 4", "question 3"] and cursor
+    page, cursor = store.get_client_history_page("a", limit=2, cursor=cursor)
+    assert _messages(page) == ["question 2", "question 1"] and cursor
+    page, cursor = store.get_client_history_page("a", limit=2, cursor=cursor)
+    assert _messages(page) == ["question 0"] and cursor is None
+
+    # A page that is exactly full has no next cursor
+    assert store.get_client_history_page("a", limit=5)[1] is None
+
+
+def test_rows_are_read_in_bounded_windows(store):
+    now = store._next_seq()
+    # Two recent conversations, then a gap of several windows
+    _store_conversations(store, "a", [now - 1, now - 2, now - 10 * HOUR_NS, now - 11 * HOUR_NS])
+
+    store.conversation_collection.gets.clear()
+    page, cursor = store.get_client_history_page("a", limit=1)
+    assert _messages(page) == [f"m{now - 1}"]
+    # The page filled from the first window: no older rows were read
+    assert len(store.conversation_collection.gets) == 1
+    (since,) = [c["seq"]["$gte"] for c in store.conversation_collection.gets[0][0]["$and"] if "$gte" in c.get("seq", {})]
+    assert now - HOUR_NS <= since < now - 2
+
+    page, cursor = store.get_client_history_page("a", limit=2, cursor=cursor)
+    assert _messages(page) == [f"m{now - 2}", f"m{now - 10 * HOUR_NS}"]
+    page, cursor = store.get_client_history_page("a", limit=2, cursor=cursor)
+    assert _messages(page) == [f"m{now - 11 * HOUR_NS}"] and cursor is None
+    # Every read was bounded by the cursor, and the search ended on an empty probe
+    wheres = [where for where, _ in store.conversation_collection.gets[1:]]
+    assert all(any("$lt" in condition.get("seq", {}) for condition in where["$and"]) for where in wheres)
+    assert store.conversation_collection.gets[-1][1] == 1
+
+
+def test_history_is_cached_and_written_through(store):
+    for i in range(3):
+        store.add_conversation("a", f"question {i}", "answer", "en")
+    assert _messages(store.get_client_history("a", limit=2)) == ["question 2", "question 1"]
+
+    store.conversation_collection.gets.clear()
+    store.add_conversation("a", "question 3", "answer", "en")
+    # Served from the cache, which holds the complete history
+    assert _messages(store.get_client_history("a", limit=10)) == ["question 3", "question 2", "question 1", "question 0"]
+    assert store.conversation_collection.gets == []
+
+
+def test_profiles_are_stored_with_their_embedding(store):
+    store.update_client_profile("a", {"risk_profile": "moderate"})
+    assert store.get_client_profile("a") == {"risk_profile": "moderate"}
+    assert store.get_client_profile("b") is None
+    embeddings = store.profile_collection.get(ids=["profile_a"], include=["embeddings"])["embeddings"]
+    assert np.allclose(embeddings, [[2 ** -0.5, 2 ** -0.5]])
+
+
+def test_stores_share_one_chroma_client_and_encoder(tmp_path, monkeypatch):
+    clients = []
+
+    class PersistentClient:
+        def __init__(self, path, settings):
+            clients.append(self)
+            self.path = path
+
+        def get_or_create_collection(self, name, metadata=None, embedding_function=None):
+            # No embedding function: Chroma must not load a model of its own
+            assert embedding_function is None
+            return RecordingIndex(Path(self.path) / name)
+
+    chromadb = types.ModuleType("chromadb")
+    chromadb.PersistentClient = PersistentClient
+    chromadb_config = types.ModuleType("chromadb.config")
+    chromadb_config.Settings = lambda **kwargs: kwargs
+    monkeypatch.setitem(sys.modules, "chromadb", chromadb)
+    monkeypatch.setitem(sys.modules, "chromadb.config", chromadb_config)
+    monkeypatch.setattr(vectorstore, "_chroma_clients", {})
+    loads = []
+
+    def load_encoder():
+        loads.append("encoder")
+        return OnesEncoder()
+
+    monkeypatch.setattr(vectorstore, "encoder", LazyResource("encoder", load_encoder, warm_up=False))
+
+    first = MemoryStore(tmp_path, write_behind=False)
+    second = MemoryStore(tmp_path, write_behind=False)
+    documents = vectorstore.get_chroma_collection("documents", tmp_path)
+
+    assert len(clients) == 1 and vectorstore.get_chroma_client(tmp_path) is clients[0]
+    assert first.encoder is second.encoder is vectorstore.get_encoder()
+    assert len(loads) == 1
+    assert documents.path.parent == first.conversation_collection.path.parent
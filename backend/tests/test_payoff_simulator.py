@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+from app.models.models import Client, StructuredProduct
+from app.services.payoff_simulator import MarketScenario, PayoffSimulator, PayoffTerms
+from app.services.product_advisor import ProductAdvisor
+
+PROTECTED = {"capital_protection": 100, "participation": 0.8, "cap": 40}
+AUTOCALL = {"barrier": {"level": 70, "type": "american"}, "autocall": {"trigger": 100, "coupon": 8, "frequency_months": 6}}
+
+
+def product(id_, rules, term=24):
+    return StructuredProduct(id=id_, name=f"note {id_}", term_length=term, expected_return=5.0, risk_level="Medium", product_rules=rules)
+
+
+def test_payoff_rules_on_known_paths():
+    # Three paths: steady rise, dip below the barrier then recovery, crash
+    performance = np.array([[
+        [1.02, 1.04, 1.06, 1.10],
+        [0.90, 0.65, 0.90, 0.95],
+        [0.80, 0.60, 0.50, 0.40],
+    ]])
+    capped = PayoffTerms({"capital_protection": 0.9, "cap": 5}, 4).payoff(performance)
+    assert np.allclose(capped["payoff"], [[1.05, 0.95, 0.9]])
+
+    barrier = PayoffTerms({"barrier": {"level": 0.7, "type": "american"}}, 4).payoff(performance)
+    assert np.allclose(barrier["payoff"], [[1.10, 0.95, 0.40]])
+    assert barrier["breached"].tolist() == [[False, True, True]]
+    european = PayoffTerms({"barrier": 70}, 4).payoff(performance)
+    assert np.allclose(european["payoff"], [[1.10, 1.0, 0.40]])
+
+    autocall = PayoffTerms({"autocall": {"trigger": 1.0, "coupon": 12, "frequency_months": 2}}, 4).payoff(performance)
+    assert np.allclose(autocall["payoff"][0, 0], 1.02) and autocall["life"][0, 0] == 2
+    assert autocall["called"].tolist() == [[True, False, False]]
+
+
+def test_percent_levels_and_rates_and_invalid_autocall_frequency():
+    performance = np.array([[[1.0, 1.2]]])
+    assert np.allclose(PayoffTerms({"participation": 80}, 2).payoff(performance)["payoff"], [[1.16]])
+    assert np.allclose(PayoffTerms({"participation": 0.8}, 2).payoff(performance)["payoff"], [[1.16]])
+
+    # Rates are percent however small: a 2% coupon is not a 200% one
+    assert np.allclose(PayoffTerms({"cap": 1.5}, 2).payoff(performance)["payoff"], [[1.015]])
+    autocall = PayoffTerms({"autocall": {"trigger": 1.0, "coupon": 2, "frequency_months": 1}}, 2)
+    assert np.allclose(autocall.payoff(performance)["payoff"], [[1.0 + 0.02 / 12]])
+
+    for frequency in (0, -3):
+        with pytest.raises(ValueError):
+            PayoffTerms({"autocall": {"frequency_months": frequency}}, 12)
+    assert PayoffSimulator(n_paths=100, seed=1).simulate(product(1, {"autocall": {"frequency_months": 0}})) is None
+
+
+def test_seeded_results_are_reproducible_and_batch_independent():
+    scenarios = [MarketScenario("base", 0.04, 0.2), MarketScenario("bear", -0.1, 0.3)]
+    batch = PayoffSimulator(n_paths=2000, seed=1).simulate_many([product(1, PROTECTED, 36), product(2, AUTOCALL, 60)], scenarios)
+    alone = PayoffSimulator(n_paths=2000, seed=1).simulate(product(1, PROTECTED, 36), scenarios)
+
+    assert batch[0] == alone
+    assert batch[0]["bear"]["loss_probability"] == 0.0  # fully capital protected
+    assert batch[0]["base"]["return_percentiles"]["p95"] <= 0.4
+    assert 0 < batch[1]["base"]["autocall_probability"] < 1
+    assert batch[1]["bear"]["barrier_breach_probability"] > batch[1]["base"]["barrier_breach_probability"]
+    assert PayoffSimulator(n_paths=2000, seed=2).simulate(product(1, PROTECTED, 36), scenarios) != alone
+
+
+def test_cache_is_keyed_by_rules_and_market():
+    simulator = PayoffSimulator(n_paths=500, seed=1)
+    first = simulator.simulate(product(1, AUTOCALL))
+    assert simulator.simulate(product(99, dict(AUTOCALL))) is first  # same rules and term, other product
+    simulator.simulate(product(1, AUTOCALL), [MarketScenario("base", 0.0, 0.4)])
+    assert simulator.stats()["hits"] == 1 and simulator.stats()["misses"] == 2
+    assert simulator.simulate(product(3, AUTOCALL, term=0)) is None
+
+
+def test_explanation_includes_scenarios():
+    class NoRAG:
+        def get_product_information(self, query, language=None):
+            return []
+
+    advisor = ProductAdvisor(rag_service=NoRAG(), simulator=PayoffSimulator(n_paths=500, seed=1))
+    explanation = advisor.generate_product_explanation(product(1, AUTOCALL), Client(risk_profile="Moderate"))
+
+    assert "median return" in explanation and "autocalled" in explanation and "barrier is breached" in explanation
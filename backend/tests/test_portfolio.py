@@ -0,0 +1,134 @@
+from datetime import date, datetime
+import asyncio
+import pytest
+import pytest_asyncio
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from app.db.session import build_engine
+from app.models.base import Base
+from app.models.models import Client, ClientInvestment, StructuredProduct
+from app.services import portfolio as portfolio_module
+from app.services.portfolio import PortfolioEngine
+
+AS_OF = date(2025, 1, 1)
+
+
+@pytest_asyncio.fixture
+async def sessions(tmp_path):
+    engine = build_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    factory = async_sessionmaker(engine, expire_on_commit=False)
+    async with factory() as db:
+        db.add_all([Client(id=1, email="a@example.com"), Client(id=2, email="b@example.com")])
+        db.add_all([
+            StructuredProduct(id=1, name="USD note", currency="USD", risk_level="Low"),
+            StructuredProduct(id=2, name="ILS note", currency="ILS", risk_level="High"),
+        ])
+        db.add_all([
+            ClientInvestment(id=1, client_id=1, product_id=1, amount=100.0, maturity_date=datetime(2025, 2, 1), status="Active"),
+            ClientInvestment(id=2, client_id=1, product_id=2, amount=50.0, maturity_date=datetime(2026, 6, 1), status="Active"),
+            ClientInvestment(id=3, client_id=1, product_id=1, amount=25.0, maturity_date=datetime(2024, 12, 1), status="Active"),
+            ClientInvestment(id=4, client_id=2, product_id=1, amount=10.0, status="Active"),
+            ClientInvestment(id=5, client_id=2, product_id=2, amount=999.0, status="Cancelled"),
+        ])
+        await db.commit()
+    yield factory
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_client_exposure_and_maturity_ladder(sessions):
+    engine = PortfolioEngine(session_factory=sessions, ttl_seconds=60)
+
+    portfolio = await engine.client_portfolio(1, as_of=AS_OF)
+
+    assert portfolio["positions"] == 3
+    assert portfolio["by_currency"] == {"USD": 125.0, "ILS": 50.0}
+    assert portfolio["by_risk_level"] == {"Low": {"USD": 125.0}, "High": {"ILS": 50.0}}
+    assert [(p["product_id"], p["amount"], p["positions"]) for p in portfolio["by_product"]] == [(1, 125.0, 2), (2, 50.0, 1)]
+    assert [(rung["bucket"], rung["amounts"]) for rung in portfolio["maturity_ladder"]] == [
+        ("matured", {"USD": 25.0}), ("0-3m", {"USD": 100.0}), ("1-2y", {"ILS": 50.0})
+    ]
+
+    firm = await engine.firm_exposure(as_of=AS_OF)
+    assert firm["clients"] == 2 and firm["positions"] == 4  # the cancelled investment is excluded
+    assert firm["by_currency"] == {"USD": 135.0, "ILS": 50.0}
+    assert firm["maturity_ladder"][-1] == {"bucket": "no date", "positions": 1, "amounts": {"USD": 10.0}}
+    # Served from the cache, as a copy the caller may change
+    portfolio["by_currency"]["USD"] = 0.0
+    cached = await engine.client_portfolio(1, as_of=AS_OF)
+    assert cached is not portfolio and cached["by_currency"] == {"USD": 125.0, "ILS": 50.0}
+    assert engine.stats()["cached_results"] == 2
+
+
+@pytest.mark.asyncio
+async def test_positions_without_a_client_are_not_counted_as_a_client(sessions):
+    async with sessions() as db:
+        db.add(ClientInvestment(id=6, client_id=None, product_id=1, amount=5.0, status="Active"))
+        await db.commit()
+    firm = await PortfolioEngine(session_factory=sessions, ttl_seconds=60).firm_exposure(as_of=AS_OF)
+    assert firm["clients"] == 2 and firm["positions"] == 5
+
+
+@pytest.mark.asyncio
+async def test_committed_changes_are_applied_incrementally(sessions, monkeypatch):
+    engine = PortfolioEngine(session_factory=sessions, ttl_seconds=60)
+    monkeypatch.setattr(portfolio_module, "portfolio_engine", engine)
+    other_client = await engine.client_portfolio(2, as_of=AS_OF)
+    await engine.client_portfolio(1, as_of=AS_OF)
+
+    async with sessions() as db:
+        db.add(ClientInvestment(id=6, client_id=1, product_id=2, amount=30.0, status="Active"))
+        investment = await db.get(ClientInvestment, 1)
+        investment.status = "Matured"
+        await db.commit()
+
+    async with sessions() as db:
+        db.add(ClientInvestment(id=7, client_id=1, product_id=1, amount=1.0, status="Active"))
+        await db.rollback()
+
+    portfolio = await engine.client_portfolio(1, as_of=AS_OF)
+    assert portfolio["by_currency"] == {"USD": 25.0, "ILS": 80.0}
+    assert engine.stats()["full_reloads"] == 1 and engine.stats()["incremental_updates"] == 1
+    # Other clients keep their cached results, computed from the earlier version
+    assert await engine.client_portfolio(2, as_of=AS_OF) == other_client
+    assert engine.stats()["version"] > other_client["version"]
+
+    async with sessions() as db:
+        product = (await db.execute(select(StructuredProduct).where(StructuredProduct.id == 2))).scalar_one()
+        product.currency = "EUR"
+        await db.commit()
+    assert (await engine.client_portfolio(1, as_of=AS_OF))["by_currency"] == {"USD": 25.0, "EUR": 80.0}
+    assert engine.stats()["full_reloads"] == 2
+
+
+@pytest.mark.asyncio
+async def test_a_cancelled_load_keeps_pending_changes(sessions, monkeypatch):
+    engine = PortfolioEngine(session_factory=sessions, ttl_seconds=60)
+    monkeypatch.setattr(portfolio_module, "portfolio_engine", engine)
+    await engine.client_portfolio(1, as_of=AS_OF)
+    async with sessions() as db:
+        db.add(ClientInvestment(id=6, client_id=1, product_id=2, amount=30.0, status="Active"))
+        await db.commit()
+
+    load = engine._load
+
+    async def stalled(ids=None):
+        await asyncio.sleep(60)
+
+    # A caller's timeout cancels the load of the committed change
+    monkeypatch.setattr(engine, "_load", stalled)
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(engine.client_portfolio(1, as_of=AS_OF), 0.05)
+    monkeypatch.setattr(engine, "_load", load)
+    assert (await engine.client_portfolio(1, as_of=AS_OF))["by_currency"] == {"USD": 125.0, "ILS": 80.0}
+    assert engine.stats()["incremental_updates"] == 1
+
+    engine.invalidate()
+    monkeypatch.setattr(engine, "_load", stalled)
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(engine.firm_exposure(as_of=AS_OF), 0.05)
+    monkeypatch.setattr(engine, "_load", load)
+    await engine.firm_exposure(as_of=AS_OF)
+    assert engine.stats()["full_reloads"] == 2
@@ -0,0 +1,83 @@
+import time
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from app.db.session import build_engine
+from app.models.base import Base
+from app.models.models import Client, Conversation, Message
+from app.services.portfolio import PortfolioEngine
+from app.services.product_advisor import ProductAdvisor
+
+
+class SlowRAGService:
+    def __init__(self, product_delay=0.0, compliance_delay=0.0):
+        self.product_delay = product_delay
+        self.compliance_delay = compliance_delay
+        self.compliance_risk_levels = []
+
+    def get_product_information(self, query, language=None):
+        time.sleep(self.product_delay)
+        return [f"product info for {query}"]
+
+    def get_compliance_context(self, product_type, risk_level=None):
+        self.compliance_risk_levels.append(risk_level)
+        time.sleep(self.compliance_delay)
+        return [f"{risk_level} rules"]
+
+
+@pytest_asyncio.fixture
+async def sessions(tmp_path):
+    engine = build_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    factory = async_sessionmaker(engine, expire_on_commit=False)
+    async with factory() as db:
+        db.add(Client(id=1, name="Dana", email="dana@example.com", risk_profile="Moderate", investment_goals="Income"))
+        db.add(Conversation(id=1, client_id=1))
+        db.add_all([Message(conversation_id=1, role="user", content=f"question {i}") for i in range(7)])
+        await db.commit()
+    yield factory
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_lookups_run_concurrently(sessions):
+    rag = SlowRAGService(product_delay=0.3, compliance_delay=0.3)
+    advisor = ProductAdvisor(rag_service=rag, session_factory=sessions, portfolio=PortfolioEngine(session_factory=sessions))
+
+    started = time.perf_counter()
+    context = await advisor.analyze_client_query_async(1, "autocall")
+    elapsed = time.perf_counter() - started
+
+    assert elapsed < 0.55  # not 0.3 + 0.3
+    assert context["client_profile"] == {"risk_profile": "Moderate", "investment_goals": "Income"}
+    assert context["product_context"] == ["product info for autocall"]
+    assert context["compliance_context"] == ["Moderate rules"]
+    assert len(context["conversation_history"]) == 5
+    assert set(context["timings"]) == {"client", "products", "compliance", "conversation", "portfolio"}
+    assert context["portfolio"]["positions"] == 0
+    assert context["degraded"] == []
+
+
+@pytest.mark.asyncio
+async def test_slow_source_falls_back_to_empty(sessions):
+    advisor = ProductAdvisor(rag_service=SlowRAGService(product_delay=0.5), session_factory=sessions, portfolio=PortfolioEngine(session_factory=sessions))
+
+    context = await advisor.analyze_client_query_async(1, "autocall", timeouts={"products": 0.05})
+
+    assert context["product_context"] == []
+    assert context["degraded"] == ["products"]
+    assert context["compliance_context"] == ["Moderate rules"]
+    assert context["timings"]["products"] < 0.3
+
+
+@pytest.mark.asyncio
+async def test_unknown_client_still_gets_context(sessions):
+    rag = SlowRAGService()
+    advisor = ProductAdvisor(rag_service=rag, session_factory=sessions, portfolio=PortfolioEngine(session_factory=sessions))
+
+    context = await advisor.analyze_client_query_async(99, "autocall")
+
+    assert context["client_profile"] == {"risk_profile": None, "investment_goals": None}
+    assert rag.compliance_risk_levels == [None]
+    assert context["conversation_history"] == []
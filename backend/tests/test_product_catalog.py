@@ -0,0 +1,114 @@
+import pytest
+import pytest_asyncio
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from app.db.session import build_engine
+from app.models.base import Base
+from app.models.models import StructuredProduct
+from app.services import product_catalog as catalog_module
+from app.services.product_catalog import ProductCatalog, risk_rank
+
+
+def product(id_, risk_level, currency="USD", term=12, min_investment=10000.0, expected_return=5.0, is_active=True):
+    return StructuredProduct(
+        id=id_, name=f"product {id_}", risk_level=risk_level, currency=currency, term_length=term,
+        min_investment=min_investment, expected_return=expected_return, is_active=is_active
+    )
+
+
+def test_risk_levels_and_profiles_share_a_scale():
+    assert risk_rank("Low") == risk_rank("Conservative") < risk_rank("Medium") == risk_rank("moderate") < risk_rank("High")
+    assert risk_rank("unknown") is None and risk_rank(None) is None
+
+
+def test_snapshot_indexes_answer_filters():
+    catalog = ProductCatalog(session_factory=lambda: None, ttl_seconds=60)
+    snapshot = catalog.load_rows([
+        product(1, "Low", expected_return=3.0),
+        product(2, "Medium", currency="ILS", term=24, expected_return=6.0),
+        product(3, "High", term=36, min_investment=50000.0, expected_return=9.0),
+        product(4, "Medium", is_active=False),
+    ])
+
+    assert [p.id for p in snapshot.suitable_for("Moderate")] == [2, 1]  # best expected return first
+    assert [p.id for p in snapshot.suitable_for("Aggressive")] == [3, 2, 1]
+    assert snapshot.suitable_for("Unknown") == []
+    assert [p.id for p in snapshot.filter(currency="ils")] == [2]
+    assert [p.id for p in snapshot.filter(min_term=20, max_term=36)] == [2, 3]
+    assert [p.id for p in snapshot.filter(amount=20000)] == [1, 2]
+    assert [p.id for p in snapshot.filter(risk_profile="Aggressive", amount=20000, currency="USD")] == [1]
+    assert [p.id for p in snapshot.filter()] == [1, 2, 3]
+    assert snapshot.version == 1 and catalog.current is snapshot
+
+
+@pytest_asyncio.fixture
+async def sessions(tmp_path):
+    engine = build_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield async_sessionmaker(engine, expire_on_commit=False)
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_writes_invalidate_the_catalog(sessions, monkeypatch):
+    catalog = ProductCatalog(session_factory=sessions, ttl_seconds=60)
+    # The ORM event hooks invalidate the process-wide catalog
+    monkeypatch.setattr(catalog_module, "product_catalog", catalog)
+    async with sessions() as db:
+        db.add(product(1, "Low"))
+        await db.commit()
+
+    first = await catalog.get()
+    assert len(first) == 1 and await catalog.get() is first
+
+    async with sessions() as db:
+        db.add(product(2, "High"))
+        await db.commit()
+    assert not catalog.fresh
+    second = await catalog.get()
+    assert second.version == first.version + 1 and len(second) == 2
+
+    async with sessions() as db:
+        await db.execute(update(StructuredProduct).where(StructuredProduct.id == 1).values(is_active=False))
+        await db.commit()
+    assert [p.id for p in (await catalog.get()).filter()] == [2]
+
+
+@pytest.mark.asyncio
+async def test_commit_invalidates_a_reload_made_before_it(sessions, monkeypatch):
+    catalog = ProductCatalog(session_factory=sessions, ttl_seconds=60)
+    monkeypatch.setattr(catalog_module, "product_catalog", catalog)
+    async with sessions() as db:
+        db.add(product(1, "Low"))
+        await db.flush()
+        # Another request reloads between the flush and the commit and still sees no product
+        assert len(await catalog.get()) == 0 and catalog.fresh
+        await db.commit()
+    assert not catalog.fresh
+    assert len(await catalog.get()) == 1
+
+    # A rolled back write leaves no mark behind for the next commit
+    async with sessions() as db:
+        db.add(product(2, "High"))
+        await db.flush()
+        await catalog.get()
+        await db.rollback()
+        assert catalog.changed_key not in db.info
+    assert len(await catalog.get()) == 1
+
+
+@pytest.mark.asyncio
+async def test_a_failed_reload_leaves_the_catalog_stale(sessions):
+    catalog = ProductCatalog(session_factory=sessions, ttl_seconds=60)
+    await catalog.get()
+    assert catalog.fresh
+
+    def unavailable():
+        raise ConnectionError("database unavailable")
+
+    catalog.invalidate()
+    catalog.session_factory = unavailable
+    with pytest.raises(ConnectionError):
+        await catalog.get()
+    assert not catalog.fresh and catalog.current is not None
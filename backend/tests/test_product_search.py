@@ -0,0 +1,87 @@
+import pytest
+from app.models.models import StructuredProduct
+from app.services.product_catalog import ProductCatalog
+from app.services.product_search import ProductColumns, _encode_cursor, flatten_rules
+
+
+def product(id_, risk_level="Medium", currency="USD", term=24, min_investment=50000.0, expected_return=5.0, rules=None):
+    return StructuredProduct(
+        id=id_, name=f"note {id_}", risk_level=risk_level, currency=currency, term_length=term,
+        min_investment=min_investment, expected_return=expected_return, is_active=True, product_rules=rules
+    )
+
+
+def columns(rows):
+    return ProductColumns(ProductCatalog(session_factory=lambda: None).load_rows(rows))
+
+
+def test_flatten_rules():
+    assert flatten_rules({"capital_protection": True, "barrier": {"level": 70, "type": "European"}, "dates": [1, 2]}) == {
+        "capital_protection": True, "barrier.level": 70, "barrier.type": "European"
+    }
+
+
+def test_multi_predicate_search_ranked_by_expected_return():
+    store = columns([
+        product(1, expected_return=4.0, rules={"capital_protection": True}),
+        product(2, expected_return=7.0, rules={"capital_protection": True}),
+        product(3, expected_return=9.0, rules={"capital_protection": False}),
+        product(4, expected_return=8.0, currency="EUR", rules={"capital_protection": True}),
+        product(5, expected_return=6.0, term=48, rules={"capital_protection": True}),
+        product(6, expected_return=6.5, min_investment=250000.0, rules={"capital_protection": True}),
+        product(7, expected_return=None, rules={"capital_protection": True}),
+    ])
+
+    page = store.search(
+        currencies=["usd"], term_min=12, term_max=36, min_investment_max=100000,
+        rules={"capital_protection": True}
+    )
+
+    assert [p.id for p in page.products] == [2, 1, 7]  # missing expected return ranks last
+    assert page.next_cursor is None
+
+
+def test_rule_ranges_categoricals_and_unknown_fields():
+    store = columns([
+        product(1, rules={"barrier": {"level": 60, "type": "European"}}),
+        product(2, rules={"barrier": {"level": 75, "type": "American"}}),
+        product(3),
+    ])
+
+    assert [p.id for p in store.search(rules_max={"barrier.level": 70}).products] == [1]
+    assert [p.id for p in store.search(rules={"barrier.type": "american"}).products] == [2]
+    assert store.search(rules={"no_such_field": True}).products == []
+    assert [p.id for p in store.search(risk_profile="Conservative").products] == []
+    assert len(store.search(risk_profile="Moderate").products) == 3
+
+
+def test_cursor_pages_through_results_and_survives_catalog_changes():
+    rows = [product(i, expected_return=float(i % 7)) for i in range(1, 51)]
+    catalog = ProductCatalog(session_factory=lambda: None)
+    store = ProductColumns(catalog.load_rows(rows))
+
+    seen, cursor = [], None
+    while True:
+        page = store.search(sort_by="expected_return", limit=8, cursor=cursor)
+        seen.extend(p.id for p in page.products)
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+    expected = sorted(range(1, 51), key=lambda i: (-(i % 7), i))
+    assert seen == expected
+
+    first = store.search(limit=10)
+    # A new catalog version resumes after the last product returned, not at a stale position
+    changed = ProductColumns(catalog.load_rows([product(100, expected_return=100.0)] + rows))
+    resumed = changed.search(limit=10, cursor=first.next_cursor)
+    assert [p.id for p in resumed.products] == expected[10:20]
+
+    with pytest.raises(ValueError):
+        store.search(sort_by="term_length", cursor=first.next_cursor)
+    with pytest.raises(ValueError):
+        store.search(cursor="not-a-cursor")
+    for position in (-1, 51):
+        # A forged cursor of the current version cannot point outside the results
+        forged = _encode_cursor({"v": store.version, "s": "expected_return", "d": True, "p": position, "k": [0.0, 1]})
+        with pytest.raises(ValueError):
+            store.search(sort_by="expected_return", cursor=forged)
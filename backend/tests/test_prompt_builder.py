@@ -0,0 +1,76 @@
+from app.core.lazy import LazyResource, warm_up_tasks
+from app.services import prompt_builder
+from app.services.prompt_builder import PromptAssembler, TokenCounter
+
+
+class WordCounter(TokenCounter):
+    """One token per word, no tokenizer download needed"""
+
+    def __init__(self):
+        self.model = "test"
+        self.calls = 0
+
+    def count(self, text):
+        self.calls += 1
+        return len(text.split())
+
+
+def _history(n):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"message number {i}"} for i in range(n)]
+
+
+def test_everything_fits():
+    assembler = PromptAssembler(WordCounter(), max_tokens=1000, response_reserve=0, max_history=10)
+    prompt = assembler.assemble("system", "question", _history(4), ["chunk one", "chunk two"])
+    assert [m["role"] for m in prompt.messages] == ["system", "user", "assistant", "user", "assistant", "user"]
+    assert "chunk one\nchunk two" in prompt.messages[0]["content"]
+    assert prompt.dropped_chunks == 0 and prompt.dropped_history == 0
+
+
+def test_history_limited_to_newest_messages():
+    assembler = PromptAssembler(WordCounter(), max_tokens=1000, response_reserve=0, max_history=2)
+    prompt = assembler.assemble("system", "question", _history(6))
+    assert [m["content"] for m in prompt.history] == ["message number 4", "message number 5"]
+
+
+def test_budget_drops_oldest_history_first():
+    # system and question cost 5 tokens each, every history message 7
+    assembler = PromptAssembler(WordCounter(), max_tokens=25, response_reserve=0, max_history=10)
+    prompt = assembler.assemble("system", "question", _history(4))
+    assert [m["content"] for m in prompt.history] == ["message number 2", "message number 3"]
+    assert prompt.tokens <= 25
+
+
+def test_chunks_take_priority_over_history():
+    assembler = PromptAssembler(WordCounter(), max_tokens=20, response_reserve=0, max_history=10)
+    prompt = assembler.assemble("system", "question", _history(2), ["a b c d e f g h i"])
+    assert prompt.context_chunks == ["a b c d e f g h i"]
+    assert prompt.history == []
+
+
+def test_precomputed_counts_are_used():
+    counter = WordCounter()
+    assembler = PromptAssembler(counter, max_tokens=1000, response_reserve=0, max_history=10)
+    history = [dict(m, tokens=3) for m in _history(4)]
+    assembler.assemble("system", "question", history)
+    assert counter.calls == 2
+
+
+def test_fallback_estimate_without_tokenizer():
+    counter = TokenCounter("test")
+    counter._tokenizer = LazyResource("tokenizer:none", lambda: None, warm_up=False)
+    assert counter._count("abcdefgh") == 2
+    assert counter._count("שלום") == 2
+
+
+def test_tokenizers_share_one_warm_up_task(monkeypatch):
+    before = warm_up_tasks()
+    counters = [TokenCounter(f"model-{i}") for i in range(3)]
+    assert warm_up_tasks() == before
+    assert [name for name, _ in before].count("tokenizers") == 1
+
+    loaded = []
+    monkeypatch.setattr(TokenCounter, "_load_encoding", staticmethod(lambda model: loaded.append(model)))
+    monkeypatch.setattr(prompt_builder, "_counters", {counter.model: counter for counter in counters})
+    dict(before)["tokenizers"]()
+    assert {"model-0", "model-1", "model-2"} <= set(loaded)
@@ -0,0 +1,76 @@
+import numpy as np
+from app.services.semantic_cache import SemanticCache
+
+
+class FakeEncoder:
+    """Bag-of-words encoder so similar wording gives similar vectors"""
+
+    vocabulary = ["what", "is", "capital", "protection", "barrier", "autocall", "a", "note"]
+
+    def __init__(self):
+        self.calls = 0
+
+    def encode(self, text, normalize_embeddings=False):
+        self.calls += 1
+        words = text.replace("?", "").split()
+        vector = np.array([words.count(w) for w in self.vocabulary], dtype=np.float32) + 1e-3
+        return vector / np.linalg.norm(vector)
+
+
+def _cache(**kwargs):
+    encoder = FakeEncoder()
+    return SemanticCache(encoder_factory=lambda: encoder, **kwargs), encoder
+
+
+def test_similar_question_hits():
+    cache, _ = _cache(threshold=0.85)
+    cache.set(cache.key("What is capital protection?", "en", False), "answer")
+    assert cache.get(cache.key("what is a capital protection", "en", False)) == "answer"
+    assert cache.get(cache.key("what is an autocall barrier", "en", False)) is None
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+
+
+def test_exact_repeat_skips_encoder():
+    cache, encoder = _cache()
+    cache.set(cache.key("What is  capital protection?", "en", False), "answer")
+    calls = encoder.calls
+    assert cache.get(cache.key("what is capital protection?", "en", False)) == "answer"
+    assert encoder.calls == calls
+    assert cache.stats()["exact_hits"] == 1
+
+
+def test_partitions_are_separate():
+    cache, _ = _cache()
+    cache.set(cache.key("what is capital protection", "en", False), "retail answer")
+    assert cache.get(cache.key("what is capital protection", "en", True)) is None
+    assert cache.get(cache.key("what is capital protection", "he", False)) is None
+
+
+def test_size_limit_and_invalidation():
+    cache, _ = _cache(max_entries=1)
+    cache.set(cache.key("what is capital protection", "en", False), "first")
+    cache.set(cache.key("what is a barrier", "en", False), "second")
+    assert cache.stats()["entries"] == 1
+    cache.invalidate()
+    assert cache.get(cache.key("what is a barrier", "en", False)) is None
+
+
+def test_entries_expire():
+    cache, _ = _cache(ttl_seconds=1e-9)
+    cache.set(cache.key("what is capital protection", "en", False), "answer")
+    assert cache.get(cache.key("what is capital protection", "en", False)) is None
+
+
+def test_invalidation_while_encoding_is_a_miss():
+    cache, encoder = _cache(threshold=0.85)
+    cache.set(cache.key("What is capital protection?", "en", False), "stale answer")
+    encode = encoder.encode
+
+    def encode_and_invalidate(text, normalize_embeddings=False):
+        # Another thread invalidates the cache while this query is encoded
+        cache.invalidate()
+        return encode(text, normalize_embeddings)
+
+    encoder.encode = encode_and_invalidate
+    assert cache.get(cache.key("what is a capital protection", "en", False)) is None
@@ -0,0 +1,71 @@
+import asyncio
+import pytest
+from app.services.singleflight import SingleFlight, request_key
+
+
+def test_request_key_normalizes_content():
+    a = request_key("gpt", 0.7, [{"role": "user", "content": "What is  a note?"}])
+    b = request_key("gpt", 0.7, [{"role": "user", "content": "what is a note? "}])
+    c = request_key("gpt", 0.2, [{"role": "user", "content": "what is a note?"}])
+    assert a == b
+    assert a != c
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_upstream_call():
+    flight = SingleFlight()
+    calls = 0
+
+    async def upstream():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "answer"
+
+    results = await asyncio.gather(*(flight.do("k", upstream) for _ in range(10)))
+    assert results == ["answer"] * 10
+    assert calls == 1
+    assert flight.stats()["coalesced"] == 9
+
+    # Finished calls are not reused
+    assert await flight.do("k", upstream) == "answer"
+    assert calls == 2
+
+
+@pytest.mark.asyncio
+async def test_stream_fans_out_to_late_subscribers():
+    flight = SingleFlight()
+    calls = 0
+
+    async def upstream():
+        nonlocal calls
+        calls += 1
+        for token in ["a", "b", "c"]:
+            await asyncio.sleep(0.01)
+            yield token
+
+    async def collect(delay):
+        await asyncio.sleep(delay)
+        return [t async for t in flight.stream("k", upstream)]
+
+    results = await asyncio.gather(collect(0), collect(0.015))
+    assert results == [["a", "b", "c"], ["a", "b", "c"]]
+    assert calls == 1
+
+
+@pytest.mark.asyncio
+async def test_joined_subscriber_keeps_the_stream_alive_before_reading():
+    flight = SingleFlight()
+
+    async def upstream():
+        for token in ["a", "b", "c"]:
+            await asyncio.sleep(0.01)
+            yield token
+
+    first = flight.stream("k", upstream)
+    assert await first.__anext__() == "a"
+    second = flight.stream("k", upstream)
+    # The first listener leaves before the second has read anything
+    await first.aclose()
+    assert [t async for t in second] == ["a", "b", "c"]
+    assert flight.stats()["upstream_calls"] == 1
@@ -0,0 +1,121 @@
+import os
+import threading
+import numpy as np
+from app.services.vector_index import NumpyVectorIndex
+
+
+def _add(index, n=6, dim=4):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(n, dim)).astype(np.float32)
+    index.add(
+        embeddings=vectors.tolist(),
+        documents=[f"doc {i}" for i in range(n)],
+        metadatas=[{"language": "he" if i % 2 else "en"} for i in range(n)],
+        ids=[f"id{i}" for i in range(n)],
+    )
+    return vectors
+
+
+def test_query_returns_nearest_first(tmp_path):
+    index = NumpyVectorIndex(tmp_path, dtype="float32")
+    vectors = _add(index)
+    results = index.query(query_embeddings=[vectors[3].tolist()], n_results=2)
+    assert results["ids"][0][0] == "id3"
+    assert results["documents"][0][0] == "doc 3"
+    assert abs(results["distances"][0][0]) < 1e-5
+
+
+def test_where_prefilters_rows(tmp_path):
+    index = NumpyVectorIndex(tmp_path)
+    vectors = _add(index)
+    results = index.query(query_embeddings=[vectors[2].tolist()], n_results=10, where={"language": "he"})
+    assert sorted(results["ids"][0]) == ["id1", "id3", "id5"]
+    assert index.get(where={"language": {"$in": ["en"]}}, include=[])["ids"] == ["id0", "id2", "id4"]
+
+
+def test_other_instance_sees_writes_and_deletes(tmp_path):
+    writer = NumpyVectorIndex(tmp_path)
+    _add(writer)
+    reader = NumpyVectorIndex(tmp_path)
+    assert reader.count() == 6
+
+    writer.add(embeddings=[[1.0, 0.0, 0.0, 0.0]], documents=["new"], ids=["id6"])
+    assert reader.get(ids=["id6"])["documents"] == ["new"]
+
+    # Deleting more than the compaction ratio rewrites a new generation
+    writer.delete(ids=["id0", "id1", "id2"])
+    assert reader.count() == 4
+    assert reader.get(ids=["id0", "id3"], include=[])["ids"] == ["id3"]
+    assert reader.query(query_embeddings=[[1.0, 0.0, 0.0, 0.0]], n_results=1)["ids"][0] == ["id6"]
+
+
+def test_concurrent_writers_do_not_interleave_rows(tmp_path):
+    # Separate instances stand in for processes: only the file lock serializes them
+    writers = [NumpyVectorIndex(tmp_path, dtype="float32") for _ in range(4)]
+
+    def write(w):
+        for i in range(25):
+            writers[w].add(embeddings=[[float(w + 1), float(i), 1.0]], documents=[f"{w}-{i}"], ids=[f"{w}-{i}"])
+
+    threads = [threading.Thread(target=write, args=(w,)) for w in range(len(writers))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    reader = NumpyVectorIndex(tmp_path, dtype="float32")
+    assert reader.count() == 100
+    result = reader.get(include=["documents", "embeddings"])
+    assert result["ids"] == result["documents"]
+    for id_, embedding in zip(result["ids"], result["embeddings"]):
+        w, i = map(int, id_.split("-"))
+        expected = np.array([w + 1, i, 1.0], dtype=np.float32)
+        assert np.allclose(embedding, expected / np.linalg.norm(expected), atol=1e-6)
+
+
+def test_rows_of_an_unpublished_write_are_discarded(tmp_path):
+    index = NumpyVectorIndex(tmp_path, dtype="float32")
+    _add(index, n=2)
+    # A writer that died after appending, before updating the header
+    with open(tmp_path / "records-0.jsonl", "a", encoding="utf-8") as f:
+        f.write('{"id": "lost", "document": "lost", "metadata": {}}\n')
+    with open(tmp_path / "vectors-0.bin", "ab") as f:
+        f.write(np.ones(4, dtype=np.float32).tobytes())
+
+    index.add(embeddings=[[0.0, 1.0, 0.0, 0.0]], documents=["kept"], ids=["id2"])
+    reader = NumpyVectorIndex(tmp_path)
+    assert reader.get(include=["documents"])["documents"] == ["doc 0", "doc 1", "kept"]
+    assert reader.query(query_embeddings=[[0.0, 1.0, 0.0, 0.0]], n_results=1)["ids"][0] == ["id2"]
+
+
+def test_writes_with_an_unchanged_header_mtime_are_seen(tmp_path):
+    writer = NumpyVectorIndex(tmp_path)
+    _add(writer)
+    reader = NumpyVectorIndex(tmp_path)
+    assert reader.count() == 6
+    stat = (tmp_path / "index.json").stat()
+
+    writer.add(embeddings=[[1.0, 0.0, 0.0, 0.0]], documents=["new"], ids=["id6"])
+    # A coarse-grained file system gives the new header the same mtime
+    os.utime(tmp_path / "index.json", ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert reader.get(ids=["id6"])["documents"] == ["new"]
+
+
+def test_reader_retries_when_a_compaction_removes_its_generation(tmp_path):
+    writer = NumpyVectorIndex(tmp_path)
+    _add(writer)
+    reader = NumpyVectorIndex(tmp_path)
+    writer.add(embeddings=[[1.0, 0.0, 0.0, 0.0]], documents=["new"], ids=["id6"])
+
+    read_records = reader._read_records
+
+    def compact_first(count):
+        # The writer compacts between the reader's header read and its records open
+        reader._read_records = read_records
+        writer.delete(ids=["id0", "id1", "id2"])
+        read_records(count)
+
+    reader._read_records = compact_first
+    assert reader.count() == 4
+    assert not (tmp_path / "records-0.jsonl").exists()
+    assert reader.get(ids=["id0", "id6"])["documents"] == ["new"]
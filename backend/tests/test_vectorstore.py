@@ -0,0 +1,58 @@
+import numpy as np
+from app.services.lexical_index import LexicalIndex
+from app.services.vector_index import NumpyVectorIndex
+from app.services.vectorstore import VectorStore, chunk_id
+
+
+class CountingEncoder:
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts, batch_size=None):
+        self.encoded.extend(texts)
+        return np.ones((len(texts), 3), dtype=np.float32)
+
+
+class RecordingIndex(NumpyVectorIndex):
+    """Records the size of every add"""
+
+    def __init__(self, path):
+        super().__init__(path, dtype="float32")
+        self.adds = []
+
+    def add(self, embeddings, documents=None, metadatas=None, ids=None):
+        self.adds.append(len(ids))
+        return super().add(embeddings=embeddings, documents=documents, metadatas=metadatas, ids=ids)
+
+
+def _store(tmp_path, monkeypatch):
+    encoder = CountingEncoder()
+    lexical = LexicalIndex()
+    monkeypatch.setattr(VectorStore, "encoder", property(lambda self: encoder))
+    monkeypatch.setattr(VectorStore, "lexical", property(lambda self: lexical))
+    store = VectorStore(backend="numpy")
+    store._collection = RecordingIndex(tmp_path)
+    return store, encoder
+
+
+def test_documents_are_written_in_batches(tmp_path, monkeypatch):
+    store, encoder = _store(tmp_path, monkeypatch)
+    texts = (f"chunk {i}" for i in range(7))
+    stats = store.add_documents(texts, ({"source": "a.txt"} for _ in range(7)), write_batch_size=3, processes=0)
+
+    assert store.collection.adds == [3, 3, 1]
+    assert stats.chunks == 7 and stats.batches == 3 and stats.skipped == 0
+    assert len(encoder.encoded) == 7
+    assert store.collection.get(ids=[chunk_id("chunk 0", "a.txt")])["documents"] == ["chunk 0"]
+
+
+def test_stored_and_repeated_chunks_are_not_added_again(tmp_path, monkeypatch):
+    store, encoder = _store(tmp_path, monkeypatch)
+    store.add_documents([f"chunk {i}" for i in range(4)], processes=0)
+    encoder.encoded.clear()
+
+    # Two stored chunks, one new chunk twice and another new one
+    stats = store.add_documents(["chunk 0", "chunk 3", "chunk 4", "chunk 4", "chunk 5"], processes=0)
+    assert encoder.encoded == ["chunk 4", "chunk 5"]
+    assert stats.chunks == 2 and stats.skipped == 3
+    assert store.collection.count() == 6
@@ -0,0 +1,63 @@
+import threading
+from app.memory.write_behind import WriteBehindQueue
+
+
+def _record(i):
+    return {"id": f"r{i}", "document": f"doc {i}", "metadata": {"seq": i}}
+
+
+def test_records_are_written_in_batches(tmp_path):
+    batches = []
+    queue = WriteBehindQueue(batches.append, tmp_path / "journal.jsonl", batch_size=10, flush_interval=0.05)
+    queue.start()
+    for i in range(25):
+        queue.put(_record(i))
+    assert queue.flush(timeout=5)
+    queue.close()
+
+    assert sum(len(batch) for batch in batches) == 25
+    assert max(len(batch) for batch in batches) <= 10
+    assert queue.pending() == []
+    assert (tmp_path / "journal.jsonl").read_text() == ""
+
+
+def test_journal_is_replayed_after_a_crash(tmp_path):
+    journal = tmp_path / "journal.jsonl"
+    failing = threading.Event()
+
+    def fail(batch):
+        failing.set()
+        raise RuntimeError("store unavailable")
+
+    crashed = WriteBehindQueue(fail, journal, flush_interval=0.05)
+    crashed.start()
+    assert crashed.put(_record(1))
+    assert failing.wait(5)
+    # Stopped while the store is down: the batch stays in the journal
+    crashed.close()
+    assert [r["id"] for r in crashed.pending()] == ["r1"]
+
+    written = []
+    restarted = WriteBehindQueue(written.extend, journal, flush_interval=0.05)
+    restarted.start()
+    assert restarted.flush(timeout=5)
+    restarted.close()
+    assert [r["id"] for r in written] == ["r1"]
+    assert journal.read_text() == ""
+
+
+def test_put_rejects_records_past_max_pending(tmp_path):
+    journal = tmp_path / "journal.jsonl"
+    queue = WriteBehindQueue(lambda batch: None, journal, max_pending=2)
+    # Not started: nothing is written, so the queue fills up
+    assert queue.put(_record(1)) and queue.put(_record(2))
+    assert not queue.put(_record(3))
+    assert [r["id"] for r in queue.pending()] == ["r1", "r2"]
+    assert queue.stats()["rejected"] == 1
+    # put does no journal I/O; the writer thread journals
+    assert not journal.exists()
+
+    queue.start()
+    assert queue.flush(timeout=5)
+    queue.close()
+    assert queue.pending() == []